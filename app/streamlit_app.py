@@ -3,10 +3,14 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.document_loader import load_and_chunk
 from src.embeddings import load_embedding_model
-from src.vector_store import add_documents, clear_vector_store
-from src.rag_chain import ask_V2
+from src.ingest_pipeline import ingest, CHUNK_TOKENIZER, CHUNK_TOKENS, CHUNK_TOKEN_OVERLAP
+from src.vector_store import clear_vector_store
+from src.rag_chain import RAGEngine
+from src.answer_cache import SemanticAnswerCache
+from src.context_packing import CONTEXT_TOKEN_BUDGET
+from src import tracing
+from src.startup import warm_up, WARMUP
 import tempfile
 
 st.set_page_config(
@@ -220,6 +224,33 @@ if "loaded_docs" not in st.session_state:
 def get_embedding_model():
     return load_embedding_model()
 
+@st.cache_resource
+def get_answer_cache():
+    return SemanticAnswerCache(get_embedding_model(), threshold=0.92, ttl_seconds=3600, max_entries=500)
+
+@st.cache_resource
+def get_trace_histogram():
+    # Per-stage latencies for the debug panel. RAG_TRACE adds a second sink,
+    # e.g. "jsonl:traces.jsonl" or "prometheus:metrics.prom"; both record
+    # from startup, whether or not the panel is open
+    spec = os.getenv("RAG_TRACE")
+    if spec:
+        tracing.add_sink(tracing.sink_from_spec(spec))
+    return tracing.add_sink(tracing.HistogramSink())
+
+@st.cache_resource
+def get_engine():
+    return RAGEngine(embedding_model=get_embedding_model(), k=4, prompt_version="v2", answer_cache=get_answer_cache(), context_budget=CONTEXT_TOKEN_BUDGET)
+
+@st.cache_resource
+def start_warm_up():
+    # Heavy imports and the embedding model load in the background while the
+    # empty page renders, instead of on the first question
+    return warm_up(get_embedding_model()) if WARMUP else None
+
+start_warm_up()
+get_trace_histogram()
+
 # Sidebar
 with st.sidebar:
     st.markdown('<p class="sidebar-title">Study Assistant</p>', unsafe_allow_html=True)
@@ -259,13 +290,14 @@ with st.sidebar:
 
         if sources:
             with st.spinner("processing..."):
+                ingest(
+                    sources,
+                    embedding_model=embedding_model,
+                    chunk_size=CHUNK_TOKENS,
+                    chunk_overlap=CHUNK_TOKEN_OVERLAP,
+                    tokenizer=CHUNK_TOKENIZER
+                )
                 for source in sources:
-                    chunks = load_and_chunk(
-                        [{"type": source["type"], "path": source["path"]}],
-                        chunk_size=500,
-                        chunk_overlap=50
-                    )
-                    add_documents(chunks, get_embedding_model())
                     if source["name"] not in st.session_state.loaded_docs:
                         st.session_state.loaded_docs.append(source["name"])
             st.success(f"{len(sources)} source(s) loaded")
@@ -279,9 +311,31 @@ with st.sidebar:
             name = doc if len(doc) < 30 else doc[:27] + "..."
             st.markdown(f'<span class="doc-pill">{name}</span>', unsafe_allow_html=True)
 
+    cache_stats = get_answer_cache().stats()
+    if cache_stats["hits"] + cache_stats["misses"]:
+        st.divider()
+        st.markdown('<p class="section-label">Answer cache</p>', unsafe_allow_html=True)
+        st.markdown(
+            f'<p class="sidebar-subtitle">{cache_stats["hits"]} hits · '
+            f'{cache_stats["hit_rate"]:.0%} hit rate · {cache_stats["saved_seconds"]:.1f}s saved</p>',
+            unsafe_allow_html=True
+        )
+
+    st.divider()
+    debug = st.checkbox("debug trace", value=False)
+    if debug:
+        stage_stats = get_trace_histogram().summary()
+        if stage_stats:
+            st.markdown('<p class="section-label">Stage latency</p>', unsafe_allow_html=True)
+            st.table([
+                {"stage": name, "n": stats["count"], "p50 ms": round(stats["p50_ms"], 1), "p95 ms": round(stats["p95_ms"], 1)}
+                for name, stats in stage_stats.items()
+            ])
+
     st.divider()
     if st.button("Clear Session", use_container_width=True):
         clear_vector_store()
+        get_engine.clear()
         st.session_state.messages = []
         st.session_state.loaded_docs = []
         st.rerun()
@@ -289,6 +343,36 @@ with st.sidebar:
 # Main area
 col1, col2, col3 = st.columns([1, 6, 1])
 
+def render_user(content, target=st):
+    target.markdown(f"""
+    <div class="user-bubble">
+        <div class="user-label">you</div>
+        {content}
+    </div>
+    """, unsafe_allow_html=True)
+
+def render_assistant(content, target=st):
+    target.markdown(f"""
+    <div class="assistant-bubble">
+        <div class="assistant-label">assistant</div>
+        {content}
+    </div>
+    """, unsafe_allow_html=True)
+
+def render_sources(sources, target=st):
+    if sources:
+        sources_str = " · ".join([f"<span>{s}</span>" for s in sources])
+        target.markdown(f'<div class="source-block">sources — {sources_str}</div>', unsafe_allow_html=True)
+
+def render_trace(spans):
+    if debug and spans:
+        with st.expander("trace"):
+            st.table([
+                {"stage": span["name"], "ms": round(span["duration_ms"], 1),
+                 **{key: value for key, value in span.items() if key not in ("name", "duration_ms", "timestamp")}}
+                for span in spans
+            ])
+
 with col2:
     if not st.session_state.loaded_docs:
         st.markdown("""
@@ -299,41 +383,38 @@ with col2:
     else:
         for message in st.session_state.messages:
             if message["role"] == "user":
-                st.markdown(f"""
-                <div class="user-bubble">
-                    <div class="user-label">you</div>
-                    {message["content"]}
-                </div>
-                """, unsafe_allow_html=True)
+                render_user(message["content"])
             else:
-                st.markdown(f"""
-                <div class="assistant-bubble">
-                    <div class="assistant-label">assistant</div>
-                    {message["content"]}
-                </div>
-                """, unsafe_allow_html=True)
-                if message.get("sources"):
-                    sources_str = " · ".join([f"<span>{s}</span>" for s in message["sources"]])
-                    st.markdown(f'<div class="source-block">sources — {sources_str}</div>', unsafe_allow_html=True)
+                render_assistant(message["content"])
+                render_sources(message.get("sources"))
+                render_trace(message.get("trace"))
 
         question = st.chat_input("ask something...")
 
         if question:
             st.session_state.messages.append({"role": "user", "content": question})
+            render_user(question)
+
+            with tracing.trace() as request_trace:
+                with st.spinner(""):
+                    stream = get_engine().stream(question)
+
+                # Sources are known once retrieval is done, before the first token
+                answer_slot = st.empty()
+                render_sources(stream.sources)
 
-            with st.spinner(""):
-                from src.vector_store import similarity_search
-                answer = ask_V2(question, embedding_model=get_embedding_model(), k=4)
-                retrieved_docs = similarity_search(question, k=4, embedding_model=get_embedding_model())
-                sources = list(set([
-                    doc.metadata.get("file_name") or doc.metadata.get("source", "unknown")
-                    for doc in retrieved_docs
-                ]))
+                answer = ""
+                for token in stream:
+                    answer += token
+                    render_assistant(answer + "▌", target=answer_slot)
+                render_assistant(answer, target=answer_slot)
 
             st.session_state.messages.append({
                 "role": "assistant",
-                "content": answer,
-                "sources": sources
+                "content": stream.result.answer,
+                "sources": stream.result.sources,
+                "timings": stream.result.timings,
+                "trace": request_trace.spans
             })
 
-            st.rerun()
\ No newline at end of file
+            st.rerun()
@@ -0,0 +1,270 @@
+import hashlib
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import time
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class HashingEmbeddings(Embeddings):
+    """Fast, dependency-free stand-in for MiniLM in offline benchmarks.
+
+    Distinct tokens are hashed into a fixed number of signed buckets and the
+    vector is L2-normalized, so cosine similarity tracks lexical overlap. It keeps large
+    synthetic corpora cheap to embed while still giving retrieval something
+    meaningful to rank.
+    """
+
+    def __init__(self, size = 384):
+        self.size = size
+
+    def _embed(self, text):
+        vector = np.zeros(self.size, dtype=np.float32)
+        for token in set(TOKEN_PATTERN.findall(text.lower())):
+            digest = int(hashlib.md5(token.encode("utf-8")).hexdigest()[:8], 16)
+            vector[digest % self.size] += 1.0 if (digest >> 31) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class RandomMiniLM(Embeddings):
+    """A transformer with MiniLM-L6's shape and random weights.
+
+    The real model cannot be downloaded offline, but its cost can be
+    reproduced: words are hashed into the same 30522-id vocabulary, padded
+    per batch and truncated at 256 tokens, then mean-pooled and normalized.
+    The vectors carry no meaning; use it for timing, not retrieval quality.
+    """
+
+    def __init__(self, max_length = 256, seed = 0):
+        import torch
+        from transformers import BertConfig, BertModel
+        torch.manual_seed(seed)
+        config = BertConfig(vocab_size=30522, hidden_size=384, num_hidden_layers=6, num_attention_heads=12,
+                            intermediate_size=1536, max_position_embeddings=512)
+        self.model = BertModel(config).eval()
+        self.max_length = max_length
+
+    def tokenize(self, texts):
+        import torch
+        rows = []
+        for text in texts:
+            ids = [int(hashlib.md5(token.encode("utf-8")).hexdigest()[:8], 16) % 29000 + 1000
+                   for token in TOKEN_PATTERN.findall(text.lower())]
+            rows.append([101] + ids[:self.max_length - 2] + [102])
+        width = max(len(row) for row in rows)
+        input_ids = torch.zeros((len(rows), width), dtype=torch.long)
+        attention_mask = torch.zeros((len(rows), width), dtype=torch.long)
+        for i, row in enumerate(rows):
+            input_ids[i, :len(row)] = torch.tensor(row)
+            attention_mask[i, :len(row)] = 1
+        return {"input_ids": input_ids, "attention_mask": attention_mask}
+
+    def embed_documents(self, texts):
+        import torch
+        if not texts:
+            return []
+        inputs = self.tokenize(texts)
+        with torch.inference_mode():
+            hidden = self.model(**inputs).last_hidden_state
+        mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+        pooled = (hidden * mask).sum(1) / mask.sum(1).clamp(min=1e-9)
+        return torch.nn.functional.normalize(pooled, dim=1).tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def save_random_minilm(directory, hidden_size = 384, layers = 6, words = 20000, seed = 0):
+    """Saves a MiniLM-shaped BERT with random weights and a made-up WordPiece
+    vocabulary, loadable by name like the real model, for offline runs of
+    the embedding backends."""
+    import torch
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+    os.makedirs(directory, exist_ok=True)
+    specials = ["[PAD]"] + [f"[unused{i}]" for i in range(99)] + ["[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+    letters = [chr(c) for c in range(ord("a"), ord("z") + 1)] + [str(d) for d in range(10)]
+    vocabulary = specials + letters + ["##" + letter for letter in letters] + make_vocabulary(words, seed)
+    vocab_path = os.path.join(directory, "vocab.txt")
+    with open(vocab_path, "w") as f:
+        f.write("\n".join(dict.fromkeys(vocabulary)))
+    BertTokenizerFast(vocab_file=vocab_path, model_max_length=256).save_pretrained(directory)
+    torch.manual_seed(seed)
+    config = BertConfig(vocab_size=len(dict.fromkeys(vocabulary)), hidden_size=hidden_size, num_hidden_layers=layers,
+                        num_attention_heads=max(1, hidden_size // 32), intermediate_size=4 * hidden_size)
+    BertModel(config).save_pretrained(directory)
+    return directory
+
+
+def make_vocabulary(size, seed = 0):
+    rng = random.Random(seed)
+    syllables = ["ka", "lo", "mi", "ren", "to", "sa", "vu", "dex", "phi", "nor", "qua", "zel", "bri", "om", "tal", "gy"]
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+def make_corpus(n_chunks, words_per_chunk = 60, vocabulary_size = 20000, seed = 0):
+    """Synthetic chunks whose word frequencies follow a Zipf-like curve.
+
+    Each chunk also carries three key terms drawn from a rarer tail of the
+    vocabulary, which labelled queries are built from.
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(make_vocabulary(vocabulary_size, seed))
+    common = vocabulary[: vocabulary_size // 2]
+    rare = vocabulary[vocabulary_size // 2:]
+
+    ranks = np.arange(1, len(common) + 1)
+    weights = 1.0 / ranks
+    weights /= weights.sum()
+
+    chunks = []
+    for i in range(n_chunks):
+        body = rng.choice(common, size=words_per_chunk, p=weights)
+        key_terms = rng.choice(rare, size=3, replace=False)
+        positions = rng.choice(words_per_chunk, size=3, replace=False)
+        body[positions] = key_terms
+        chunks.append(Document(
+            page_content=" ".join(body),
+            metadata={"file_name": f"synthetic_{i // 100}.txt", "chunk_id": i, "key_terms": " ".join(key_terms)}
+        ))
+    return chunks
+
+def make_queries(chunks, n_queries, noise_words = 2, seed = 1):
+    rng = np.random.default_rng(seed)
+    targets = rng.choice(len(chunks), size=min(n_queries, len(chunks)), replace=False)
+    queries = []
+    for target in targets:
+        chunk = chunks[int(target)]
+        key_terms = chunk.metadata["key_terms"].split()
+        noise = rng.choice(chunk.page_content.split(), size=noise_words).tolist()
+        words = key_terms + noise
+        rng.shuffle(words)
+        queries.append({"query": " ".join(words), "relevant": {chunk.metadata["chunk_id"]}})
+    return queries
+
+def clustered_vectors(n, dim, rng, n_clusters = 200, spread = 0.6, block = 50000):
+    """Unit vectors scattered around random centres, yielded in blocks.
+
+    Sentence embeddings are dense and clustered by topic, which random
+    Gaussian vectors are not; this is a cheap offline stand-in.
+    """
+    centres = rng.normal(size=(n_clusters, dim)).astype(np.float32)
+    for start in range(0, n, block):
+        size = min(block, n - start)
+        vectors = centres[rng.integers(n_clusters, size=size)] + spread * rng.normal(size=(size, dim)).astype(np.float32)
+        yield vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def recall_and_mrr(retrieved_ids, relevant, k):
+    top = retrieved_ids[:k]
+    recall = len(relevant.intersection(top)) / len(relevant)
+    reciprocal_rank = 0.0
+    for rank, chunk_id in enumerate(top, start=1):
+        if chunk_id in relevant:
+            reciprocal_rank = 1.0 / rank
+            break
+    return recall, reciprocal_rank
+
+def latency_percentiles(seconds):
+    ms = np.array(seconds) * 1000
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+    }
+
+def current_rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        # ru_maxrss is the peak, in KB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if platform.system() == "Darwin" else peak * 1024
+
+def peak_rss_bytes():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if platform.system() == "Darwin" else peak * 1024
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def write_results(path, benchmark, results, params):
+    payload = {
+        "benchmark": benchmark,
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "params": params,
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(payload, f, indent=2)
+    print(f"\nResults saved to {path}")
+    return payload
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_pdf(path, pages, font_size = 10):
+    """Writes a minimal text-only PDF, one list of lines per page.
+
+    Good enough for PyPDFLoader to extract the text back, which is all the
+    ingestion benchmark needs, and avoids a PDF library dependency.
+    """
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for lines in pages:
+        text = [f"BT /F1 {font_size} Tf {font_size + 2} TL 40 800 Td"]
+        text.extend(f"({_pdf_escape(line)}) Tj T*" for line in lines)
+        text.append("ET")
+        stream = "\n".join(text).encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(None)
+        page_ids.append(len(objects))
+        objects[-1] = (b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects) - 1))
+    kids = " ".join(f"{i} 0 R" for i in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_ids)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
@@ -0,0 +1,167 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from evaluation.bench_utils import HashingEmbeddings, clustered_vectors, latency_percentiles, write_results
+from src import vector_store as vs
+from src.ann import search_params
+from src.flat_store import FlatCollection, probe
+
+DEFAULT_HNSW = [(16, 100), (32, 200)]
+DEFAULT_EF_SEARCH = [10, 20, 50, 100, 200]
+DEFAULT_NPROBE = [1, 2, 4, 8, 16, 32, 64]
+
+def exact_top_k(vectors, queries, k):
+    sq_norms = np.einsum("ij,ij->i", vectors, vectors)
+    dist = sq_norms[None, :] - 2 * (queries @ vectors.T)
+    return [set(row.tolist()) for row in np.argpartition(dist, k - 1, axis=1)[:, :k]]
+
+def measure(search, queries, truth, k):
+    search(queries[0])  # warm-up
+    latencies = []
+    recalls = []
+    wall_start = time.perf_counter()
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        found = search(query)
+        latencies.append(time.perf_counter() - start)
+        recalls.append(len(set(found) & expected) / k)
+    wall = time.perf_counter() - wall_start
+    return {f"recall@{k}": float(np.mean(recalls)), "qps": len(queries) / wall, **latency_percentiles(latencies)}
+
+def sweep_hnsw(vectors, queries, truth, k, configs, ef_values):
+    points = []
+    ids = [str(i) for i in range(len(vectors))]
+    for M, construction_ef in configs:
+        store = vs.get_vector_store(HashingEmbeddings(vectors.shape[1]), collection_name=f"ann_m{M}_ef{construction_ef}",
+                                    backend="chroma", hnsw={"M": M, "construction_ef": construction_ef})
+        start = time.perf_counter()
+        for i in range(0, len(vectors), 5000):
+            store._collection.add(ids=ids[i:i + 5000], embeddings=vectors[i:i + 5000].tolist())
+        build_seconds = time.perf_counter() - start
+        print(f"HNSW M={M} ef_construction={construction_ef}: built in {build_seconds:.1f}s")
+
+        for ef in ef_values:
+            def search(query):
+                with search_params(store, ef_search=ef):
+                    result = store._collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])
+                return [int(i) for i in result["ids"][0]]
+            stats = measure(search, queries, truth, k)
+            points.append({"index": "hnsw", "M": M, "construction_ef": construction_ef, "ef_search": ef, "build_seconds": build_seconds, **stats})
+    return points
+
+def sweep_ivf(vectors, queries, truth, k, nlists, nprobes, path):
+    collection = FlatCollection(path)
+    for i in range(0, len(vectors), 50000):
+        collection.upsert([str(j) for j in range(i, min(i + 50000, len(vectors)))], vectors[i:i + 50000])
+
+    def search(query):
+        return collection.top_k(query, k)[0][0].tolist()
+
+    points = [{"index": "flat", **measure(search, queries, truth, k)}]
+    for nlist in nlists:
+        start = time.perf_counter()
+        collection.build_ivf(nlist)
+        build_seconds = time.perf_counter() - start
+        print(f"IVF nlist={nlist}: built in {build_seconds:.1f}s")
+        for nprobe in [p for p in nprobes if p < nlist]:
+            def probed(query):
+                with probe(nprobe):
+                    return search(query)
+            stats = measure(probed, queries, truth, k)
+            points.append({"index": "ivf", "nlist": nlist, "nprobe": nprobe, "build_seconds": build_seconds, **stats})
+    return points
+
+def label(point):
+    if point["index"] == "hnsw":
+        return f"hnsw M={point['M']} efc={point['construction_ef']} ef={point['ef_search']}"
+    if point["index"] == "ivf":
+        return f"ivf nlist={point['nlist']} nprobe={point['nprobe']}"
+    return "flat exact"
+
+def plot(points, k, path):
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("matplotlib is not installed, skipping the plot")
+        return
+
+    fig, ax = plt.subplots(figsize=(7, 5))
+    groups = {}
+    for point in points:
+        if point["index"] == "hnsw":
+            key = f"HNSW M={point['M']} efc={point['construction_ef']}"
+        elif point["index"] == "ivf":
+            key = f"IVF nlist={point['nlist']}"
+        else:
+            key = "flat exact"
+        groups.setdefault(key, []).append(point)
+    for key, group in groups.items():
+        ax.plot([p["p50_ms"] for p in group], [p[f"recall@{k}"] for p in group], marker="o", label=key)
+    ax.set_xlabel("p50 latency (ms)")
+    ax.set_ylabel(f"recall@{k}")
+    ax.set_xscale("log")
+    ax.grid(alpha=0.3)
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(path, dpi=120)
+    print(f"Plot saved to {path}")
+
+def run_benchmark(n = 50000, dim = 384, n_queries = 200, k = 10, hnsw_configs = DEFAULT_HNSW, ef_values = DEFAULT_EF_SEARCH,
+                  nlists = None, nprobes = DEFAULT_NPROBE, seed = 0, output_path = "evaluation/benchmark_ann.json", plot_path = None):
+    rng = np.random.default_rng(seed)
+    vectors = np.concatenate(list(clustered_vectors(n, dim, rng)))
+    queries = vectors[rng.choice(n, size=n_queries, replace=False)] + 0.3 * rng.normal(size=(n_queries, dim)).astype(np.float32) / np.sqrt(dim)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    truth = exact_top_k(vectors, queries, k)
+    if nlists is None:
+        nlists = [int(4 * np.sqrt(n))]
+
+    output_path = os.path.abspath(output_path)
+    previous_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            vs.clear_vector_store()
+            points = sweep_hnsw(vectors, queries, truth, k, hnsw_configs, ef_values)
+            points += sweep_ivf(vectors, queries, truth, k, nlists, nprobes, os.path.join(workdir, "ivf"))
+            vs.clear_vector_store()
+        finally:
+            os.chdir(previous_dir)
+
+    print(f"\n{'config':<40} {'recall@' + str(k):>9} {'p50':>8} {'p95':>8} {'qps':>8}")
+    for point in points:
+        print(f"{label(point):<40} {point[f'recall@{k}']:>9.3f} {point['p50_ms']:>6.2f}ms {point['p95_ms']:>6.2f}ms {point['qps']:>8.0f}")
+
+    if plot_path:
+        plot(points, k, plot_path)
+    params = {"vectors": n, "dim": dim, "queries": n_queries, "k": k, "hnsw": [list(c) for c in hnsw_configs],
+              "ef_search": list(ef_values), "nlist": list(nlists), "nprobe": list(nprobes), "seed": seed}
+    return write_results(output_path, "ann", points, params)
+
+def parse_hnsw(value):
+    M, construction_ef = value.split(",")
+    return int(M), int(construction_ef)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall vs latency sweep for HNSW (Chroma) and IVF (flat store) settings")
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--hnsw", type=parse_hnsw, nargs="+", default=DEFAULT_HNSW, help="M,ef_construction pairs, e.g. 16,100 32,200")
+    parser.add_argument("--ef-search", type=int, nargs="+", default=DEFAULT_EF_SEARCH)
+    parser.add_argument("--nlist", type=int, nargs="+", default=None, help="IVF list counts, default 4*sqrt(vectors)")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=DEFAULT_NPROBE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="evaluation/benchmark_ann.json")
+    parser.add_argument("--plot", default=None, help="save a recall vs latency plot (needs matplotlib)")
+    args = parser.parse_args()
+
+    run_benchmark(args.vectors, args.dim, args.queries, args.k, args.hnsw, args.ef_search, args.nlist, args.nprobe, args.seed, args.output, args.plot)
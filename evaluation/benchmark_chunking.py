@@ -0,0 +1,115 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from evaluation.bench_utils import make_vocabulary, write_results
+from evaluation.benchmark_ingest import make_lines, LINES_PER_PAGE
+from src.document_loader import chunk_documents, token_counter
+
+DEFAULT_SIZES_MB = [1, 10]
+# Which splitter each offset chunker is compared against
+BASELINES = {"offsets": "recursive", "offsets_tokens": "recursive_tokens"}
+
+def make_documents(n_bytes, layout, seed = 0):
+    """"pages" mimics PDF text (short lines, one document per page),
+    "paragraphs" a text file with blank lines between paragraphs."""
+    rng = np.random.default_rng(seed)
+    lines = make_lines(n_bytes, rng, np.array(make_vocabulary(5000, seed)))
+    if layout == "pages":
+        return [
+            Document(page_content="\n".join(lines[i:i + LINES_PER_PAGE]), metadata={"file_name": "bench.pdf", "page": i // LINES_PER_PAGE})
+            for i in range(0, len(lines), LINES_PER_PAGE)
+        ]
+    paragraphs = [" ".join(lines[i:i + 8]) for i in range(0, len(lines), 8)]
+    return [Document(page_content="\n\n".join(paragraphs), metadata={"file_name": "bench.txt"})]
+
+def load_token_counter(name):
+    # Falls back to an estimate when the tokenizer cannot be downloaded
+    try:
+        return token_counter(name), name
+    except Exception as error:
+        print(f"Could not load tokenizer {name} ({type(error).__name__}), using a length estimate")
+        return (lambda word: (len(word) + 3) // 4), "estimate"
+
+def splitters(chunk_size, chunk_overlap, token_size, token_overlap, count):
+    def words_to_tokens(text):
+        return sum(count(word) for word in text.split())
+
+    return {
+        "recursive": lambda docs: RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, length_function=len).split_documents(docs),
+        "recursive_start_index": lambda docs: RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, length_function=len, add_start_index=True).split_documents(docs),
+        "offsets": lambda docs: chunk_documents(docs, chunk_size=chunk_size, chunk_overlap=chunk_overlap),
+        # Token-sized: the recursive splitter re-counts every candidate chunk,
+        # the offset chunker sums cached per-word counts
+        "recursive_tokens": lambda docs: RecursiveCharacterTextSplitter(
+            chunk_size=token_size, chunk_overlap=token_overlap, length_function=words_to_tokens).split_documents(docs),
+        "offsets_tokens": lambda docs: chunk_documents(docs, chunk_size=token_size, chunk_overlap=token_overlap, tokenizer=count),
+    }
+
+def time_splitter(split, docs, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        chunks = split(docs)
+        times.append(time.perf_counter() - start)
+    return chunks, min(times)
+
+def run_benchmark(sizes_mb = DEFAULT_SIZES_MB, layouts = ("pages", "paragraphs"), chunk_size = 500, chunk_overlap = 50,
+                  token_size = 128, token_overlap = 16, tokenizer = "sentence-transformers/all-MiniLM-L6-v2", repeats = 3,
+                  seed = 0, output_path = "evaluation/benchmark_chunking.json"):
+    count, tokenizer_used = load_token_counter(tokenizer)
+    results = []
+    for size_mb in sizes_mb:
+        for layout in layouts:
+            docs = make_documents(int(size_mb * 1024 * 1024), layout, seed)
+            n_chars = sum(len(doc.page_content) for doc in docs)
+            timings = {}
+            for name, split in splitters(chunk_size, chunk_overlap, token_size, token_overlap, count).items():
+                chunks, seconds = time_splitter(split, docs, repeats)
+                tokens = [sum(count(word) for word in chunk.page_content.split()) for chunk in chunks]
+                row = {
+                    "size_mb": size_mb,
+                    "layout": layout,
+                    "splitter": name,
+                    "seconds": seconds,
+                    "mb_per_s": n_chars / 1e6 / seconds,
+                    "chunks": len(chunks),
+                    "mean_chars": float(np.mean([len(chunk.page_content) for chunk in chunks])),
+                    "max_chars": max(len(chunk.page_content) for chunk in chunks),
+                    "mean_tokens": float(np.mean(tokens)),
+                    "max_tokens": int(max(tokens)),
+                }
+                timings[name] = seconds
+                row["speedup"] = timings[BASELINES[name]] / seconds if name in BASELINES else None
+                results.append(row)
+                speedup = f"{row['speedup']:.1f}x" if row["speedup"] else "-"
+                print(f"{size_mb:>5}MB {layout:<10} {name:<22} {seconds:>8.3f}s {row['mb_per_s']:>7.2f} MB/s {len(chunks):>7} chunks "
+                      f"mean {row['mean_chars']:>5.0f} chars / {row['mean_tokens']:>4.0f} tokens (max {row['max_tokens']})  speedup {speedup}")
+
+    params = {"sizes_mb": list(sizes_mb), "layouts": list(layouts), "chunk_size": chunk_size, "chunk_overlap": chunk_overlap,
+              "token_size": token_size, "token_overlap": token_overlap, "tokenizer": tokenizer_used, "repeats": repeats, "seed": seed}
+    return write_results(os.path.abspath(output_path), "chunking", results, params)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chunking throughput: RecursiveCharacterTextSplitter vs the offset chunker")
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=DEFAULT_SIZES_MB)
+    parser.add_argument("--layouts", nargs="+", default=["pages", "paragraphs"], choices=["pages", "paragraphs"])
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--token-size", type=int, default=128)
+    parser.add_argument("--token-overlap", type=int, default=16)
+    parser.add_argument("--tokenizer", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="evaluation/benchmark_chunking.json")
+    args = parser.parse_args()
+
+    run_benchmark(args.sizes_mb, args.layouts, args.chunk_size, args.chunk_overlap, args.token_size, args.token_overlap,
+                  args.tokenizer, args.repeats, args.seed, args.output)
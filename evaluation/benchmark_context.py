@@ -0,0 +1,131 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+from evaluation.bench_utils import HashingEmbeddings, make_vocabulary, latency_percentiles, write_results
+from src import vector_store as vs
+from src.document_loader import chunk_documents
+from src.context_packing import pack_context, estimate_tokens
+from src.rag_chain import format_docs
+
+DEFAULT_BUDGETS = [None, 1500, 750]
+
+def make_documents(n_docs, words_per_doc, topic_words = 300, boilerplate_every = 3, seed = 0):
+    """Documents that each draw from their own topic vocabulary, so a query
+    about one passage also pulls in its neighbours. Every boilerplate_every-th
+    document repeats a shared paragraph, like a licence or course header."""
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(make_vocabulary(n_docs * topic_words, seed))
+    boilerplate = " ".join(rng.choice(vocabulary, size=80))
+    documents = []
+    for i in range(n_docs):
+        topic = vocabulary[i * topic_words:(i + 1) * topic_words]
+        words = rng.choice(topic, size=words_per_doc).tolist()
+        sentences = [" ".join(words[j:j + 15]) + "." for j in range(0, len(words), 15)]
+        paragraphs = [" ".join(sentences[j:j + 6]) for j in range(0, len(sentences), 6)]
+        if boilerplate_every and i % boilerplate_every == 0:
+            paragraphs.insert(len(paragraphs) // 2, boilerplate)
+        documents.append(Document(page_content="\n\n".join(paragraphs), metadata={"file_name": f"doc_{i}.txt"}))
+    return documents
+
+def make_queries(documents, n_queries, window = 12, seed = 1):
+    # A query is a window of words from one document; the answer is
+    # covered if that window still appears in the context
+    rng = np.random.default_rng(seed)
+    queries = []
+    for _ in range(n_queries):
+        words = documents[int(rng.integers(len(documents)))].page_content.split()
+        start = int(rng.integers(len(words) - window))
+        queries.append(" ".join(words[start:start + window]))
+    return queries
+
+def covered(query, docs):
+    text = " ".join(" ".join(doc.page_content.split()) for doc in docs)
+    return query in text
+
+def retrieve(store, query, k, mode):
+    if mode == "similarity":
+        return vs.similarity_search(query, k=k, vector_store=store)
+    return [doc for doc, _ in vs.mmr_search_with_scores(query, k=k, fetch_k=k * 3, vector_store=store)]
+
+def run_benchmark(n_docs = 30, words_per_doc = 3000, n_queries = 100, ks = (4, 8), budgets = DEFAULT_BUDGETS, modes = ("similarity", "mmr"),
+                  chunk_size = 500, chunk_overlap = 50, seed = 0, output_path = "evaluation/benchmark_context.json"):
+    documents = make_documents(n_docs, words_per_doc, seed=seed)
+    chunks = chunk_documents(documents, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    queries = make_queries(documents, n_queries, seed=seed + 1)
+
+    results = []
+    output_path = os.path.abspath(output_path)
+    previous_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            vs.clear_vector_store()
+            store = vs.add_documents(chunks, HashingEmbeddings(), backend="flat")
+            for mode in modes:
+                for k in ks:
+                    retrieved = [retrieve(store, query, k, mode) for query in queries]
+                    baseline = [estimate_tokens(format_docs(docs)) for docs in retrieved]
+                    baseline_covered = np.mean([covered(q, docs) for q, docs in zip(queries, retrieved)])
+                    for budget in budgets:
+                        packed, latencies = [], []
+                        for docs in retrieved:
+                            start = time.perf_counter()
+                            packed.append(pack_context(docs, token_budget=budget or float("inf")))
+                            latencies.append(time.perf_counter() - start)
+                        tokens = [estimate_tokens(format_docs(p.docs)) for p in packed]
+                        saved = np.array(baseline) - np.array(tokens)
+                        row = {
+                            "mode": mode,
+                            "k": k,
+                            "budget": budget,
+                            "baseline_tokens": float(np.mean(baseline)),
+                            "packed_tokens": float(np.mean(tokens)),
+                            "tokens_saved": float(saved.mean()),
+                            "saved_pct": float(100 * saved.sum() / max(sum(baseline), 1)),
+                            "per_query_saved": saved.tolist(),
+                            "merged_chunks": float(np.mean([p.merged for p in packed])),
+                            "duplicates_dropped": float(np.mean([p.duplicates for p in packed])),
+                            "over_budget_dropped": float(np.mean([p.over_budget for p in packed])),
+                            "baseline_coverage": float(baseline_covered),
+                            "packed_coverage": float(np.mean([covered(q, p.docs) for q, p in zip(queries, packed)])),
+                            "pack": latency_percentiles(latencies),
+                        }
+                        results.append(row)
+            vs.clear_vector_store()
+        finally:
+            os.chdir(previous_dir)
+
+    print(f"\n{'mode':<11} {'k':>2} {'budget':>7} {'format_docs':>12} {'packed':>8} {'saved':>7} {'merged':>7} {'dupes':>6} {'coverage':>15} {'pack p50':>9}")
+    for row in results:
+        coverage = f"{row['baseline_coverage']:.2f} -> {row['packed_coverage']:.2f}"
+        print(f"{row['mode']:<11} {row['k']:>2} {str(row['budget'] or '-'):>7} {row['baseline_tokens']:>12.0f} {row['packed_tokens']:>8.0f} "
+              f"{row['saved_pct']:>6.1f}% {row['merged_chunks']:>7.2f} {row['duplicates_dropped']:>6.2f} {coverage:>15} {row['pack']['p50_ms']:>7.3f}ms")
+
+    params = {"documents": n_docs, "words_per_doc": words_per_doc, "chunks": len(chunks), "queries": n_queries, "k": list(ks),
+              "budgets": list(budgets), "modes": list(modes), "chunk_size": chunk_size, "chunk_overlap": chunk_overlap, "seed": seed}
+    return write_results(output_path, "context_packing", results, params)
+
+def parse_budget(value):
+    return None if value in ("none", "0") else int(value)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Context tokens per query: format_docs vs merged, deduplicated, budgeted packing")
+    parser.add_argument("--documents", type=int, default=30)
+    parser.add_argument("--words", type=int, default=3000, help="words per document")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, nargs="+", default=[4, 8])
+    parser.add_argument("--budgets", type=parse_budget, nargs="+", default=DEFAULT_BUDGETS, help="token budgets, 'none' for unlimited")
+    parser.add_argument("--modes", nargs="+", default=["similarity", "mmr"], choices=["similarity", "mmr"])
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="evaluation/benchmark_context.json")
+    args = parser.parse_args()
+
+    run_benchmark(args.documents, args.words, args.queries, args.k, args.budgets, args.modes, args.chunk_size, args.chunk_overlap, args.seed, args.output)
@@ -0,0 +1,100 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from evaluation.bench_utils import make_corpus, save_random_minilm, write_results
+from src.embedding_backends import BACKENDS, OnnxEmbeddings, cosine_parity, export_dir, length_batches, load_backend, load_onnx
+from src.embeddings import ENCODE_KWARGS, MODEL_KWARGS, MODEL_NAME
+
+def make_texts(n, seed = 0):
+    # Chunk-like texts of mixed length, as ingestion produces
+    rng = random.Random(seed)
+    return [" ".join(doc.page_content.split()[:rng.randint(10, 120)]) for doc in make_corpus(n, words_per_chunk=120, seed=seed)]
+
+def throughput(model, texts, call_size, repeats):
+    # Texts are sent in calls of call_size, like the ingest pipeline's batches
+    model.embed_documents(texts[:call_size])  # warm-up
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for i in range(0, len(texts), call_size):
+            model.embed_documents(texts[i:i + call_size])
+        best = min(best, time.perf_counter() - start)
+    return len(texts) / best
+
+def padding_waste(model, texts, batch_size, sort):
+    # Share of the tokens run through the model that are padding
+    lengths = [len(encoding.ids) for encoding in model.tokenizer.encode_batch(texts)]
+    padded = sum(len(batch) * max(lengths[i] for i in batch) for batch in length_batches(lengths, batch_size, sort))
+    return 1 - sum(lengths) / padded
+
+def run_benchmark(model = "random", backends = BACKENDS, threads = (1,), batch_sizes = (16, 32, 64), n_texts = 512, call_size = 256,
+                  repeats = 3, output_path = "evaluation/benchmark_embedding_backends.json"):
+    workdir = tempfile.mkdtemp()
+    # The real model cannot be downloaded offline; "random" has its architecture and cost
+    model_name = MODEL_NAME if model == "minilm" else save_random_minilm(os.path.join(workdir, "random-minilm"))
+    cache_path = os.path.join(workdir, "onnx")
+    texts = make_texts(n_texts)
+
+    def load(backend, n_threads, batch_size):
+        return load_backend(backend, model_name, MODEL_KWARGS, ENCODE_KWARGS, batch_size, n_threads, cache_path)
+
+    reference = load("torch", max(threads), 32)
+    results = {"backends": [], "bucketing": []}
+    for backend in backends:
+        start = time.perf_counter()
+        embeddings = load(backend, threads[0], batch_sizes[0])
+        load_ms = 1000 * (time.perf_counter() - start)  # includes the one-off export/quantization
+        parity = cosine_parity(reference, embeddings, texts[:128])
+        for n_threads in threads:
+            for batch_size in batch_sizes:
+                embeddings = load(backend, n_threads, batch_size)
+                row = {"backend": backend, "threads": n_threads, "batch_size": batch_size,
+                       "texts_per_s": throughput(embeddings, texts, call_size, repeats), "first_load_ms": load_ms, **parity}
+                results["backends"].append(row)
+
+    # Length bucketing on its own: the same ONNX graph with and without sorting
+    onnx = load_onnx(model_name, batch_size=32, threads=max(threads), normalize=True, cache_path=cache_path)
+    directory = export_dir(model_name, cache_path)
+    for sort in (False, True):
+        embeddings = OnnxEmbeddings(os.path.join(directory, "model.onnx"), os.path.join(directory, "tokenizer.json"),
+                                    batch_size=32, threads=max(threads), sort_by_length=sort)
+        results["bucketing"].append({"sorted": sort, "padding_share": padding_waste(onnx, texts, 32, sort),
+                                     "texts_per_s": throughput(embeddings, texts, call_size, repeats)})
+
+    # Speedups are against the best fp32 torch batch size at the same thread count
+    base = {}
+    for row in results["backends"]:
+        if row["backend"] == "torch":
+            base[row["threads"]] = max(base.get(row["threads"], 0), row["texts_per_s"])
+    print(f"\n{'backend':<11} {'threads':>7} {'batch':>6} {'texts/s':>9} {'vs torch':>9} {'min cos':>8} {'mean cos':>9} {'first load':>11}")
+    for row in results["backends"]:
+        speedup = f"{row['texts_per_s'] / base[row['threads']]:.2f}x" if row["threads"] in base else "-"
+        print(f"{row['backend']:<11} {row['threads']:>7} {row['batch_size']:>6} {row['texts_per_s']:>9.1f} {speedup:>9} "
+              f"{row['min_cosine']:>8.4f} {row['mean_cosine']:>9.5f} {row['first_load_ms']:>9.0f}ms")
+    print(f"\n{'length-sorted':<14} {'padding':>8} {'texts/s':>9}")
+    for row in results["bucketing"]:
+        print(f"{str(row['sorted']):<14} {row['padding_share']:>7.0%} {row['texts_per_s']:>9.1f}")
+
+    params = {"model": model_name if model == "minilm" else "random-minilm", "backends": list(backends), "threads": list(threads),
+              "batch_sizes": list(batch_sizes), "texts": n_texts, "call_size": call_size, "repeats": repeats}
+    return write_results(os.path.abspath(output_path), "embedding_backends", results, params)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput and cosine parity of the CPU embedding backends")
+    parser.add_argument("--model", choices=["random", "minilm"], default="random",
+                        help="random has MiniLM's architecture with random weights, for offline runs")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--threads", type=int, nargs="+", default=[1])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[16, 32, 64])
+    parser.add_argument("--texts", type=int, default=512)
+    parser.add_argument("--call-size", type=int, default=256, help="texts per embed_documents call")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", default="evaluation/benchmark_embedding_backends.json")
+    args = parser.parse_args()
+
+    run_benchmark(args.model, args.backends, args.threads, args.batch_sizes, args.texts, args.call_size, args.repeats, args.output)
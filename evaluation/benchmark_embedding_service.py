@@ -0,0 +1,124 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from evaluation.bench_utils import HashingEmbeddings, RandomMiniLM, make_corpus, latency_percentiles, write_results
+from src.embedding_service import BatchedEmbeddings, MicroBatcher, SocketEmbeddingClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CONCURRENCY = [1, 4, 16, 32]
+MODES = ["direct", "thread", "socket"]
+
+# Runs the embedding service in its own process, as it would be deployed
+SERVER_SCRIPT = """
+import sys
+sys.path.insert(0, {root!r})
+from evaluation.benchmark_embedding_service import load_embeddings
+from src.embedding_service import EmbeddingServer
+server = EmbeddingServer({path!r}, load_embeddings({embeddings!r}), {max_batch_size}, {max_wait_ms})
+print("ready", flush=True)
+server.serve_forever()
+"""
+
+def load_embeddings(name):
+    if name == "hash":
+        return HashingEmbeddings()
+    if name == "random-minilm":
+        return RandomMiniLM()
+    from src.embeddings import load_embedding_model
+    return load_embedding_model(use_cache=False, lazy=False, service=None)
+
+def run_clients(embed_query, queries, concurrency):
+    # Each simulated user asks its share of the queries one after another
+    latencies = [[] for _ in range(concurrency)]
+    def client(i):
+        for query in queries[i::concurrency]:
+            start = time.perf_counter()
+            embed_query(query)
+            latencies[i].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {"queries_per_s": len(queries) / elapsed, **latency_percentiles([s for row in latencies for s in row])}
+
+def start_server(path, embeddings, max_batch_size, max_wait_ms):
+    script = SERVER_SCRIPT.format(root=ROOT, path=path, embeddings=embeddings, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    process = subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE, text=True)
+    if process.stdout.readline().strip() != "ready":
+        process.kill()
+        raise RuntimeError("embedding service did not start")
+    return process
+
+def run_benchmark(concurrency = DEFAULT_CONCURRENCY, modes = MODES, embeddings = "random-minilm", queries_per_level = 256,
+                  max_batch_size = 32, max_wait_ms = 2.0, output_path = "evaluation/benchmark_embedding_service.json"):
+    # Query-sized texts, all distinct so nothing could be served from a cache
+    queries = [" ".join(chunk.page_content.split()[:12]) for chunk in make_corpus(queries_per_level * len(concurrency), seed=3)]
+    model = load_embeddings(embeddings)
+    model.embed_documents(queries[:max_batch_size])  # warm-up
+
+    results = []
+    server = None
+    socket_path = os.path.join(tempfile.mkdtemp(), "embeddings.sock")
+    try:
+        for mode in modes:
+            if mode == "socket":
+                server = start_server(socket_path, embeddings, max_batch_size, max_wait_ms)
+            for level, n in enumerate(concurrency):
+                batch = queries[level * queries_per_level:(level + 1) * queries_per_level]
+                batcher = None
+                if mode == "direct":
+                    # What the app does today: every session calls the one cached model
+                    embed_query = model.embed_query
+                elif mode == "thread":
+                    batcher = MicroBatcher(model, max_batch_size, max_wait_ms)
+                    embed_query = BatchedEmbeddings(batcher).embed_query
+                else:
+                    embed_query = SocketEmbeddingClient(socket_path).embed_query
+                row = {"mode": mode, "concurrency": n, **run_clients(embed_query, batch, n)}
+                if batcher is not None:
+                    row["mean_batch_size"] = batcher.stats()["mean_batch_size"]
+                    batcher.close()
+                results.append(row)
+            if server is not None:
+                server.kill()
+                server.wait()
+                server = None
+    finally:
+        if server is not None:
+            server.kill()
+
+    direct = {row["concurrency"]: row["queries_per_s"] for row in results if row["mode"] == "direct"}
+    print(f"\n{'mode':<8} {'clients':>7} {'queries/s':>10} {'vs direct':>9} {'p50':>9} {'p95':>9} {'batch':>6}")
+    for row in results:
+        speedup = f"{row['queries_per_s'] / direct[row['concurrency']]:.2f}x" if row["concurrency"] in direct else "-"
+        batch = f"{row['mean_batch_size']:.1f}" if "mean_batch_size" in row else "-"
+        print(f"{row['mode']:<8} {row['concurrency']:>7} {row['queries_per_s']:>10.1f} {speedup:>9} "
+              f"{row['p50_ms']:>7.1f}ms {row['p95_ms']:>7.1f}ms {batch:>6}")
+
+    params = {"concurrency": list(concurrency), "modes": list(modes), "embeddings": embeddings, "queries_per_level": queries_per_level,
+              "max_batch_size": max_batch_size, "max_wait_ms": max_wait_ms}
+    return write_results(os.path.abspath(output_path), "embedding_service", results, params)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query embedding throughput under concurrent load, with and without micro-batching")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--embeddings", choices=["random-minilm", "minilm", "hash"], default="random-minilm",
+                        help="random-minilm has MiniLM's architecture and cost but random weights, for offline runs")
+    parser.add_argument("--queries", type=int, default=256, help="queries per concurrency level")
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=2.0)
+    parser.add_argument("--output", default="evaluation/benchmark_embedding_service.json")
+    args = parser.parse_args()
+
+    run_benchmark(args.concurrency, args.modes, args.embeddings, args.queries, args.max_batch_size, args.max_wait_ms, args.output)
@@ -0,0 +1,71 @@
+import json
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# ChatGroq only needs a key to construct the client, no request is sent
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+from langchain_core.language_models import FakeListChatModel
+from src.embeddings import load_embedding_model
+from src.rag_chain import RAGEngine, create_rag_chain_V2, format_docs
+from src.vector_store import get_retriever
+
+def run_benchmark(test_set_path = "evaluation/test_set.json", k = 4, rounds = 3, output_path = "evaluation/benchmark_engine.json"):
+    with open(test_set_path) as f:
+        questions = [item["question"] for item in json.load(f)] * rounds
+
+    embedding_model = load_embedding_model()
+
+    # Old path: every question builds a fresh chain before retrieving
+    old_setup = []
+    old_retrieval = []
+    for question in questions:
+        start = time.perf_counter()
+        create_rag_chain_V2(embedding_model=embedding_model, k=k)
+        retriever = get_retriever(k=k, embedding_model=embedding_model)
+        old_setup.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        format_docs(retriever.invoke(question))
+        old_retrieval.append(time.perf_counter() - start)
+
+    # New path: the engine is built once and reused for every question
+    start = time.perf_counter()
+    engine = RAGEngine(embedding_model=embedding_model, k=k, llm=FakeListChatModel(responses=["ok"]))
+    engine_setup = time.perf_counter() - start
+
+    new_retrieval = []
+    for question in questions:
+        start = time.perf_counter()
+        format_docs(engine.retrieve(question))
+        new_retrieval.append(time.perf_counter() - start)
+
+    n = len(questions)
+    results = {
+        "questions": n,
+        "old": {
+            "setup_per_question_ms": 1000 * sum(old_setup) / n,
+            "retrieval_per_question_ms": 1000 * sum(old_retrieval) / n,
+        },
+        "engine": {
+            "setup_once_ms": 1000 * engine_setup,
+            "setup_per_question_ms": 1000 * engine_setup / n,
+            "retrieval_per_question_ms": 1000 * sum(new_retrieval) / n,
+        },
+    }
+
+    print(f"Questions: {n}")
+    print(f"Old per-question setup:    {results['old']['setup_per_question_ms']:.2f} ms")
+    print(f"Engine setup (amortized):  {results['engine']['setup_per_question_ms']:.2f} ms")
+    print(f"Old retrieval:             {results['old']['retrieval_per_question_ms']:.2f} ms")
+    print(f"Engine retrieval:          {results['engine']['retrieval_per_question_ms']:.2f} ms")
+
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to {output_path}")
+    return results
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,195 @@
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from evaluation.bench_utils import (
+    HashingEmbeddings, make_vocabulary, write_pdf, current_rss_bytes,
+    peak_rss_bytes, write_results
+)
+from src.document_loader import load_pdf, load_txt, chunk_documents
+from src.manifest import chunk_source, chunk_ids
+from src import vector_store as vs
+
+DEFAULT_BATCH_SIZES = [10, 50, 200, 1000]
+WORDS_PER_LINE = 12
+LINES_PER_PAGE = 50
+
+def make_lines(n_bytes, rng, vocabulary):
+    lines = []
+    size = 0
+    while size < n_bytes:
+        line = " ".join(rng.choice(vocabulary, size=WORDS_PER_LINE)) + "."
+        lines.append(line.capitalize())
+        size += len(line) + 1
+    return lines
+
+def generate_files(directory, n_files, file_kb, seed = 0):
+    """Half text files, half PDFs, each roughly file_kb of extracted text."""
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(make_vocabulary(5000, seed))
+    files = []
+    for i in range(n_files):
+        lines = make_lines(file_kb * 1024, rng, vocabulary)
+        if i % 2 == 0:
+            path = os.path.join(directory, f"doc_{i}.txt")
+            with open(path, "w") as f:
+                f.write("\n".join(lines))
+            files.append({"type": "txt", "path": path})
+        else:
+            path = os.path.join(directory, f"doc_{i}.pdf")
+            pages = [lines[j:j + LINES_PER_PAGE] for j in range(0, len(lines), LINES_PER_PAGE)]
+            write_pdf(path, pages)
+            files.append({"type": "pdf", "path": path})
+    return files
+
+def time_loading(files):
+    timings = {"pdf": 0.0, "txt": 0.0}
+    sizes = {"pdf": 0, "txt": 0}
+    documents = []
+    for source in files:
+        loader = load_pdf if source["type"] == "pdf" else load_txt
+        start = time.perf_counter()
+        documents.extend(loader(source["path"]))
+        timings[source["type"]] += time.perf_counter() - start
+        sizes[source["type"]] += os.path.getsize(source["path"])
+
+    stats = {}
+    for kind in timings:
+        stats[kind] = {
+            "seconds": timings[kind],
+            "mb": sizes[kind] / 1e6,
+            "mb_per_second": sizes[kind] / 1e6 / timings[kind] if timings[kind] else None,
+        }
+    return documents, stats
+
+def assign_ids(chunks):
+    by_source = {}
+    for chunk in chunks:
+        by_source.setdefault(chunk_source(chunk), []).append(chunk)
+    ordered, ids = [], []
+    for source, source_chunks in by_source.items():
+        ordered.extend(source_chunks)
+        ids.extend(chunk_ids(source, len(source_chunks)))
+    return ordered, ids
+
+def time_batch_size(chunks, ids, batch_size, embedding_model):
+    # Embedding and the Chroma write are timed separately here, then the same
+    # batch size is run end to end through add_documents
+    previous_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            vs.clear_vector_store()
+            store = vs.get_vector_store(embedding_model)
+            embed_seconds = 0.0
+            write_seconds = 0.0
+            for i in range(0, len(chunks), batch_size):
+                batch = chunks[i:i + batch_size]
+                start = time.perf_counter()
+                vectors = embedding_model.embed_documents([chunk.page_content for chunk in batch])
+                embed_seconds += time.perf_counter() - start
+
+                start = time.perf_counter()
+                vs.write_embedded_chunks(store, ids[i:i + batch_size], batch, vectors)
+                write_seconds += time.perf_counter() - start
+
+            vs.clear_vector_store()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                vs.add_documents(chunks, embedding_model=embedding_model, batch_size=batch_size)
+            add_seconds = time.perf_counter() - start
+            vs.clear_vector_store()
+        finally:
+            os.chdir(previous_dir)
+
+    n = len(chunks)
+    return {
+        "batch_size": batch_size,
+        "embed_seconds": embed_seconds,
+        "embed_chunks_per_second": n / embed_seconds,
+        "write_seconds": write_seconds,
+        "write_chunks_per_second": n / write_seconds,
+        "add_documents_seconds": add_seconds,
+        "add_documents_chunks_per_second": n / add_seconds,
+    }
+
+def run_benchmark(n_files = 20, file_kb = 50, batch_sizes = DEFAULT_BATCH_SIZES, chunk_size = 500, chunk_overlap = 50, embeddings = "hash", seed = 0, output_path = "evaluation/benchmark_ingest.json"):
+    if embeddings == "hash":
+        embedding_model = HashingEmbeddings()
+    else:
+        from src.embeddings import load_embedding_model
+        # The cache would turn every batch size after the first into lookups
+        embedding_model = load_embedding_model(use_cache=False)
+    output_path = os.path.abspath(output_path)
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        files = generate_files(data_dir, n_files, file_kb, seed)
+        total_mb = sum(os.path.getsize(source["path"]) for source in files) / 1e6
+        print(f"Generated {n_files} files, {total_mb:.1f} MB")
+
+        rss = current_rss_bytes()
+        documents, load_stats = time_loading(files)
+        load_rss = current_rss_bytes() - rss
+
+    rss = current_rss_bytes()
+    start = time.perf_counter()
+    chunks = chunk_documents(documents, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunk_seconds = time.perf_counter() - start
+    chunk_rss = current_rss_bytes() - rss
+    chunks, ids = assign_ids(chunks)
+    text_mb = sum(len(doc.page_content) for doc in documents) / 1e6
+
+    batches = []
+    for batch_size in batch_sizes:
+        print(f"Batch size {batch_size}...")
+        batches.append(time_batch_size(chunks, ids, batch_size, embedding_model))
+
+    results = {
+        "files": n_files,
+        "file_mb": total_mb,
+        "text_mb": text_mb,
+        "chunks": len(chunks),
+        "load": {**load_stats, "rss_delta_bytes": load_rss},
+        "chunking": {
+            "seconds": chunk_seconds,
+            "chunks_per_second": len(chunks) / chunk_seconds,
+            "mb_per_second": text_mb / chunk_seconds,
+            "rss_delta_bytes": chunk_rss,
+        },
+        "batch_sizes": batches,
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+    print(f"\nChunks: {len(chunks)} from {text_mb:.1f} MB of text")
+    for kind, stats in load_stats.items():
+        if stats["seconds"]:
+            print(f"load_{kind:<4} {stats['seconds']:>7.2f}s  {stats['mb_per_second']:>7.2f} MB/s")
+    print(f"chunking  {chunk_seconds:>7.2f}s  {len(chunks) / chunk_seconds:>9.0f} chunks/s  {text_mb / chunk_seconds:.2f} MB/s")
+    print(f"\n{'batch':>6} {'embed/s':>10} {'write/s':>10} {'add_documents/s':>16}")
+    for row in batches:
+        print(f"{row['batch_size']:>6} {row['embed_chunks_per_second']:>10.0f} {row['write_chunks_per_second']:>10.0f} {row['add_documents_chunks_per_second']:>16.0f}")
+    print(f"\nPeak RSS: {results['peak_rss_bytes'] / 1e6:.0f} MB")
+
+    params = {"files": n_files, "file_kb": file_kb, "batch_sizes": list(batch_sizes), "chunk_size": chunk_size,
+              "chunk_overlap": chunk_overlap, "embeddings": embeddings, "seed": seed}
+    return write_results(output_path, "ingest", results, params)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline ingestion throughput benchmark on generated PDFs and text files")
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--file-kb", type=int, default=50, help="approximate text size of each file")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=DEFAULT_BATCH_SIZES)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--embeddings", choices=["hash", "minilm"], default="hash")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="evaluation/benchmark_ingest.json")
+    args = parser.parse_args()
+
+    run_benchmark(args.files, args.file_kb, args.batch_sizes, args.chunk_size, args.chunk_overlap, args.embeddings, args.seed, args.output)
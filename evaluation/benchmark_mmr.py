@@ -0,0 +1,69 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from evaluation.bench_utils import clustered_vectors, latency_percentiles, write_results
+from src.mmr import mmr_by_vector
+
+DEFAULT_FETCH_K = [12, 50, 100, 200, 500, 1000, 2000]
+
+def time_selection(select, queries, candidates, k, lambda_mult):
+    select(queries[0], candidates[0], k, lambda_mult)  # warm-up
+    latencies = []
+    picks = []
+    for query, embeddings in zip(queries, candidates):
+        start = time.perf_counter()
+        picks.append(select(query, embeddings, k, lambda_mult))
+        latencies.append(time.perf_counter() - start)
+    return picks, latency_percentiles(latencies)
+
+def reference(query, embeddings, k, lambda_mult):
+    # The store returns a list of vectors, which LangChain's MMR converts itself
+    return maximal_marginal_relevance(query, embeddings, k=k, lambda_mult=lambda_mult)
+
+def vectorized(query, embeddings, k, lambda_mult):
+    return mmr_by_vector(query, embeddings, k, lambda_mult)[0]
+
+def run_benchmark(fetch_ks = DEFAULT_FETCH_K, ks = (4, 10), dim = 384, n_queries = 100, lambda_mult = 0.7, seed = 0,
+                  output_path = "evaluation/benchmark_mmr.json"):
+    rng = np.random.default_rng(seed)
+    results = []
+    for fetch_k in fetch_ks:
+        # Candidates for one query are near neighbours, so they come from a few clusters
+        candidates = [next(clustered_vectors(fetch_k, dim, rng, n_clusters=max(2, fetch_k // 20))) for _ in range(n_queries)]
+        queries = [pool[0] + 0.3 * rng.normal(size=dim).astype(np.float32) / np.sqrt(dim) for pool in candidates]
+        for k in ks:
+            ref_picks, ref_latency = time_selection(reference, queries, candidates, k, lambda_mult)
+            vec_picks, vec_latency = time_selection(vectorized, queries, candidates, k, lambda_mult)
+            agreement = float(np.mean([a == b for a, b in zip(ref_picks, vec_picks)]))
+            row = {
+                "fetch_k": fetch_k,
+                "k": k,
+                "reference": ref_latency,
+                "vectorized": vec_latency,
+                "speedup_p50": ref_latency["p50_ms"] / max(vec_latency["p50_ms"], 1e-9),
+                "same_picks": agreement,
+            }
+            results.append(row)
+            print(f"fetch_k={fetch_k:<5} k={k:<3} reference p50 {ref_latency['p50_ms']:>8.3f}ms  "
+                  f"vectorized p50 {vec_latency['p50_ms']:>8.3f}ms  speedup {row['speedup_p50']:>6.1f}x  same picks {agreement:.2f}")
+
+    params = {"fetch_k": list(fetch_ks), "k": list(ks), "dim": dim, "queries": n_queries, "lambda_mult": lambda_mult, "seed": seed}
+    return write_results(os.path.abspath(output_path), "mmr", results, params)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MMR selection latency across fetch_k: LangChain's reference vs the vectorized selection")
+    parser.add_argument("--fetch-k", type=int, nargs="+", default=DEFAULT_FETCH_K)
+    parser.add_argument("--k", type=int, nargs="+", default=[4, 10])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--lambda-mult", type=float, default=0.7)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="evaluation/benchmark_mmr.json")
+    args = parser.parse_args()
+
+    run_benchmark(args.fetch_k, args.k, args.dim, args.queries, args.lambda_mult, args.seed, args.output)
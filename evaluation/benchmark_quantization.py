@@ -0,0 +1,102 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from evaluation.bench_utils import clustered_vectors, latency_percentiles, write_results
+from src.flat_store import FlatCollection
+
+DEFAULT_SIZES = [10000, 100000]
+MODES = ["int8", "binary"]
+
+def embed_corpus(n, rng):
+    from evaluation.bench_utils import make_corpus
+    from src.embeddings import load_embedding_model
+    embedding_model = load_embedding_model(use_cache=False)
+    chunks = make_corpus(n, seed=int(rng.integers(1 << 31)))
+    for start in range(0, n, 1000):
+        yield np.array(embedding_model.embed_documents([c.page_content for c in chunks[start:start + 1000]]), dtype=np.float32)
+
+def build_collection(path, n, dim, data, rng):
+    collection = FlatCollection(path)
+    blocks = clustered_vectors(n, dim, rng) if data == "clustered" else embed_corpus(n, rng)
+    written = 0
+    for vectors in blocks:
+        collection.upsert([f"row-{i}" for i in range(written, written + len(vectors))], vectors)
+        written += len(vectors)
+    return collection
+
+def make_queries(collection, n_queries, rng, noise = 0.3):
+    rows = rng.choice(collection._rows, size=n_queries, replace=False)
+    queries = np.asarray(collection._vectors()[np.sort(rows)]) + noise * rng.normal(size=(n_queries, collection.dim)).astype(np.float32) / np.sqrt(collection.dim)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+def run_mode(collection, queries, k, truth):
+    latencies = []
+    overlaps = []
+    collection.top_k(queries[:1], k)  # builds codes for this mode outside the timed loop
+    wall_start = time.perf_counter()
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        rows, _ = collection.top_k(query, k)
+        latencies.append(time.perf_counter() - start)
+        overlaps.append(len(set(rows[0].tolist()) & expected) / len(expected))
+    wall = time.perf_counter() - wall_start
+    return {f"recall@{k}": float(np.mean(overlaps)), "qps": len(queries) / wall, **latency_percentiles(latencies)}
+
+def run_benchmark(sizes = DEFAULT_SIZES, dim = 384, n_queries = 200, k = 4, oversample = (1, 4, 16), data = "clustered", seed = 0, output_path = "evaluation/benchmark_quantization.json"):
+    rng = np.random.default_rng(seed)
+    results = []
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as workdir:
+            print(f"Building {n} vectors...")
+            collection = build_collection(os.path.join(workdir, "flat"), n, dim, data, rng)
+            queries = make_queries(collection, n_queries, rng)
+
+            collection.quantization = None
+            truth = [set(rows.tolist()) for rows in collection.top_k(queries, k)[0]]
+            exact = run_mode(collection, queries, k, truth)
+
+            memory = collection.memory_bytes()
+            result = {"vectors": n, "dim": collection.dim, "exact": {**exact, "first_pass_bytes": memory["float32"]}, "quantized": []}
+            for mode in MODES:
+                collection.quantization = mode
+                for factor in oversample:
+                    collection.oversample = factor
+                    stats = run_mode(collection, queries, k, truth)
+                    result["quantized"].append({
+                        "mode": mode,
+                        "oversample": factor,
+                        "first_pass_bytes": memory[mode],
+                        "memory_reduction": memory["float32"] / memory[mode],
+                        **stats,
+                    })
+            results.append(result)
+
+    for result in results:
+        exact = result["exact"]
+        print(f"\n{result['vectors']} x {result['dim']}: exact p50 {exact['p50_ms']:.2f}ms, {exact['qps']:.0f} qps, {exact['first_pass_bytes'] / 1e6:.1f} MB")
+        print(f"{'mode':<7} {'oversample':>10} {'recall@' + str(k):>9} {'p50':>8} {'p95':>8} {'qps':>7} {'memory':>9}")
+        for row in result["quantized"]:
+            print(f"{row['mode']:<7} {row['oversample']:>10} {row[f'recall@{k}']:>9.3f} {row['p50_ms']:>6.2f}ms {row['p95_ms']:>6.2f}ms "
+                  f"{row['qps']:>7.0f} {row['memory_reduction']:>8.1f}x")
+
+    params = {"sizes": list(sizes), "dim": dim, "queries": n_queries, "k": k, "oversample": list(oversample), "data": data, "seed": seed}
+    return write_results(os.path.abspath(output_path), "quantization", results, params)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall and memory of int8/binary first-pass search with exact rescoring")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--oversample", type=int, nargs="+", default=[1, 4, 16], help="first-pass candidates per result before rescoring")
+    parser.add_argument("--data", choices=["clustered", "minilm"], default="clustered", help="minilm embeds a synthetic corpus with the real model")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="evaluation/benchmark_quantization.json")
+    args = parser.parse_args()
+
+    run_benchmark(args.sizes, args.dim, args.queries, args.k, args.oversample, args.data, args.seed, args.output)
@@ -0,0 +1,153 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from evaluation.bench_utils import (
+    HashingEmbeddings, make_corpus, make_queries, recall_and_mrr,
+    latency_percentiles, current_rss_bytes, directory_size, write_results
+)
+from src import vector_store as vs
+
+DEFAULT_SIZES = [1000, 10000]
+
+def load_embeddings(name):
+    if name == "hash":
+        return HashingEmbeddings()
+    from src.embeddings import load_embedding_model
+    return load_embedding_model()
+
+def build_retrievers(k, embedding_model, store):
+    mmr = vs.get_retriever(k=k, embedding_model=embedding_model, vector_store=store)
+    hybrid = vs.get_hybrid_retriever(k=k, embedding_model=embedding_model, vector_store=store)
+    return {
+        "similarity": lambda q: vs.similarity_search(q, k=k, vector_store=store),
+        "mmr": mmr.invoke,
+        "hybrid": hybrid.invoke,
+    }
+
+def run_queries(search, queries, k):
+    latencies = []
+    recalls = []
+    reciprocal_ranks = []
+    search(queries[0]["query"])  # warm-up, keeps lazy setup out of the numbers
+
+    wall_start = time.perf_counter()
+    for item in queries:
+        start = time.perf_counter()
+        docs = search(item["query"])
+        latencies.append(time.perf_counter() - start)
+
+        retrieved = [doc.metadata.get("chunk_id") for doc in docs]
+        recall, reciprocal_rank = recall_and_mrr(retrieved, item["relevant"], k)
+        recalls.append(recall)
+        reciprocal_ranks.append(reciprocal_rank)
+    wall = time.perf_counter() - wall_start
+
+    return {
+        f"recall@{k}": sum(recalls) / len(recalls),
+        "mrr": sum(reciprocal_ranks) / len(reciprocal_ranks),
+        "qps": len(queries) / wall,
+        **latency_percentiles(latencies),
+    }
+
+def benchmark_size(chunks, queries, k, embedding_model, backend = "chroma"):
+    # Index paths are relative, so a scratch directory keeps every run isolated
+    # from each other and from the real index
+    previous_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            vs.clear_vector_store()
+            rss_before = current_rss_bytes()
+
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                store = vs.add_documents(chunks, embedding_model=embedding_model, backend=backend)
+            ingest_seconds = time.perf_counter() - start
+
+            result = {
+                "backend": backend,
+                "chunks": len(chunks),
+                "queries": len(queries),
+                "ingest_seconds": ingest_seconds,
+                "index_disk_bytes": directory_size(vs.backend_path(backend)),
+                "index_rss_delta_bytes": current_rss_bytes() - rss_before,
+                "retrievers": {},
+            }
+            for name, search in build_retrievers(k, embedding_model, store).items():
+                result["retrievers"][name] = run_queries(search, queries, k)
+
+            vs.clear_vector_store()
+        finally:
+            os.chdir(previous_dir)
+    return result
+
+def print_table(results, k):
+    print(f"\n{'chunks':>9} {'backend':<7} {'retriever':<11} {'recall@' + str(k):>9} {'mrr':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'qps':>8}")
+    for result in results:
+        for name, stats in result["retrievers"].items():
+            print(f"{result['chunks']:>9} {result.get('backend', 'chroma'):<7} {name:<11} {stats[f'recall@{k}']:>9.3f} {stats['mrr']:>6.3f} "
+                  f"{stats['p50_ms']:>7.2f}ms {stats['p95_ms']:>6.2f}ms {stats['p99_ms']:>6.2f}ms {stats['qps']:>8.1f}")
+        print(f"{'':>17} index on disk {result['index_disk_bytes'] / 1e6:.1f} MB, "
+              f"RSS +{result['index_rss_delta_bytes'] / 1e6:.1f} MB, ingest {result['ingest_seconds']:.1f}s")
+
+def run_benchmark(sizes = DEFAULT_SIZES, n_queries = 200, k = 4, embeddings = "hash", seed = 0, output_path = "evaluation/benchmark_retrieval.json", backends = ("chroma",)):
+    embedding_model = load_embeddings(embeddings)
+    output_path = os.path.abspath(output_path)
+
+    results = []
+    for n_chunks in sizes:
+        chunks = make_corpus(n_chunks, seed=seed)
+        queries = make_queries(chunks, n_queries, seed=seed + 1)
+        for backend in backends:
+            print(f"Benchmarking {n_chunks} chunks on {backend}...")
+            results.append(benchmark_size(chunks, queries, k, embedding_model, backend))
+
+    print_table(results, k)
+    params = {"sizes": list(sizes), "queries": n_queries, "k": k, "embeddings": embeddings, "seed": seed, "backends": list(backends)}
+    return write_results(output_path, "retrieval", results, params)
+
+def compare(baseline_path, candidate_path):
+    # Side by side view of two result files, e.g. from two commits
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(candidate_path) as f:
+        candidate = json.load(f)
+
+    k = baseline["params"]["k"]
+    old = {(r["chunks"], r.get("backend", "chroma")): r for r in baseline["results"]}
+    print(f"{(baseline.get('commit') or '')[:8]} -> {(candidate.get('commit') or '')[:8]}")
+    for result in candidate["results"]:
+        backend = result.get("backend", "chroma")
+        before = old.get((result["chunks"], backend))
+        if before is None:
+            continue
+        for name, stats in result["retrievers"].items():
+            prev = before["retrievers"].get(name)
+            if prev is None:
+                continue
+            print(f"{result['chunks']:>9} {backend:<7} {name:<11} recall@{k} {prev[f'recall@{k}']:.3f} -> {stats[f'recall@{k}']:.3f}  "
+                  f"p95 {prev['p95_ms']:.2f} -> {stats['p95_ms']:.2f} ms  qps {prev['qps']:.1f} -> {stats['qps']:.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline retrieval benchmark on synthetic corpora")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="corpus sizes in chunks, e.g. 1000 100000 1000000")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--embeddings", choices=["hash", "minilm"], default="hash")
+    parser.add_argument("--backends", nargs="+", choices=list(vs.BACKENDS), default=["chroma"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="evaluation/benchmark_retrieval.json")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"), help="compare two result files instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    else:
+        run_benchmark(args.sizes, args.queries, args.k, args.embeddings, args.seed, args.output, args.backends)
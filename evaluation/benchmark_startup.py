@@ -0,0 +1,148 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from evaluation.bench_utils import write_results
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# What the Streamlit app and the engine import before they can do anything
+DEFAULT_MODULES = ["src.rag_chain", "src.vector_store", "src.ingest_pipeline", "src.document_loader", "src.embeddings"]
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+heavy = [name for name in ("chromadb", "langchain_groq", "langchain_community", "sentence_transformers", "torch") if name in sys.modules]
+print(json.dumps({{"seconds": time.perf_counter() - start, "heavy_modules": heavy}}))
+"""
+
+# Runs in a fresh interpreter against a store built by the parent. The
+# question is asked after think_time seconds, as if a user were typing
+FIRST_ANSWER_SCRIPT = """
+import json, os, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+from langchain_core.language_models import FakeListChatModel
+from src.rag_chain import RAGEngine, load_llm
+from src.startup import warm_up
+imported = time.perf_counter()
+
+if {embeddings!r} == "hash":
+    from evaluation.bench_utils import HashingEmbeddings
+    from src.embeddings import LazyEmbeddings
+    embedding_model = LazyEmbeddings(HashingEmbeddings)
+else:
+    from src.embeddings import load_embedding_model
+    embedding_model = load_embedding_model(use_cache=False)
+thread = warm_up(embedding_model) if {warm_up} else None
+ready = time.perf_counter()
+
+time.sleep({think_time})
+asked = time.perf_counter()
+load_llm()  # the Groq client is built but never called
+engine = RAGEngine(embedding_model=embedding_model, k=4, llm=FakeListChatModel(responses=["ok"]))
+engine.query("what does the first document say")
+answered = time.perf_counter()
+print(json.dumps({{
+    "import_ms": 1000 * (imported - start),
+    "ready_ms": 1000 * (ready - start),
+    "first_answer_ms": 1000 * (answered - asked),
+    "total_ms": 1000 * (answered - start) - 1000 * {think_time},
+}}))
+"""
+
+def run_python(script, cwd, env = None):
+    result = subprocess.run([sys.executable, "-c", script], cwd=cwd, capture_output=True, text=True, env=env, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def time_imports(modules, repeats, root = ROOT):
+    results = {}
+    for module in modules:
+        runs = [run_python(IMPORT_SCRIPT.format(module=module), root) for _ in range(repeats)]
+        seconds = [run["seconds"] for run in runs]
+        results[module] = {
+            "median_ms": 1000 * float(np.median(seconds)),
+            "min_ms": 1000 * float(np.min(seconds)),
+            "heavy_modules": runs[0]["heavy_modules"],
+        }
+    return results
+
+def build_store(workdir, embeddings, n_chunks):
+    script = f"""
+import json, sys
+sys.path.insert(0, {ROOT!r})
+from evaluation.bench_utils import HashingEmbeddings, make_corpus
+from src.vector_store import add_documents
+if {embeddings!r} == "hash":
+    embedding_model = HashingEmbeddings()
+else:
+    from src.embeddings import load_embedding_model
+    embedding_model = load_embedding_model(use_cache=False)
+add_documents(make_corpus({n_chunks}), embedding_model)
+print(json.dumps({{}}))
+"""
+    run_python(script, workdir)
+
+def time_first_answer(workdir, embeddings, warm, think_time, repeats):
+    script = FIRST_ANSWER_SCRIPT.format(root=ROOT, embeddings=embeddings, warm_up=warm, think_time=think_time)
+    runs = [run_python(script, workdir) for _ in range(repeats)]
+    return {key: float(np.median([run[key] for run in runs])) for key in runs[0]}
+
+def time_ref_imports(ref, modules, repeats):
+    # Import times of an older commit, checked out into a temporary worktree
+    workdir = tempfile.mkdtemp()
+    try:
+        subprocess.run(["git", "worktree", "add", "--detach", workdir, ref], cwd=ROOT, capture_output=True, check=True)
+        return time_imports(modules, repeats, root=workdir)
+    finally:
+        subprocess.run(["git", "worktree", "remove", "--force", workdir], cwd=ROOT, capture_output=True)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def run_benchmark(modules = DEFAULT_MODULES, embeddings = "hash", think_times = (0.0, 2.0), repeats = 5, n_chunks = 1000,
+                  compare_ref = None, output_path = "evaluation/benchmark_startup.json"):
+    results = {"imports": time_imports(modules, repeats)}
+    if compare_ref:
+        results["imports_" + compare_ref] = time_ref_imports(compare_ref, modules, repeats)
+
+    print(f"\n{'module':<24} {'import p50':>11}  heavy modules loaded")
+    for module, stats in results["imports"].items():
+        line = f"{module:<24} {stats['median_ms']:>9.0f}ms  {', '.join(stats['heavy_modules']) or '-'}"
+        if compare_ref:
+            line += f"   ({compare_ref}: {results['imports_' + compare_ref][module]['median_ms']:.0f}ms)"
+        print(line)
+
+    results["first_answer"] = []
+    with tempfile.TemporaryDirectory() as workdir:
+        build_store(workdir, embeddings, n_chunks)
+        for think_time in think_times:
+            for warm in (False, True):
+                row = {"think_time_s": think_time, "warm_up": warm, **time_first_answer(workdir, embeddings, warm, think_time, repeats)}
+                results["first_answer"].append(row)
+
+    print(f"\n{'think time':>10} {'warm-up':>8} {'import':>9} {'first answer':>13} {'total':>9}")
+    for row in results["first_answer"]:
+        print(f"{row['think_time_s']:>9.1f}s {str(row['warm_up']):>8} {row['import_ms']:>7.0f}ms {row['first_answer_ms']:>11.0f}ms {row['total_ms']:>7.0f}ms")
+
+    params = {"modules": list(modules), "embeddings": embeddings, "think_times": list(think_times), "repeats": repeats,
+              "chunks": n_chunks, "compare_ref": compare_ref}
+    return write_results(os.path.abspath(output_path), "startup", results, params)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import time and time-to-first-answer in fresh interpreters")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES)
+    parser.add_argument("--embeddings", choices=["hash", "minilm"], default="hash")
+    parser.add_argument("--think-times", type=float, nargs="+", default=[0.0, 2.0], help="seconds between start-up and the first question")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--compare-ref", default=None, help="git ref to compare import times against, e.g. HEAD~1")
+    parser.add_argument("--output", default="evaluation/benchmark_startup.json")
+    args = parser.parse_args()
+
+    run_benchmark(args.modules, args.embeddings, args.think_times, args.repeats, args.chunks, args.compare_ref, args.output)
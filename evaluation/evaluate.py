@@ -1,20 +1,83 @@
+import hashlib
 import json
 import os
+import re
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from dotenv import load_dotenv
 from langchain_groq import ChatGroq
-from src.vector_store import similarity_search
-from src.rag_chain import ask,ask_V2,ask_V3,ask_hybrid
+from src.rag_chain import RAGEngine
 from src.embeddings import load_embedding_model
-from src.rag_chain import ask_with_rewrite
-from src.document_loader import load_and_chunk
-from src.vector_store import add_documents, clear_vector_store
+from src.document_loader import load_and_chunk, chunk_documents, LOADERS
+from src.vector_store import VECTOR_BACKEND, add_documents, clear_vector_store, delete_collection, get_vector_store
+from src.rate_limit import RateLimiter
 
 
 load_dotenv()
 
+JUDGE_MODEL = "llama-3.3-70b-versatile"
+METRICS = ["faithfulness", "answer_relevancy", "context_recall", "completeness"]
+CHECKPOINT_DIR = "evaluation/checkpoints"
+JUDGE_CACHE_PATH = "evaluation/judge_cache.jsonl"
+EVALUATION_SOURCES = [
+    {"type": "pdf", "path": "data/learning.pdf"},
+    {"type": "txt", "path": "data/transformers.txt"},
+]
+
+
+class JudgeCache:
+    """Judge verdicts keyed by everything the judge sees, appended to a JSONL file."""
+
+    def __init__(self, path = None):
+        # Looked up at call time, so the module setting can be pointed elsewhere
+        self.path = path or JUDGE_CACHE_PATH
+        self.entries = {}
+        self.hits = 0
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.entries[record["key"]] = record["scores"]
+
+    @staticmethod
+    def key(question, answer, context, ground_truth, model):
+        raw = json.dumps([question, answer, context, ground_truth, model])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            scores = self.entries.get(key)
+            if scores is not None:
+                self.hits += 1
+            return scores
+
+    def put(self, key, scores):
+        with self._lock:
+            self.entries[key] = scores
+            with open(self.path, "a") as f:
+                f.write(json.dumps({"key": key, "scores": scores}) + "\n")
+
+def parse_scores(content):
+    try:
+        scores = json.loads(content)
+    except json.JSONDecodeError:
+        # Judges sometimes wrap the JSON in prose or a code fence
+        match = re.search(r"\{.*\}", content, re.S)
+        if match is None:
+            raise ValueError(f"Judge returned no JSON: {content[:200]!r}")
+        scores = json.loads(match.group(0))
+
+    missing = [metric for metric in METRICS if not isinstance(scores.get(metric), (int, float))]
+    if missing:
+        raise ValueError(f"Judge response missing scores for {missing}: {content[:200]!r}")
+    return {metric: float(scores[metric]) for metric in METRICS}
+
 def llm_judge(question, answer, context, ground_truth, llm):
     prompt = f"""You are evaluating a RAG system. Score the following on a scale of 0 to 1.
 
@@ -32,81 +95,298 @@ def llm_judge(question, answer, context, ground_truth, llm):
     }}"""
 
     response = llm.invoke(prompt)
-    try:
-        scores = json.loads(response.content)
-    except:
-        scores = {"faithfulness": 0, "answer_relevancy": 0, "context_recall": 0, "completeness": 0}
-    return scores
+    return parse_scores(response.content)
 
-def run_evaluation(test_set_path = "evaluation/test_set.json", chunk_size = 500, chunk_overlap = 50,  k = 4, tag="baseline"):
-    with open(test_set_path) as f:
-        test_set = json.load(f)
+def evaluate_item(index, item, engine, judge_llm, judge_cache, limiter):
+    question = item["question"]
+    ground_truth = item["ground_truth"]
 
-    embedding_model = load_embedding_model()
+    start = time.perf_counter()
+    limiter.acquire()
+    result = engine.query(question)
+    answered_at = time.perf_counter()
+    context = " ".join([doc.page_content for doc in result.docs])
 
-    clear_vector_store()
-    sources = [
-        {"type": "pdf", "path": "data/learning.pdf"},
-        {"type": "txt", "path": "data/transformers.txt"},
-    ]
-    chunks = load_and_chunk(sources, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-    add_documents(chunks, embedding_model)
+    key = JudgeCache.key(question, result.answer, context, ground_truth, JUDGE_MODEL)
+    scores = judge_cache.get(key)
+    judge_cached = scores is not None
+    if scores is None:
+        limiter.acquire()
+        scores = llm_judge(question, result.answer, context, ground_truth, judge_llm)
+        judge_cache.put(key, scores)
+    finished = time.perf_counter()
 
-    llm = ChatGroq(
-        api_key=os.getenv("GROQ_API_KEY"),
-        model_name = "llama-3.3-70b-versatile",
-        temperature=0
-    )
+    return {
+        "index": index,
+        "question": question,
+        "answer": result.answer,
+        "scores": scores,
+        "judge_cached": judge_cached,
+        "timings": {
+            "answer_ms": 1000 * (answered_at - start),
+            "judge_ms": 1000 * (finished - answered_at),
+        },
+    }
+
+def load_checkpoint(path, config):
+    done = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.get("config") == config:
+                    done[record["index"]] = record
+    return done
 
-    all_scores = []
+def latency_summary(values):
+    if not values:
+        return {}
+    values = sorted(values)
+    def percentile(p):
+        return values[min(len(values) - 1, int(round(p * (len(values) - 1))))]
+    return {
+        "mean": sum(values) / len(values),
+        "p50": percentile(0.5),
+        "p95": percentile(0.95),
+        "max": values[-1],
+    }
+
+def evaluate_config(test_set, get_engine, config, tag, judge_llm, judge_cache, limiter, max_concurrency = 4, resume = True, verbose = True):
+    run_start = time.perf_counter()
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    checkpoint_path = os.path.join(CHECKPOINT_DIR, f"{tag}.jsonl")
+    if not resume and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    done = load_checkpoint(checkpoint_path, config)
+    pending = [i for i, item in enumerate(test_set) if i not in done or done[i]["question"] != item["question"]]
 
-    print(f"Running evaluation with k={k} and chunk size = {chunk_size}\n")
-    for item in test_set:
-        question = item["question"]
-        ground_truth = item["ground_truth"]
+    # The index is only built when something actually needs answering
+    engine = get_engine() if pending else None
+    checkpoint_lock = threading.Lock()
+    records = {i: done[i] for i in done if i not in pending}
+    failures = []
+    judge_hits_before = judge_cache.hits
 
-        answer = ask_V2(question, embedding_model= embedding_model, k=k)
-        retrieved_docs = similarity_search(question,k=k, embedding_model=embedding_model)
-        context = " ".join([doc.page_content for doc in retrieved_docs])
+    print(f"Running evaluation with k={config['k']} and chunk size = {config['chunk_size']}")
+    print(f"Resuming {len(records)} items from {checkpoint_path}, {len(pending)} to run\n")
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+        futures = {
+            pool.submit(evaluate_item, i, test_set[i], engine, judge_llm, judge_cache, limiter): i
+            for i in pending
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:
+                # Failed items are reported and left out of the checkpoint so
+                # the next run retries them, rather than scoring them as zeros
+                failures.append({"index": i, "question": test_set[i]["question"], "error": f"{type(e).__name__}: {e}"})
+                print(f"FAILED Q: {test_set[i]['question'][:70]}\n  {type(e).__name__}: {e}\n")
+                continue
 
-        scores = llm_judge(question, answer, context, ground_truth, llm)
-        all_scores.append(scores)
+            record["config"] = config
+            records[i] = record
+            with checkpoint_lock:
+                with open(checkpoint_path, "a") as f:
+                    f.write(json.dumps(record) + "\n")
 
-        print(f"Q: {question[:70]}")
-        print(f"A: {answer[:100]}")
-        print(f"Scores: {scores}\n")
+            if verbose:
+                print(f"Q: {record['question'][:70]}")
+                print(f"A: {record['answer'][:100]}")
+                print(f"Scores: {record['scores']}\n")
 
+    all_scores = [records[i]["scores"] for i in sorted(records)]
     answered = [s for s in all_scores if s["completeness"] > 0.3]
     unanswered = [s for s in all_scores if s["completeness"] <= 0.3]
-    
-    print(f"\nQuestions answered: {len(answered)}/{len(all_scores)}")
-    print(f"Questions unanswered: {len(unanswered)}/{len(all_scores)}")
 
     avg_faithfulness = sum(s["faithfulness"] for s in answered) / len(answered) if answered else 0
     avg_relevancy = sum(s["answer_relevancy"] for s in answered) / len(answered) if answered else 0
-    avg_recall = sum(s["context_recall"] for s in all_scores) / len(all_scores)
-    avg_completeness = sum(s["completeness"] for s in all_scores) / len(all_scores)
+    avg_recall = sum(s["context_recall"] for s in all_scores) / len(all_scores) if all_scores else 0
+    avg_completeness = sum(s["completeness"] for s in all_scores) / len(all_scores) if all_scores else 0
+
+    if verbose:
+        print(f"\nQuestions answered: {len(answered)}/{len(all_scores)}")
+        print(f"Questions unanswered: {len(unanswered)}/{len(all_scores)}")
+        if failures:
+            print(f"Questions failed: {len(failures)}/{len(test_set)} (rerun to retry them)")
 
-    print("===== AVERAGE SCORES =====")
-    print(f"Faithfulness:     {avg_faithfulness:.4f}")
-    print(f"Answer Relevancy: {avg_relevancy:.4f}")
-    print(f"Context Recall:   {avg_recall:.4f}")
-    print(f"Completeness:     {avg_completeness:.4f}")
+        print("===== AVERAGE SCORES =====")
+        print(f"Faithfulness:     {avg_faithfulness:.4f}")
+        print(f"Answer Relevancy: {avg_relevancy:.4f}")
+        print(f"Context Recall:   {avg_recall:.4f}")
+        print(f"Completeness:     {avg_completeness:.4f}")
 
-    results = {
-        "config": {"k": k, "chunk_size": chunk_size, "chunk_overlap": chunk_overlap},
+    return {
+        "config": config,
         "scores": {
             "faithfulness": avg_faithfulness,
             "answer_relevancy": avg_relevancy,
             "context_recall": avg_recall,
             "completeness": avg_completeness
+        },
+        "items": {"evaluated": len(all_scores), "failed": failures},
+        "timings": {
+            "wall_seconds": time.perf_counter() - run_start,
+            "answer_ms": latency_summary([records[i]["timings"]["answer_ms"] for i in records]),
+            "judge_ms": latency_summary([records[i]["timings"]["judge_ms"] for i in records if not records[i]["judge_cached"]]),
+            "judge_cache_hits": judge_cache.hits - judge_hits_before,
         }
     }
 
+def load_judge_llm():
+    return ChatGroq(
+        api_key=os.getenv("GROQ_API_KEY"),
+        model_name = JUDGE_MODEL,
+        temperature=0
+    )
+
+def run_evaluation(test_set_path = "evaluation/test_set.json", chunk_size = 500, chunk_overlap = 50,  k = 4, tag="baseline", max_concurrency = 4, requests_per_minute = 30, resume = True):
+    run_start = time.perf_counter()
+    with open(test_set_path) as f:
+        test_set = json.load(f)
+
+    embedding_model = load_embedding_model()
+
+    def get_engine():
+        clear_vector_store()
+        chunks = load_and_chunk(EVALUATION_SOURCES, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        add_documents(chunks, embedding_model)
+        return RAGEngine(embedding_model=embedding_model, k=k, prompt_version="v2")
+
+    config = {"k": k, "chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+    judge_cache = JudgeCache()
+    results = evaluate_config(
+        test_set, get_engine, config, tag, load_judge_llm(), judge_cache,
+        RateLimiter(requests_per_minute), max_concurrency=max_concurrency, resume=resume
+    )
+    results["timings"]["wall_seconds"] = time.perf_counter() - run_start
+
+    if hasattr(embedding_model, "stats"):
+        print(f"Embedding cache:  {embedding_model.stats()}")
+    print(f"Judge cache hits: {judge_cache.hits}")
+
     output_path = f"evaluation/results_{tag}.json"
     with open(output_path, "w") as f:
         json.dump(results, f, indent=2)
-    print(f"\nResults saved to {output_path}")
+    print(f"\nResults saved to {output_path} ({results['timings']['wall_seconds']:.1f}s)")
+    return results
+
+def build_sweep_index(documents, chunk_size, chunk_overlap, embedding_model, backend = None):
+    # Each (chunk_size, chunk_overlap) gets its own collection, shared by every k;
+    # one left over from an interrupted run is rebuilt from scratch
+    collection_name = f"sweep_c{chunk_size}_o{chunk_overlap}"
+    delete_collection(get_vector_store(embedding_model, collection_name=collection_name, backend=backend))
+    vector_store = get_vector_store(embedding_model, collection_name=collection_name, backend=backend)
+
+    chunks = chunk_documents(documents, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    batch_size = 50
+    for i in range(0, len(chunks), batch_size):
+        vector_store.add_documents(chunks[i:i + batch_size], ids=[f"{collection_name}-{j}" for j in range(i, min(i + batch_size, len(chunks)))])
+    return vector_store, len(chunks)
+
+def run_sweep(grid = None, test_set_path = "evaluation/test_set.json", tag = "sweep", max_parallel_configs = 3, max_concurrency = 4, requests_per_minute = 30, resume = True, backend = None):
+    backend = backend or VECTOR_BACKEND
+    if grid is None:
+        grid = {"k": [2, 4, 8], "chunk_size": [200, 300, 400, 500], "chunk_overlap": [50]}
+
+    sweep_start = time.perf_counter()
+    with open(test_set_path) as f:
+        test_set = json.load(f)
+
+    configs = [
+        {"k": k, "chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+        for chunk_size in grid["chunk_size"]
+        for chunk_overlap in grid["chunk_overlap"]
+        for k in grid["k"]
+    ]
+
+    # Parse the sources once; every chunk size is cut from the same documents
+    embedding_model = load_embedding_model()
+    parse_start = time.perf_counter()
+    documents = []
+    for source in EVALUATION_SOURCES:
+        documents.extend(LOADERS[source["type"]](source["path"]))
+    parse_seconds = time.perf_counter() - parse_start
+
+    index_locks_lock = threading.Lock()
+    index_locks = {}
+    indexes = {}
+    index_timings = {}
+
+    def get_index(chunk_size, chunk_overlap):
+        key = (chunk_size, chunk_overlap)
+        with index_locks_lock:
+            lock = index_locks.setdefault(key, threading.Lock())
+        # Configs that share a chunking wait for one build; others build in parallel
+        with lock:
+            if key not in indexes:
+                start = time.perf_counter()
+                indexes[key] = build_sweep_index(documents, chunk_size, chunk_overlap, embedding_model, backend)
+                index_timings[key] = time.perf_counter() - start
+                print(f"Built index chunk_size={chunk_size} overlap={chunk_overlap}: {indexes[key][1]} chunks in {index_timings[key]:.1f}s")
+            return indexes[key][0]
+
+    judge_llm = load_judge_llm()
+    judge_cache = JudgeCache()
+    limiter = RateLimiter(requests_per_minute)
+
+    def run_config(config):
+        config_tag = f"{tag}_k{config['k']}_chunk{config['chunk_size']}_o{config['chunk_overlap']}"
+        def get_engine():
+            vector_store = get_index(config["chunk_size"], config["chunk_overlap"])
+            return RAGEngine(embedding_model=embedding_model, k=config["k"], prompt_version="v2", vector_store=vector_store)
+        return evaluate_config(
+            test_set, get_engine, config, config_tag, judge_llm, judge_cache, limiter,
+            max_concurrency=max_concurrency, resume=resume, verbose=False
+        )
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, max_parallel_configs)) as pool:
+            results = list(pool.map(run_config, configs))
+    finally:
+        # The sweep collections are only needed for this run
+        for vector_store, _ in indexes.values():
+            delete_collection(vector_store)
+
+    for result in results:
+        key = (result["config"]["chunk_size"], result["config"]["chunk_overlap"])
+        result["timings"]["index_build_seconds"] = index_timings.get(key, 0.0)
+
+    print("\n===== SWEEP RESULTS =====")
+    print(f"{'k':>3} {'chunk':>6} {'overlap':>8} {'faith':>7} {'relev':>7} {'recall':>7} {'compl':>7} {'failed':>7} {'wall_s':>7} {'ans_p50':>8}")
+    for result in results:
+        config, scores, timings = result["config"], result["scores"], result["timings"]
+        print(
+            f"{config['k']:>3} {config['chunk_size']:>6} {config['chunk_overlap']:>8} "
+            f"{scores['faithfulness']:>7.4f} {scores['answer_relevancy']:>7.4f} {scores['context_recall']:>7.4f} {scores['completeness']:>7.4f} "
+            f"{len(result['items']['failed']):>7} {timings['wall_seconds']:>7.1f} {timings['answer_ms'].get('p50', 0):>8.0f}"
+        )
+
+    summary = {
+        "grid": grid,
+        "backend": backend,
+        "configs": results,
+        "timings": {
+            "wall_seconds": time.perf_counter() - sweep_start,
+            "parse_seconds": parse_seconds,
+            "indexes_built": len(indexes),
+            "judge_cache_hits": judge_cache.hits,
+        }
+    }
+    if hasattr(embedding_model, "stats"):
+        summary["timings"]["embedding_cache"] = embedding_model.stats()
+
+    output_path = f"evaluation/results_{tag}.json"
+    with open(output_path, "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"\nSweep of {len(configs)} configs over {len(indexes)} indexes saved to {output_path} ({summary['timings']['wall_seconds']:.1f}s)")
+    return summary
 
 if __name__ == "__main__":
-    run_evaluation(k=4, chunk_overlap=50, chunk_size=500, tag="70b_mmr_promptv2_final")
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == "sweep":
+        run_sweep()
+    else:
+        run_evaluation(k=4, chunk_overlap=50, chunk_size=500, tag="70b_mmr_promptv2_final")
@@ -0,0 +1,116 @@
+import threading
+from contextlib import contextmanager
+from src.flat_store import probe
+
+# Chroma's defaults, used when a collection is created without overrides
+HNSW_DEFAULTS = {"M": 16, "construction_ef": 100, "search_ef": 10}
+
+_search_locks = {}
+_search_locks_guard = threading.Lock()
+
+def hnsw_metadata(M = None, construction_ef = None, search_ef = None):
+    """Collection metadata that sets Chroma's HNSW parameters.
+
+    M and construction_ef only take effect when the collection is created;
+    search_ef is the default for queries and can be overridden per query
+    with search_params().
+    """
+    params = {"M": M, "construction_ef": construction_ef, "search_ef": search_ef}
+    return {f"hnsw:{key}": int(value) for key, value in params.items() if value is not None}
+
+def hnsw_params(vector_store):
+    metadata = getattr(vector_store._collection, "metadata", None) or {}
+    return {key: metadata.get(f"hnsw:{key}", default) for key, default in HNSW_DEFAULTS.items()}
+
+def _hnsw_segment(vector_store):
+    # Chroma 0.5 has no per-query ef, so the live hnswlib index is reached
+    # through the in-process segment manager. Returns None for other clients.
+    from chromadb.segment import VectorReader
+    try:
+        manager = vector_store._client._server._manager
+        return manager.get_segment(vector_store._collection.id, VectorReader)
+    except AttributeError:
+        return None
+
+class SearchLock:
+    """Shared by searches at the index's own ef, exclusive to one that sets it.
+
+    hnswlib keeps ef on the index, so an override would leak into any search
+    running at the same time. Overrides waiting for the lock go before new
+    shared searches, so a steady stream of default searches cannot starve them.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._shared = 0
+        self._exclusive = False
+        self._waiting = 0
+
+    @contextmanager
+    def shared(self):
+        with self._condition:
+            while self._exclusive or self._waiting:
+                self._condition.wait()
+            self._shared += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._shared -= 1
+                if not self._shared:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        with self._condition:
+            self._waiting += 1
+            while self._exclusive or self._shared:
+                self._condition.wait()
+            self._waiting -= 1
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._exclusive = False
+                self._condition.notify_all()
+
+def _search_lock(segment):
+    with _search_locks_guard:
+        return _search_locks.setdefault(id(segment), SearchLock())
+
+@contextmanager
+def search_params(vector_store, ef_search = None, nprobe = None):
+    """Applies per-query ANN settings to the searches made inside the block.
+
+    ef_search applies to Chroma collections: it is set on the HNSW index for
+    the duration and restored afterwards. Every Chroma search made through
+    this function holds the collection's SearchLock, so searches at the
+    default ef run together and one with another ef runs alone. nprobe
+    applies to flat stores with an IVF index and only affects the current
+    thread.
+    """
+    if getattr(vector_store, "backend", "chroma") == "flat":
+        with probe(nprobe):
+            yield
+        return
+
+    segment = _hnsw_segment(vector_store)
+    index = getattr(segment, "_index", None)
+    if index is None:
+        yield
+        return
+
+    lock = _search_lock(segment)
+    default = segment._params.search_ef
+    if ef_search is None or int(ef_search) == default:
+        with lock.shared():
+            yield
+        return
+
+    with lock.exclusive():
+        index.set_ef(int(ef_search))
+        try:
+            yield
+        finally:
+            index.set_ef(default)
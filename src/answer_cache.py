@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from src.vector_store import corpus_version
+
+
+class SemanticAnswerCache:
+    """Answers keyed by question embedding, matched by cosine similarity.
+
+    A question whose embedding is at least `threshold` similar to a cached
+    one gets that entry's answer and sources back without an LLM call.
+    Entries expire after ttl_seconds, the least recently used are evicted
+    past max_entries, and everything is dropped when the corpus changes.
+    Callers pass store() the corpus_version() read before retrieval, so an
+    answer computed while the corpus changed is not cached as current.
+    """
+
+    def __init__(self, embedding_model, threshold = 0.92, ttl_seconds = 3600, max_entries = 500):
+        self.embedding_model = embedding_model
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._matrix = None
+        self._matrix_ids = []
+        self._corpus_version = corpus_version()
+        self._lock = threading.Lock()
+
+    def _embed(self, question):
+        vector = np.asarray(self.embedding_model.embed_query(question), dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _check_corpus(self):
+        current = corpus_version()
+        if current != self._corpus_version:
+            self._entries.clear()
+            self._matrix = None
+            self._corpus_version = current
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        expired = [entry_id for entry_id, entry in self._entries.items() if entry["created"] < cutoff]
+        for entry_id in expired:
+            del self._entries[entry_id]
+        if expired:
+            self._matrix = None
+
+    def _vectors(self):
+        if self._matrix is None:
+            self._matrix_ids = list(self._entries)
+            if self._matrix_ids:
+                self._matrix = np.stack([self._entries[i]["vector"] for i in self._matrix_ids])
+            else:
+                self._matrix = np.zeros((0, 0), dtype=np.float32)
+        return self._matrix_ids, self._matrix
+
+    def lookup(self, question):
+        vector = self._embed(question)
+        with self._lock:
+            self._check_corpus()
+            self._expire()
+            ids, matrix = self._vectors()
+            if ids:
+                similarities = matrix @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    entry = self._entries[ids[best]]
+                    self._entries.move_to_end(ids[best])
+                    self.hits += 1
+                    self.saved_seconds += entry["latency"]
+                    return {
+                        "answer": entry["answer"],
+                        "sources": entry["sources"],
+                        "docs": entry["docs"],
+                        "scores": entry["scores"],
+                        "question": entry["question"],
+                        "similarity": float(similarities[best]),
+                    }
+            self.misses += 1
+            return None
+
+    def store(self, question, answer, sources, latency, docs = None, scores = None, version = None):
+        vector = self._embed(question)
+        with self._lock:
+            self._check_corpus()
+            if version is not None and version != self._corpus_version:
+                return
+            self._entries[self._next_id] = {
+                "question": question,
+                "vector": vector,
+                "answer": answer,
+                "sources": sources,
+                "docs": docs or [],
+                "scores": scores or [],
+                "latency": latency,
+                "created": time.time(),
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "saved_seconds": self.saved_seconds,
+            "entries": len(self._entries),
+        }
@@ -0,0 +1,193 @@
+import math
+import os
+import re
+import threading
+from collections import Counter
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """Okapi BM25 inverted index that lives next to the Chroma collection.
+
+    Postings are kept per term as parallel numpy arrays of document slots and
+    term frequencies, so a query is a handful of array operations per query
+    term. Documents are added and removed incrementally; removed slots are
+    tombstoned and compacted away once they make up half the index.
+    """
+
+    def __init__(self, path, k1 = 1.5, b = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.ids = []
+        self.slots = {}
+        self.lengths = np.zeros(0, dtype=np.float32)
+        self.alive = np.zeros(0, dtype=bool)
+        self.postings = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return int(self.alive.sum())
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        index = cls(path, **kwargs)
+        if not os.path.exists(path):
+            return index
+
+        with np.load(path) as data:
+            index.ids = data["ids"].tolist()
+            index.lengths = data["lengths"]
+            index.alive = data["alive"]
+            offsets = data["offsets"]
+            docs = data["docs"]
+            tfs = data["tfs"]
+            for i, term in enumerate(data["vocab"].tolist()):
+                start, end = offsets[i], offsets[i + 1]
+                index.postings[term] = (docs[start:end], tfs[start:end])
+        index.slots = {doc_id: slot for slot, doc_id in enumerate(index.ids) if index.alive[slot]}
+        return index
+
+    def save(self):
+        with self._lock:
+            vocab = list(self.postings)
+            offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+            for i, term in enumerate(vocab):
+                offsets[i + 1] = offsets[i] + len(self.postings[term][0])
+            docs = np.concatenate([self.postings[t][0] for t in vocab]) if vocab else np.zeros(0, dtype=np.int32)
+            tfs = np.concatenate([self.postings[t][1] for t in vocab]) if vocab else np.zeros(0, dtype=np.float32)
+
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    ids=np.array(self.ids, dtype=str),
+                    lengths=self.lengths,
+                    alive=self.alive,
+                    vocab=np.array(vocab, dtype=str),
+                    offsets=offsets,
+                    docs=docs,
+                    tfs=tfs,
+                )
+            os.replace(tmp_path, self.path)
+
+    def add(self, ids, texts):
+        with self._lock:
+            self.remove(ids)
+
+            first_slot = len(self.ids)
+            lengths = np.zeros(len(ids), dtype=np.float32)
+            new_postings = {}
+            for offset, (doc_id, text) in enumerate(zip(ids, texts)):
+                slot = first_slot + offset
+                tokens = tokenize(text)
+                lengths[offset] = len(tokens)
+                for term, tf in Counter(tokens).items():
+                    entry = new_postings.setdefault(term, ([], []))
+                    entry[0].append(slot)
+                    entry[1].append(tf)
+                self.ids.append(doc_id)
+                self.slots[doc_id] = slot
+
+            self.lengths = np.concatenate([self.lengths, lengths])
+            self.alive = np.concatenate([self.alive, np.ones(len(ids), dtype=bool)])
+
+            for term, (docs, tfs) in new_postings.items():
+                docs = np.array(docs, dtype=np.int32)
+                tfs = np.array(tfs, dtype=np.float32)
+                if term in self.postings:
+                    old_docs, old_tfs = self.postings[term]
+                    docs = np.concatenate([old_docs, docs])
+                    tfs = np.concatenate([old_tfs, tfs])
+                self.postings[term] = (docs, tfs)
+
+    def remove(self, ids):
+        with self._lock:
+            for doc_id in ids:
+                slot = self.slots.pop(doc_id, None)
+                if slot is not None:
+                    self.alive[slot] = False
+
+            dead = len(self.ids) - len(self.slots)
+            if dead and dead * 2 >= len(self.ids):
+                self._compact()
+
+    def _compact(self):
+        keep = np.flatnonzero(self.alive)
+        remap = np.full(len(self.ids), -1, dtype=np.int32)
+        remap[keep] = np.arange(len(keep), dtype=np.int32)
+
+        postings = {}
+        for term, (docs, tfs) in self.postings.items():
+            mask = self.alive[docs]
+            if mask.any():
+                postings[term] = (remap[docs[mask]], tfs[mask])
+
+        self.postings = postings
+        self.ids = [self.ids[slot] for slot in keep]
+        self.slots = {doc_id: slot for slot, doc_id in enumerate(self.ids)}
+        self.lengths = self.lengths[keep]
+        self.alive = np.ones(len(keep), dtype=bool)
+
+    def search(self, query, k = 4):
+        with self._lock:
+            n_docs = len(self.slots)
+            if n_docs == 0:
+                return []
+
+            avgdl = float(self.lengths[self.alive].mean()) or 1.0
+            scores = np.zeros(len(self.ids), dtype=np.float32)
+
+            for term, qtf in Counter(tokenize(query)).items():
+                if term not in self.postings:
+                    continue
+                docs, tfs = self.postings[term]
+                live = self.alive[docs]
+                docs, tfs = docs[live], tfs[live]
+                if len(docs) == 0:
+                    continue
+                idf = math.log((n_docs - len(docs) + 0.5) / (len(docs) + 0.5) + 1.0)
+                norm = self.k1 * (1.0 - self.b + self.b * self.lengths[docs] / avgdl)
+                scores[docs] += qtf * idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+
+            candidates = np.flatnonzero(scores > 0)
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+            return [(self.ids[slot], float(scores[slot])) for slot in candidates]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_bm25_index(path, vector_store = None):
+    # Loaded on first use and then shared; a store that predates the index is
+    # indexed once from the documents already in Chroma
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = BM25Index.load(path)
+            if not os.path.exists(path) and vector_store is not None:
+                existing = vector_store.get(include=["documents"])
+                if existing["ids"]:
+                    index.add(existing["ids"], existing["documents"])
+                    index.save()
+            _indexes[path] = index
+        return index
+
+def drop_bm25_index(path):
+    with _indexes_lock:
+        _indexes.pop(path, None)
+
+def drop_bm25_indexes(directory):
+    # Every cached index under directory, e.g. all collections of a backend
+    prefix = os.path.join(directory, "")
+    with _indexes_lock:
+        for path in [path for path in _indexes if path.startswith(prefix)]:
+            del _indexes[path]
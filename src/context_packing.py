@@ -0,0 +1,196 @@
+import os
+import re
+from dataclasses import dataclass
+from langchain_core.documents import Document
+
+# 0 or unset keeps the plain format_docs context
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0")) or None
+SEPARATOR = "\n\n---\n\n"
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+_WORD_PATTERN = re.compile(r"\w+")
+
+def estimate_tokens(text):
+    """Approximate BPE token count: long words split every ~5 characters and
+    punctuation is a token of its own. Pass a tokenizer's length function as
+    count_tokens where exact counts matter."""
+    return sum((len(piece) + 4) // 5 for piece in _TOKEN_PATTERN.findall(text))
+
+def source_name(doc):
+    return doc.metadata.get("file_name") or doc.metadata.get("source", "unknown")
+
+def passage_tokens(doc, count_tokens = estimate_tokens):
+    # Counts the passage as format_docs renders it
+    return count_tokens(f"Source: {source_name(doc)}\nContent: {doc.page_content}")
+
+
+@dataclass
+class PackedContext:
+    docs: list
+    tokens: int
+    merged: int = 0
+    duplicates: int = 0
+    over_budget: int = 0
+    truncated: bool = False
+
+
+@dataclass
+class _Passage:
+    rank: int
+    text: str
+    metadata: dict
+    start: int = None
+    end: int = None
+    chunks: int = 1
+
+    def document(self):
+        metadata = dict(self.metadata)
+        if self.start is not None:
+            metadata["start_index"] = self.start
+            metadata["end_index"] = self.end
+        if self.chunks > 1:
+            metadata["merged_chunks"] = self.chunks
+        return Document(page_content=self.text, metadata=metadata)
+
+def _passage(rank, doc):
+    start = doc.metadata.get("start_index")
+    end = doc.metadata.get("end_index")
+    if start is not None and end is None:
+        end = start + len(doc.page_content)
+    return _Passage(rank, doc.page_content, doc.metadata, start, end)
+
+def _merge_by_offsets(passages, max_gap):
+    passages = sorted(passages, key=lambda p: p.start)
+    merged = [passages[0]]
+    for passage in passages[1:]:
+        current = merged[-1]
+        if passage.start > current.end + max_gap:
+            merged.append(passage)
+            continue
+        if passage.end > current.end:
+            overlap = current.end - passage.start
+            # The splitter strips whitespace at chunk edges, so a small gap
+            # between neighbours is whitespace that was dropped
+            current.text += passage.text[overlap:] if overlap >= 0 else " " + passage.text
+            current.end = passage.end
+        current.rank = min(current.rank, passage.rank)
+        current.chunks += passage.chunks
+    return merged
+
+def _overlap(left, right, min_overlap):
+    # Longest suffix of left that is a prefix of right
+    for size in range(min(len(left), len(right)), min_overlap - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+def _merge_by_text(passages, min_overlap):
+    # Chunks ingested without offsets: stitch pairs whose edges overlap
+    passages = list(passages)
+    changed = True
+    while changed:
+        changed = False
+        for a in passages:
+            for b in passages:
+                if a is b:
+                    continue
+                if b.text in a.text:
+                    size = len(b.text)
+                else:
+                    size = _overlap(a.text, b.text, min_overlap)
+                    if not size:
+                        continue
+                a.text += b.text[size:]
+                a.rank = min(a.rank, b.rank)
+                a.chunks += b.chunks
+                passages.remove(b)
+                changed = True
+                break
+            if changed:
+                break
+    return passages
+
+def _shingles(text, size = 3):
+    words = _WORD_PATTERN.findall(text.lower())
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _truncate(doc, budget, count_tokens):
+    # Keeps the longest word prefix that fits, found by bisection
+    words = doc.page_content.split(" ")
+    low, high = 0, len(words)
+    while low < high:
+        mid = (low + high + 1) // 2
+        candidate = Document(page_content=" ".join(words[:mid]), metadata=doc.metadata)
+        if passage_tokens(candidate, count_tokens) <= budget:
+            low = mid
+        else:
+            high = mid - 1
+    return Document(page_content=" ".join(words[:low]), metadata=doc.metadata) if low else None
+
+def pack_context(docs, token_budget = 1500, count_tokens = estimate_tokens, max_gap = 2, min_overlap = 20, duplicate_threshold = 0.8):
+    """Assembles retrieved chunks into as few context tokens as possible.
+
+    docs are expected in relevance order. Chunks from the same source (and
+    page) are merged when their start_index/end_index offsets overlap or
+    touch; chunks stored without offsets are merged where their text
+    overlaps by at least min_overlap characters. A passage whose word
+    3-grams are at least duplicate_threshold contained in a more relevant
+    one is dropped. The rest are added by relevance while they fit in
+    token_budget, counted the way format_docs renders them; if even the
+    most relevant passage does not fit, it is truncated.
+    """
+    groups = {}
+    for rank, doc in enumerate(docs):
+        groups.setdefault((source_name(doc), doc.metadata.get("page")), []).append(_passage(rank, doc))
+
+    passages = []
+    for group in groups.values():
+        with_offsets = [p for p in group if p.start is not None]
+        without_offsets = [p for p in group if p.start is None]
+        if with_offsets:
+            passages.extend(_merge_by_offsets(with_offsets, max_gap))
+        if without_offsets:
+            passages.extend(_merge_by_text(without_offsets, min_overlap))
+    passages.sort(key=lambda p: p.rank)
+
+    kept = []
+    duplicates = 0
+    for passage in passages:
+        shingles = _shingles(passage.text)
+        if any(len(shingles & other) >= duplicate_threshold * len(shingles) for _, other in kept):
+            duplicates += 1
+            continue
+        kept.append((passage, shingles))
+
+    separator_tokens = count_tokens(SEPARATOR)
+    packed = []
+    tokens = 0
+    over_budget = 0
+    truncated = False
+    for passage, _ in kept:
+        doc = passage.document()
+        cost = passage_tokens(doc, count_tokens) + (separator_tokens if packed else 0)
+        if tokens + cost <= token_budget:
+            packed.append(doc)
+            tokens += cost
+        elif not packed:
+            doc = _truncate(doc, token_budget, count_tokens)
+            if doc is not None:
+                packed.append(doc)
+                tokens += passage_tokens(doc, count_tokens)
+                truncated = True
+            else:
+                over_budget += 1
+        else:
+            over_budget += 1
+
+    return PackedContext(
+        docs=packed,
+        tokens=tokens,
+        merged=len(docs) - len(passages),
+        duplicates=duplicates,
+        over_budget=over_budget,
+        truncated=truncated
+    )
@@ -1,31 +1,42 @@
-from langchain_community.document_loaders import PyPDFLoader, TextLoader, WebBaseLoader
 from datetime import datetime
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from itertools import islice
 import os
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+import numpy as np
+from langchain_core.documents import Document
 
-def load_pdf(file_path):
+# The langchain_community loaders are imported where they are used, so that
+# importing this module for chunking alone stays cheap
+
+def load_pdf(file_path, file_name = None):
+    from langchain_community.document_loaders import PyPDFLoader
     loader = PyPDFLoader(file_path)
     documents = loader.load()
 
     for doc in documents:
         doc.metadata["source_type"] = "pdf"
-        doc.metadata["file_name"] = os.path.basename(file_path)
+        doc.metadata["file_name"] = file_name or os.path.basename(file_path)
         doc.metadata["date_loaded"] = datetime.now().isoformat()
 
     return documents
 
-def load_txt(file_path):
+def load_txt(file_path, file_name = None):
+    from langchain_community.document_loaders import TextLoader
     loader = TextLoader(file_path)
     documents = loader.load()
 
     for doc in documents:
         doc.metadata["source_type"] = "txt"
-        doc.metadata["file_name"] = os.path.basename(file_path)
+        doc.metadata["file_name"] = file_name or os.path.basename(file_path)
         doc.metadata["date_loaded"] = datetime.now().isoformat()
 
     return documents
 
 def load_url(url):
+    from langchain_community.document_loaders import WebBaseLoader
     loader = WebBaseLoader(url)
     documents = loader.load()
     
@@ -36,35 +47,246 @@ def load_url(url):
     
     return documents
 
-def chunk_documents(documents, chunk_size = 500, chunk_overlap = 50):
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size = chunk_size,
-        chunk_overlap = chunk_overlap,
-        length_function = len
-    )
+# Whitespace lookup by code point, as str.isspace() sees it. Everything at or
+# above U+3001 maps to the last, non-space entry
+_SPACE_TABLE = np.array([chr(c).isspace() for c in range(0x3001)] + [False])
+
+def word_spans(text):
+    """Start and end offsets of the whitespace-separated words in text, the
+    same words str.split() returns, found with array operations."""
+    codes = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    is_word = np.zeros(len(codes) + 2, dtype=bool)
+    is_word[1:-1] = ~_SPACE_TABLE[np.minimum(codes, len(_SPACE_TABLE) - 1)]
+    edges = np.flatnonzero(is_word[1:] != is_word[:-1])
+    return edges[0::2], edges[1::2], codes
+
+def split_offsets(text, chunk_size = 500, chunk_overlap = 50, count_tokens = None):
+    """(start, end) character spans of the chunks of text.
+
+    Follows RecursiveCharacterTextSplitter's default separators: a chunk
+    ends at the last paragraph break that fits, else the last line break,
+    else the last whole word. Instead of splitting and re-joining
+    substrings, it indexes word and break positions once and walks them, so
+    a chunk is only sliced out of the text at the end. Sizes are characters,
+    or tokens if count_tokens gives the token count of one word. The overlap
+    is whole words, or whole lines and paragraphs when the chunk ended at
+    one. A word longer than chunk_size characters is cut into character
+    windows.
+    """
+    if chunk_overlap > chunk_size:
+        raise ValueError(f"chunk_overlap ({chunk_overlap}) is larger than chunk_size ({chunk_size})")
+    starts, ends, codes = word_spans(text)
+    n = len(starts)
+    if n == 0:
+        return []
+
+    # Newlines in the gap after each word: one is a line break, two or more
+    # a paragraph break
+    newlines = np.flatnonzero(codes == 10)
+    gap_newlines = np.searchsorted(newlines, np.append(starts[1:], len(codes))) - np.searchsorted(newlines, ends)
+    line_ends = np.flatnonzero(gap_newlines >= 1).tolist()
+    paragraph_ends = np.flatnonzero(gap_newlines >= 2).tolist()
+
+    starts, ends = starts.tolist(), ends.tolist()
+    if count_tokens is None:
+        # Sizes are measured on the text spans themselves
+        size_starts, size_ends = starts, ends
+    else:
+        cumulative = np.concatenate(([0], np.cumsum([count_tokens(word) for word in text.split()])))
+        size_starts, size_ends = cumulative[:-1].tolist(), cumulative[1:].tolist()
+
+    offsets = []
+    i = 0
+    previous_end = -1
+    while i < n:
+        # Last word whose end still fits in the chunk
+        j = bisect_right(size_ends, size_starts[i] + chunk_size) - 1
+        cut = None
+        if j < i:
+            if count_tokens is None:
+                step = max(chunk_size - chunk_overlap, 1)
+                for start in range(starts[i], ends[i], step):
+                    offsets.append((start, min(start + chunk_size, ends[i])))
+                    if start + chunk_size >= ends[i]:
+                        break
+                previous_end = i
+                i += 1
+                continue
+            # A single word over the token budget still becomes one chunk
+            j = i
+        elif j < n - 1:
+            # Unless the rest of the text fits, prefer the last paragraph,
+            # then line break in the window, as long as the chunk still moves
+            # past the previous one
+            for breaks in (paragraph_ends, line_ends):
+                p = bisect_right(breaks, j) - 1
+                if p >= 0 and breaks[p] >= i and breaks[p] > previous_end:
+                    j, cut = breaks[p], breaks
+                    break
 
-    chunks = splitter.split_documents(documents)
+        offsets.append((starts[i], ends[j]))
+        if j == n - 1:
+            break
+        previous_end = j
+        # The next chunk starts with the trailing words that fit in the
+        # overlap, or after a break, with the whole lines or paragraphs that do
+        overlap_start = bisect_left(size_starts, size_ends[j] - chunk_overlap)
+        if cut is not None:
+            p = bisect_left(cut, overlap_start - 1)
+            overlap_start = cut[p] + 1 if cut[p] < j else j + 1
+        i = max(overlap_start, i + 1)
+    return offsets
+
+# Builds a Document without pydantic validation. requirements.txt pins
+# langchain-core 0.2, whose models are pydantic v1 (construct); from 0.3 they
+# are pydantic v2, where construct is deprecated in favour of model_construct
+construct_document = getattr(Document, "model_construct", None) or Document.construct
+
+@lru_cache(maxsize=8)
+def token_counter(model_name, cache_size = 1 << 16):
+    """Cached per-word token counts from a Hugging Face tokenizer.
+
+    BERT-style tokenizers split on whitespace before WordPiece, so summing
+    word counts gives the chunk's length without re-tokenizing every
+    candidate chunk. Special tokens ([CLS], [SEP]) are not included.
+    """
+    from transformers import AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+    @lru_cache(maxsize=cache_size)
+    def count(word):
+        return len(tokenizer.encode(word, add_special_tokens=False))
+    return count
+
+def chunk_documents(documents, chunk_size = 500, chunk_overlap = 50, tokenizer = None):
+    # tokenizer is a Hugging Face model name (or a per-word token counting
+    # function) to size chunks in tokens instead of characters
+    count_tokens = token_counter(tokenizer) if isinstance(tokenizer, str) else tokenizer
+    chunks = []
+    for doc in documents:
+        text = doc.page_content
+        for start, end in split_offsets(text, chunk_size, chunk_overlap, count_tokens):
+            # PDF pages keep their "page" from the loader; offsets are into that page
+            metadata = dict(doc.metadata)
+            metadata["start_index"] = start
+            metadata["end_index"] = end
+            # The fields are known to be valid; validating them would halve
+            # the chunker's throughput (see benchmark_chunking)
+            chunks.append(construct_document(page_content=text[start:end], metadata=metadata))
     return chunks
 
-def load_and_chunk(sources: list, chunk_size = 500, chunk_overlap = 50):
-    all_documents = []
+LOADERS = {
+    "pdf": load_pdf,
+    "txt": load_txt,
+    "url": load_url,
+}
 
+# Parsing PDFs and text files is CPU-bound, fetching URLs is I/O-bound
+CPU_SOURCE_TYPES = {"pdf", "txt"}
+
+def load_source(source):
+    # An uploaded file sits at a temporary path; its "name" is the file name
+    # it is stored and shown under
+    if source["type"] in CPU_SOURCE_TYPES:
+        return LOADERS[source["type"]](source["path"], source.get("name"))
+    return LOADERS[source["type"]](source["path"])
+
+def load_and_chunk_source(source, chunk_size = 500, chunk_overlap = 50, tokenizer = None):
+    docs = load_source(source)
+    return chunk_documents(docs, chunk_size=chunk_size, chunk_overlap=chunk_overlap, tokenizer=tokenizer)
+
+def load_and_chunk(sources: list, chunk_size = 500, chunk_overlap = 50, max_workers = None, io_workers = None, tokenizer = None):
+    valid = []
     for source in sources:
-        if source["type"] == "pdf":
-            docs = load_pdf(source["path"])
-        elif source["type"] == "txt":
-            docs = load_txt(source["path"])
-        elif source["type"] == "url":
-            docs = load_url(source["path"])
-        else:
+        if source["type"] not in LOADERS:
             print(f"Unknown source type: {source['type']}, skipping")
             continue
+        valid.append(source)
+
+    cpu_sources = [i for i, source in enumerate(valid) if source["type"] in CPU_SOURCE_TYPES]
+    io_sources = [i for i, source in enumerate(valid) if source["type"] not in CPU_SOURCE_TYPES]
+
+    if max_workers is None:
+        max_workers = min(len(cpu_sources), os.cpu_count() or 1)
+    if io_workers is None:
+        io_workers = min(len(io_sources), 8)
+
+    results = [None] * len(valid)
+
+    # A single source is not worth the pool start-up
+    if len(valid) <= 1:
+        for i, source in enumerate(valid):
+            results[i] = load_and_chunk_source(source, chunk_size, chunk_overlap, tokenizer)
+    else:
+        futures = {}
+        process_pool = ProcessPoolExecutor(max_workers=max_workers) if cpu_sources and max_workers > 1 else None
+        thread_pool = ThreadPoolExecutor(max_workers=max(io_workers, 1)) if io_sources else None
+        try:
+            for i in io_sources:
+                futures[thread_pool.submit(load_and_chunk_source, valid[i], chunk_size, chunk_overlap, tokenizer)] = i
+            for i in cpu_sources:
+                if process_pool is None:
+                    results[i] = load_and_chunk_source(valid[i], chunk_size, chunk_overlap, tokenizer)
+                else:
+                    futures[process_pool.submit(load_and_chunk_source, valid[i], chunk_size, chunk_overlap, tokenizer)] = i
 
-        all_documents.extend(docs)
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+        finally:
+            if process_pool is not None:
+                process_pool.shutdown(cancel_futures=True)
+            if thread_pool is not None:
+                thread_pool.shutdown(cancel_futures=True)
 
-    chunks = chunk_documents(all_documents, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks = []
+    for source_chunks in results:
+        chunks.extend(source_chunks)
     print(f"Total number of chunks after splitting: {len(chunks)}")
 
     return chunks
 
-    
\ No newline at end of file
+def load_sources(sources, max_workers = None, io_workers = None, ahead = None):
+    """Loads sources on the same pools as load_and_chunk and yields
+    (source, docs) in source order.
+
+    At most ahead sources (by default one per worker) are loading or loaded
+    but not yet consumed, so a slow consumer holds back the loading. Each of
+    them is held whole: the loaders return all of a source's documents at
+    once, so memory grows with ahead times the size of the largest source.
+    """
+    sources = list(sources)
+    for source in sources:
+        if source["type"] not in LOADERS:
+            raise ValueError(f"Unknown source type: {source['type']}")
+
+    n_cpu = sum(source["type"] in CPU_SOURCE_TYPES for source in sources)
+    if max_workers is None:
+        max_workers = min(n_cpu, os.cpu_count() or 1)
+    if io_workers is None:
+        io_workers = min(len(sources) - n_cpu, 8)
+    if ahead is None:
+        ahead = max(max_workers + io_workers, 1)
+
+    process_pool = ProcessPoolExecutor(max_workers=max_workers) if n_cpu > 1 and max_workers > 1 else None
+    thread_pool = ThreadPoolExecutor(max_workers=io_workers) if io_workers > 0 else None
+
+    def submit(source):
+        pool = process_pool if source["type"] in CPU_SOURCE_TYPES else thread_pool
+        # Without a pool the source is loaded when it is consumed
+        return pool.submit(load_source, source) if pool is not None else None
+
+    remaining = iter(sources)
+    pending = deque((source, submit(source)) for source in islice(remaining, ahead))
+    try:
+        while pending:
+            source, future = pending.popleft()
+            following = next(remaining, None)
+            if following is not None:
+                pending.append((following, submit(following)))
+            docs = future.result() if future is not None else load_source(source)
+            yield source, docs
+    finally:
+        if process_pool is not None:
+            process_pool.shutdown(cancel_futures=True)
+        if thread_pool is not None:
+            thread_pool.shutdown(cancel_futures=True)
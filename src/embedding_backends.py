@@ -0,0 +1,172 @@
+import json
+import os
+import re
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from src.tracing import span
+
+# torch runs the sentence-transformers model as is; onnx runs an exported
+# graph with onnxruntime; the -int8 variants quantize the weights of the
+# linear layers / MatMuls dynamically
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+ONNX_CACHE_PATH = os.getenv("ONNX_CACHE_PATH", ".onnx_cache")
+INPUT_NAMES = ("input_ids", "attention_mask", "token_type_ids")
+
+_export_lock = threading.Lock()
+
+def length_batches(lengths, batch_size, sort = True):
+    # Longest first, so each batch is padded only to its own longest text
+    order = np.argsort(-np.asarray(lengths), kind="stable") if sort else np.arange(len(lengths))
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+def mean_pool(hidden, attention_mask, normalize = True):
+    mask = attention_mask[:, :, None].astype(hidden.dtype)
+    pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+    if normalize:
+        pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+    return pooled
+
+def cosine_parity(reference, candidate, texts):
+    """Cosine similarity between two backends' vectors for the same texts."""
+    a = np.asarray(reference.embed_documents(texts), dtype=np.float64)
+    b = np.asarray(candidate.embed_documents(texts), dtype=np.float64)
+    cosine = (a * b).sum(axis=1) / np.maximum(np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1), 1e-12)
+    return {"texts": len(texts), "min_cosine": float(cosine.min()), "mean_cosine": float(cosine.mean())}
+
+
+class OnnxEmbeddings(Embeddings):
+    """Mean-pooled sentence embeddings from an exported transformer graph.
+
+    Texts are tokenized together, sorted by length and run in batches of
+    batch_size, so short texts are not padded to the longest one in the call.
+    Only onnxruntime and tokenizers are needed at run time, not torch.
+    """
+
+    def __init__(self, model_path, tokenizer_path, max_length = 256, batch_size = 32, threads = None, normalize = True,
+                 sort_by_length = True):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [graph_input.name for graph_input in self.session.get_inputs()]
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(max_length)
+        self.batch_size = batch_size
+        self.normalize = normalize
+        self.sort_by_length = sort_by_length
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        ids = [encoding.ids for encoding in self.tokenizer.encode_batch(list(texts))]
+        vectors = [None] * len(ids)
+        for batch in length_batches([len(row) for row in ids], self.batch_size, self.sort_by_length):
+            width = max(len(ids[i]) for i in batch)
+            input_ids = np.zeros((len(batch), width), dtype=np.int64)
+            attention_mask = np.zeros((len(batch), width), dtype=np.int64)
+            for row, i in enumerate(batch):
+                input_ids[row, :len(ids[i])] = ids[i]
+                attention_mask[row, :len(ids[i])] = 1
+            # Single sentences have all-zero token types
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask, "token_type_ids": np.zeros_like(input_ids)}
+            hidden = self.session.run(None, {name: feeds[name] for name in self.input_names})[0]
+            for row, vector in zip(batch, mean_pool(hidden, attention_mask, self.normalize)):
+                vectors[row] = vector
+        return np.stack(vectors).tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def export_dir(model_name, cache_path = ONNX_CACHE_PATH):
+    return os.path.join(cache_path, re.sub(r"[^\w.-]+", "--", model_name).strip("-"))
+
+def export_onnx(model_name, directory):
+    """Exports the transformer of a mean-pooling sentence-transformers model
+    to directory/model.onnx, with its tokenizer and max_seq_length."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device="cpu")
+    if not getattr(model[1], "pooling_mode_mean_tokens", False):
+        raise ValueError(f"{model_name} does not use mean pooling")
+    example = model.tokenizer(["an example sentence"], return_tensors="pt")
+    names = [name for name in INPUT_NAMES if name in example]
+
+    class Encoder(torch.nn.Module):
+        def __init__(self, transformer):
+            super().__init__()
+            self.transformer = transformer
+
+        def forward(self, *inputs):
+            return self.transformer(**dict(zip(names, inputs))).last_hidden_state
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "model.onnx")
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in (*names, "last_hidden_state")}
+    with torch.no_grad():
+        torch.onnx.export(Encoder(model[0].auto_model.eval()), tuple(example[name] for name in names), path + ".tmp",
+                          input_names=names, output_names=["last_hidden_state"], dynamic_axes=dynamic_axes,
+                          opset_version=17, dynamo=False)
+    model.tokenizer.save_pretrained(directory)
+    with open(os.path.join(directory, "export.json"), "w") as f:
+        json.dump({"model_name": model_name, "max_seq_length": model.max_seq_length}, f)
+    # Written last, so an interrupted export is redone rather than half-used
+    os.replace(path + ".tmp", path)
+    return path
+
+def quantize_onnx(path, quantized_path):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(path, quantized_path + ".tmp", weight_type=QuantType.QInt8)
+    os.replace(quantized_path + ".tmp", quantized_path)
+    return quantized_path
+
+def load_onnx(model_name, quantize = False, batch_size = 32, threads = None, normalize = True, cache_path = ONNX_CACHE_PATH):
+    # Exported and quantized once, then loaded from cache_path
+    directory = export_dir(model_name, cache_path)
+    path = os.path.join(directory, "model.onnx")
+    with _export_lock:
+        if not os.path.exists(path):
+            with span("onnx_export", model=model_name):
+                export_onnx(model_name, directory)
+        if quantize:
+            quantized_path = os.path.join(directory, "model-int8.onnx")
+            if not os.path.exists(quantized_path):
+                with span("onnx_quantize", model=model_name):
+                    quantize_onnx(path, quantized_path)
+            path = quantized_path
+
+    with open(os.path.join(directory, "export.json")) as f:
+        max_length = json.load(f)["max_seq_length"]
+    return OnnxEmbeddings(path, os.path.join(directory, "tokenizer.json"), max_length, batch_size, threads, normalize)
+
+def load_torch(model_name, model_kwargs, encode_kwargs, quantize = False, batch_size = 32, threads = None):
+    # sentence-transformers already sorts each call's texts by length
+    import torch
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    if threads:
+        torch.set_num_threads(threads)
+    embeddings = HuggingFaceEmbeddings(model_name=model_name, model_kwargs=model_kwargs,
+                                       encode_kwargs={**encode_kwargs, "batch_size": batch_size})
+    if quantize:
+        # The linear layers hold nearly all of the weights and compute
+        torch.ao.quantization.quantize_dynamic(embeddings.client, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return embeddings
+
+def load_backend(backend, model_name, model_kwargs, encode_kwargs, batch_size = 32, threads = None, cache_path = ONNX_CACHE_PATH):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend}. Choose from {', '.join(BACKENDS)}")
+    quantize = backend.endswith("-int8")
+    if backend.startswith("onnx"):
+        normalize = encode_kwargs.get("normalize_embeddings", False)
+        return load_onnx(model_name, quantize, batch_size, threads, normalize, cache_path)
+    return load_torch(model_name, model_kwargs, encode_kwargs, quantize, batch_size, threads)
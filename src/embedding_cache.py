@@ -0,0 +1,112 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_CACHE_PATH = ".embedding_cache"
+
+
+class CachedEmbeddings(Embeddings):
+    """Content-addressed cache in front of another embedding model.
+
+    Vectors are keyed by sha256(model name, normalize flag, text), stored as
+    float32 blobs in a SQLite file and mirrored in a bounded in-memory LRU.
+    Only texts missing from both are sent to the wrapped model, in one batch.
+    """
+
+    def __init__(self, embedding_model, model_name, normalize = True, cache_path = EMBEDDING_CACHE_PATH, memory_size = 10000):
+        self.embedding_model = embedding_model
+        self.model_name = model_name
+        self.normalize = normalize
+        self.memory_size = memory_size
+        self.hits = 0
+        self.misses = 0
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_path, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(cache_path, "embeddings.sqlite"), check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+        self._db.commit()
+
+    def _key(self, text):
+        raw = f"{self.model_name}\x00{int(self.normalize)}\x00{text}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, keys):
+        found = {}
+        missing = []
+        for key in keys:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                found[key] = self._memory[key]
+            else:
+                missing.append(key)
+
+        # SQLite caps bound parameters, so query the disk store in slices
+        for i in range(0, len(missing), 500):
+            batch = missing[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._db.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch)
+            for key, blob in rows:
+                vector = array("f")
+                vector.frombytes(blob)
+                vector = vector.tolist()
+                found[key] = vector
+                self._remember(key, vector)
+        return found
+
+    def embed_documents(self, texts):
+        keys = [self._key(text) for text in texts]
+
+        with self._lock:
+            found = self._lookup(set(keys))
+
+        miss_texts = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in miss_texts:
+                miss_texts[key] = text
+
+        if miss_texts:
+            vectors = self.embedding_model.embed_documents(list(miss_texts.values()))
+            with self._lock:
+                rows = []
+                for key, vector in zip(miss_texts.keys(), vectors):
+                    vector = list(vector)
+                    found[key] = vector
+                    self._remember(key, vector)
+                    rows.append((key, array("f", vector).tobytes()))
+                self._db.executemany("INSERT OR IGNORE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+                self._db.commit()
+
+        with self._lock:
+            self.misses += len(miss_texts)
+            self.hits += len(texts) - len(miss_texts)
+
+        return [found[key] for key in keys]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
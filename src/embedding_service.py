@@ -0,0 +1,272 @@
+import argparse
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from src.tracing import span
+
+DEFAULT_MAX_BATCH_SIZE = 32
+DEFAULT_MAX_WAIT_MS = 2.0
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """Encodes concurrent embedding requests together on one worker thread.
+
+    The worker takes the first waiting request, then keeps collecting until
+    the batch holds max_batch_size texts or max_wait_ms has passed, and
+    encodes everything with a single embed_documents call. Requests that
+    queue up while a batch is encoding go into the next one, so under load
+    batches fill without waiting; max_wait_ms = 0 only takes what is already
+    queued. A request is never split, so one larger than max_batch_size is
+    encoded on its own. Queries are encoded with embed_documents, which is
+    the same computation for sentence-transformers models.
+    """
+
+    def __init__(self, embedding_model, max_batch_size = DEFAULT_MAX_BATCH_SIZE, max_wait_ms = DEFAULT_MAX_WAIT_MS):
+        self.embedding_model = embedding_model
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.batches = 0
+        self.texts = 0
+
+        self._queue = queue.Queue()
+        self._carry = None
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, texts):
+        future = Future()
+        texts = list(texts)
+        if not texts:
+            future.set_result([])
+        else:
+            self._queue.put((texts, future))
+        return future
+
+    def embed(self, texts):
+        return self.submit(texts).result()
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "mean_batch_size": self.texts / self.batches if self.batches else 0.0,
+        }
+
+    def _collect(self):
+        first = self._carry if self._carry is not None else self._queue.get()
+        self._carry = None
+        if first is _STOP:
+            return [], True
+
+        batch = [first]
+        size = len(first[0])
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while size < self.max_batch_size:
+            try:
+                timeout = deadline - time.monotonic()
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            if size + len(item[0]) > self.max_batch_size:
+                self._carry = item
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch, False
+
+    def _encode(self, batch):
+        texts = [text for request_texts, _ in batch for text in request_texts]
+        try:
+            with span("embedding_batch", requests=len(batch), texts=len(texts)):
+                vectors = self.embedding_model.embed_documents(texts)
+        except Exception as error:
+            for _, future in batch:
+                future.set_exception(error)
+            return
+
+        self.batches += 1
+        self.texts += len(texts)
+        start = 0
+        for request_texts, future in batch:
+            future.set_result(vectors[start:start + len(request_texts)])
+            start += len(request_texts)
+
+    def _run(self):
+        while True:
+            batch, stop = self._collect()
+            if batch:
+                self._encode(batch)
+            if stop:
+                return
+
+
+class BatchedEmbeddings(Embeddings):
+    """Embeddings client for a MicroBatcher in the same process."""
+
+    def __init__(self, batcher):
+        self.batcher = batcher
+
+    @property
+    def embedding_model(self):
+        # Lets startup.warm_up() find the model behind the batcher
+        return self.batcher.embedding_model
+
+    def embed_documents(self, texts):
+        return self.batcher.embed(texts)
+
+    def embed_query(self, text):
+        return self.batcher.embed([text])[0]
+
+
+# Wire format: two big-endian uint32 lengths, a JSON header and a binary
+# payload. Requests are {"texts": [...]}; responses are {"count", "dim"}
+# followed by count*dim float32 values, or {"error": message}
+def _send(sock, header, payload = b""):
+    data = json.dumps(header).encode("utf-8")
+    sock.sendall(struct.pack("!II", len(data), len(payload)) + data + payload)
+
+def _recv_exact(sock, size):
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(size - len(buffer))
+        if not chunk:
+            raise ConnectionError("embedding service closed the connection")
+        buffer.extend(chunk)
+    return bytes(buffer)
+
+def _recv(sock):
+    header_size, payload_size = struct.unpack("!II", _recv_exact(sock, 8))
+    header = json.loads(_recv_exact(sock, header_size))
+    return header, _recv_exact(sock, payload_size) if payload_size else b""
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                header, _ = _recv(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                vectors = np.asarray(self.server.batcher.embed(header["texts"]), dtype=np.float32)
+            except Exception as error:
+                _send(self.request, {"error": f"{type(error).__name__}: {error}"})
+                continue
+            dim = vectors.shape[1] if vectors.ndim == 2 else 0
+            _send(self.request, {"count": len(vectors), "dim": dim}, vectors.tobytes())
+
+
+class EmbeddingServer(socketserver.ThreadingUnixStreamServer):
+    """Serves a MicroBatcher on a Unix socket, one thread per connection.
+
+    Several app processes can then share one copy of the model, and their
+    concurrent requests are batched together.
+    """
+
+    daemon_threads = True
+    # Every client thread holds a connection, so allow a burst of connects
+    request_queue_size = 128
+
+    def __init__(self, path, embedding_model, max_batch_size = DEFAULT_MAX_BATCH_SIZE, max_wait_ms = DEFAULT_MAX_WAIT_MS):
+        if os.path.exists(path):
+            os.unlink(path)
+        self.path = path
+        self.batcher = MicroBatcher(embedding_model, max_batch_size, max_wait_ms)
+        super().__init__(path, _Handler)
+
+    def start(self):
+        # Serves from a background thread, for running inside another process
+        thread = threading.Thread(target=self.serve_forever, name="embedding-server", daemon=True)
+        thread.start()
+        return thread
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+        self.batcher.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class SocketEmbeddingClient(Embeddings):
+    """Embeddings client for an EmbeddingServer. Each thread keeps its own
+    connection, so concurrent callers reach the server's batcher together."""
+
+    def __init__(self, path, timeout = 60.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            # Connect blocking: with a timeout set, a full listen backlog
+            # fails with EAGAIN instead of waiting
+            sock.connect(self.path)
+            sock.settimeout(self.timeout)
+            self._local.sock = sock
+        return sock
+
+    def _request(self, texts):
+        sock = self._connection()
+        try:
+            _send(sock, {"texts": texts})
+            return _recv(sock)
+        except (ConnectionError, OSError):
+            # Drop the broken connection; the next call reconnects
+            sock.close()
+            self._local.sock = None
+            raise
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        if not texts:
+            return []
+        header, payload = self._request(texts)
+        if "error" in header:
+            raise RuntimeError(f"Embedding service error: {header['error']}")
+        return np.frombuffer(payload, dtype=np.float32).reshape(header["count"], header["dim"]).tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the embedding model on a Unix socket with micro-batching")
+    parser.add_argument("--socket", default="/tmp/rag-embeddings.sock")
+    parser.add_argument("--max-batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS)
+    parser.add_argument("--backend", default=None, help="embedding backend, EMBEDDING_BACKEND by default")
+    args = parser.parse_args()
+
+    from src.embeddings import EMBEDDING_BACKEND, load_embedding_model
+    # Clients keep their own embedding cache, so the server encodes directly
+    embedding_model = load_embedding_model(use_cache=False, lazy=False, service=None, backend=args.backend or EMBEDDING_BACKEND)
+    server = EmbeddingServer(args.socket, embedding_model, args.max_batch_size, args.max_wait_ms)
+    print(f"Embedding service listening on {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,93 @@
-from langchain_community.embeddings import HuggingFaceEmbeddings
+import os
+import threading
+from functools import partial
+from langchain_core.embeddings import Embeddings
+from src.embedding_backends import load_backend
+from src.embedding_cache import CachedEmbeddings, EMBEDDING_CACHE_PATH
+from src.embedding_service import BatchedEmbeddings, MicroBatcher, SocketEmbeddingClient
+from src.tracing import span
 
-def load_embedding_model():
-    embedding_model = HuggingFaceEmbeddings(
-        model_name="all-MiniLM-L6-v2",
-        model_kwargs={"device": "cpu"},
-        encode_kwargs={"normalize_embeddings": True}
+MODEL_NAME = "all-MiniLM-L6-v2"
+MODEL_KWARGS = {"device": "cpu"}
+ENCODE_KWARGS = {"normalize_embeddings": True}
+# "thread" shares one micro-batching model per process, "unix:<path>" uses
+# an embedding service (python -m src.embedding_service) on that socket
+EMBEDDING_SERVICE = os.getenv("EMBEDDING_SERVICE") or None
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "32"))
+EMBEDDING_MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "2"))
+# torch, torch-int8, onnx or onnx-int8 (see src.embedding_backends), with
+# the encode batch size and CPU threads (0 keeps the runtime's default)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0")) or None
+
+def _load_huggingface(backend = EMBEDDING_BACKEND):
+    # The torch backends pull in torch, which dominates start-up time
+    with span("embedding_model_load", model=MODEL_NAME, backend=backend):
+        return load_backend(backend, MODEL_NAME, MODEL_KWARGS, ENCODE_KWARGS, EMBEDDING_BATCH_SIZE, EMBEDDING_THREADS)
+
+
+class LazyEmbeddings(Embeddings):
+    """Builds the wrapped model with factory on first use.
+
+    load() can be called ahead of time, e.g. from a warm-up thread; callers
+    that arrive while it is loading wait for the same model instead of
+    loading a second one.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def load(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self.factory()
+        return self._model
+
+    def embed_documents(self, texts):
+        return self.load().embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.load().embed_query(text)
+
+
+_shared_batchers = {}
+_shared_lock = threading.Lock()
+
+def shared_batcher(backend = EMBEDDING_BACKEND):
+    # One batcher per process and backend, so every session's requests batch together
+    with _shared_lock:
+        if backend not in _shared_batchers:
+            model = LazyEmbeddings(partial(_load_huggingface, backend))
+            _shared_batchers[backend] = MicroBatcher(model, EMBEDDING_MAX_BATCH, EMBEDDING_MAX_WAIT_MS)
+    return _shared_batchers[backend]
+
+def load_embedding_model(use_cache = True, cache_path = EMBEDDING_CACHE_PATH, lazy = True, service = EMBEDDING_SERVICE,
+                         backend = EMBEDDING_BACKEND):
+    # With lazy=True the model is loaded by the first embedding call that
+    # misses the cache, or by startup.warm_up()
+    if service == "thread":
+        embedding_model = BatchedEmbeddings(shared_batcher(backend))
+    elif service and service.startswith("unix:"):
+        embedding_model = SocketEmbeddingClient(service[len("unix:"):])
+    elif service:
+        raise ValueError(f"Unknown embedding service: {service}")
+    else:
+        embedding_model = LazyEmbeddings(partial(_load_huggingface, backend)) if lazy else _load_huggingface(backend)
+    if not use_cache:
+        return embedding_model
+
+    # Quantized backends give slightly different vectors, so they get their own cache entries
+    return CachedEmbeddings(
+        embedding_model,
+        model_name=MODEL_NAME if backend == "torch" else f"{MODEL_NAME}:{backend}",
+        normalize=ENCODE_KWARGS["normalize_embeddings"],
+        cache_path=cache_path
     )
-    return embedding_model
\ No newline at end of file
@@ -0,0 +1,651 @@
+import contextvars
+import json
+import os
+import shutil
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Any, Iterable, List, Optional
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from src.mmr import mmr_by_vector
+
+VECTORS_FILE = "vectors.f32"
+SIDECAR_FILE = "meta.jsonl"
+INFO_FILE = "info.json"
+IVF_CENTROIDS_FILE = "ivf_centroids.npy"
+IVF_ASSIGN_FILE = "ivf_assign.i32"
+# Lists the rewritten files of a compaction; its presence commits them
+COMPACT_FILE = "compact.json"
+# Rows scored per matrix product, bounds the temporary distance matrix
+BLOCK_ROWS = 65536
+QUANTIZATION_MODES = (None, "int8", "binary")
+# int8 codes are widened to float32 a few thousand rows at a time so the
+# temporary stays in cache
+INT8_SUBBLOCK = 4096
+
+def _grow(array, size):
+    if size <= len(array):
+        return array
+    grown = np.zeros((max(size, 2 * len(array), 1024),) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+def check_where(where):
+    if any(key.startswith("$") or isinstance(value, dict) for key, value in (where or {}).items()):
+        raise ValueError("The flat store only supports equality filters on metadata keys")
+
+def matches(metadata, where):
+    metadata = metadata or {}
+    return all(metadata.get(key) == value for key, value in where.items())
+
+def quantize_int8(vectors):
+    # Symmetric per-row scale, so a dot product is codes . query * scale
+    scale = np.abs(vectors).max(axis=1) / 127
+    scale[scale == 0] = 1.0
+    codes = np.round(vectors / scale[:, None]).astype(np.int8)
+    return codes, scale.astype(np.float32)
+
+def quantize_binary(vectors):
+    # Sign bits packed into uint16 words, padded to a whole word
+    packed = np.packbits(vectors > 0, axis=1)
+    if packed.shape[1] % 2:
+        packed = np.pad(packed, ((0, 0), (0, 1)))
+    return np.ascontiguousarray(packed).view(np.uint16)
+
+# Per-query override of how many IVF lists to scan, see probe()
+_nprobe = contextvars.ContextVar("flat_nprobe", default=None)
+
+@contextmanager
+def probe(nprobe):
+    token = _nprobe.set(nprobe)
+    try:
+        yield
+    finally:
+        _nprobe.reset(token)
+
+def kmeans(vectors, n_clusters, iterations = 10, seed = 0):
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assign = nearest_centroid(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        counts = np.bincount(assign, minlength=n_clusters)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Empty clusters restart from random points instead of dying out
+        centroids[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()))]
+    return centroids
+
+def nearest_centroid(vectors, centroids):
+    dist = np.einsum("ij,ij->i", centroids, centroids)[None, :] - 2 * (vectors @ centroids.T)
+    return np.argmin(dist, axis=1).astype(np.int32)
+
+if hasattr(np, "bitwise_count"):
+    def hamming(codes, bits):
+        return np.bitwise_count(np.bitwise_xor(codes, bits)).sum(axis=1, dtype=np.int32)
+else:
+    _POPCOUNT16 = np.array([bin(i).count("1") for i in range(1 << 16)], dtype=np.uint8)
+
+    def hamming(codes, bits):
+        return _POPCOUNT16[np.bitwise_xor(codes, bits)].sum(axis=1, dtype=np.int32)
+
+
+class FlatCollection:
+    """Exact search over float32 vectors in an append-only, memory-mapped file.
+
+    Row i of vectors.f32 belongs to line i of the meta.jsonl sidecar (id,
+    document, metadata). Upserting an existing id appends a new row and
+    retires the old one; deletes are appended as tombstone lines. Nothing is
+    rewritten in place, so the OS page cache does the work of keeping hot
+    vectors in memory. Once retired rows make up half the file, both files
+    are rewritten with only the live rows.
+
+    query/get/upsert/delete/count return the same shapes as a Chroma
+    collection, so code written against vector_store._collection works with
+    either backend. Distances are squared L2, Chroma's default. where filters
+    match metadata keys by equality, in get, query and delete alike.
+
+    With quantization set to "int8" or "binary", the first pass scores
+    in-memory int8 codes (4x smaller) or sign bits by Hamming distance (32x
+    smaller) and keeps oversample * n candidates. Only those rows are then
+    read from the memory map and rescored at full precision. Codes are built
+    on first use and kept up to date on upsert.
+
+    build_ivf() partitions the rows with k-means; queries then only scan the
+    nprobe nearest lists (per query with probe()). New rows are assigned to
+    the nearest existing centroid, so rebuild after the data drifts a lot.
+    """
+
+    def __init__(self, path, quantization = None, oversample = 4, nprobe = 8):
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization: {quantization}")
+        self.path = path
+        self.quantization = quantization
+        self.oversample = oversample
+        self.nprobe = nprobe
+        self.dim = None
+        self.ids = []
+        self.documents = []
+        self.metadatas = []
+        self.row_of = {}
+        self._rows = 0
+        self._alive = np.zeros(0, dtype=bool)
+        self._sq_norms = np.zeros(0, dtype=np.float32)
+        self._mmap = None
+        self._codes = {}
+        self._centroids = None
+        self._assign = np.zeros(0, dtype=np.int32)
+        self._lists = None
+        self._lock = threading.RLock()
+        self._load()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        if not os.path.exists(self._file(INFO_FILE)):
+            return
+        if os.path.exists(self._file(COMPACT_FILE)):
+            # A compaction was committed but not all files were swapped in
+            self._swap_compacted()
+        with open(self._file(INFO_FILE)) as f:
+            self.dim = json.load(f)["dim"]
+
+        # Vectors are written before their sidecar lines, so vectors past the
+        # last complete line belong to a batch that never finished
+        row_bytes = 4 * self.dim
+        stored = os.path.getsize(self._file(VECTORS_FILE)) // row_bytes
+        self._alive = np.zeros(stored, dtype=bool)
+        # Bytes of the sidecar that were read; a torn line past them is cut
+        # off, so later appends do not land after half a record
+        complete = 0
+        with open(self._file(SIDECAR_FILE), "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # torn write from a crash
+                entry = json.loads(line)
+                if "delete" in entry:
+                    self._retire(entry["delete"])
+                    complete += len(line)
+                    continue
+                if self._rows == stored:
+                    break
+                complete += len(line)
+                self._retire(entry["id"])
+                self.ids.append(entry["id"])
+                self.documents.append(entry["document"])
+                self.metadatas.append(entry["metadata"])
+                self.row_of[entry["id"]] = self._rows
+                self._alive[self._rows] = True
+                self._rows += 1
+        if os.path.getsize(self._file(SIDECAR_FILE)) > complete:
+            os.truncate(self._file(SIDECAR_FILE), complete)
+        if stored > self._rows:
+            os.truncate(self._file(VECTORS_FILE), self._rows * row_bytes)
+            self._alive = self._alive[:self._rows]
+
+        vectors = self._vectors()
+        self._sq_norms = np.zeros(self._rows, dtype=np.float32)
+        for start in range(0, self._rows, BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + BLOCK_ROWS])
+            self._sq_norms[start:start + len(block)] = np.einsum("ij,ij->i", block, block)
+
+        if os.path.exists(self._file(IVF_CENTROIDS_FILE)):
+            self._centroids = np.load(self._file(IVF_CENTROIDS_FILE))
+            assign = np.fromfile(self._file(IVF_ASSIGN_FILE), dtype=np.int32)[:self._rows]
+            if len(assign) < self._rows:
+                # Rows whose assignment was not written before a crash
+                missing = nearest_centroid(np.asarray(vectors[len(assign):]), self._centroids)
+                assign = np.concatenate([assign, missing])
+                assign.tofile(self._file(IVF_ASSIGN_FILE))
+            self._assign = assign
+
+    def _retire(self, doc_id):
+        row = self.row_of.pop(doc_id, None)
+        if row is not None:
+            self._alive[row] = False
+
+    def _vectors(self):
+        # Remapped after appends; readers keep whichever map they were handed
+        if self._rows == 0:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        if self._mmap is None or len(self._mmap) != self._rows:
+            self._mmap = np.memmap(self._file(VECTORS_FILE), dtype=np.float32, mode="r", shape=(self._rows, self.dim))
+        return self._mmap
+
+    def count(self):
+        return len(self.row_of)
+
+    def upsert(self, ids, embeddings, documents = None, metadatas = None):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError("Expected one embedding per id")
+        documents = documents if documents is not None else [None] * len(ids)
+        metadatas = metadatas if metadatas is not None else [None] * len(ids)
+
+        with self._lock:
+            if self.dim is None:
+                os.makedirs(self.path, exist_ok=True)
+                self.dim = vectors.shape[1]
+                with open(self._file(INFO_FILE), "w") as f:
+                    json.dump({"dim": self.dim}, f)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the store's {self.dim}")
+
+            with open(self._file(VECTORS_FILE), "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self._file(SIDECAR_FILE), "a") as f:
+                for doc_id, document, metadata in zip(ids, documents, metadatas):
+                    f.write(json.dumps({"id": doc_id, "document": document, "metadata": metadata}) + "\n")
+
+            first = self._rows
+            self._rows += len(ids)
+            self._alive = _grow(self._alive, self._rows)
+            self._sq_norms = _grow(self._sq_norms, self._rows)
+            self._sq_norms[first:self._rows] = np.einsum("ij,ij->i", vectors, vectors)
+            if "int8" in self._codes:
+                codes, scale = quantize_int8(vectors)
+                self._codes["int8"] = (_grow(self._codes["int8"][0], self._rows), _grow(self._codes["int8"][1], self._rows))
+                self._codes["int8"][0][first:self._rows] = codes
+                self._codes["int8"][1][first:self._rows] = scale
+            if "binary" in self._codes:
+                self._codes["binary"] = _grow(self._codes["binary"], self._rows)
+                self._codes["binary"][first:self._rows] = quantize_binary(vectors)
+            if self._centroids is not None:
+                assign = nearest_centroid(vectors, self._centroids)
+                with open(self._file(IVF_ASSIGN_FILE), "ab") as f:
+                    f.write(assign.tobytes())
+                self._assign = _grow(self._assign, self._rows)
+                self._assign[first:self._rows] = assign
+                self._lists = None
+            for offset, (doc_id, document, metadata) in enumerate(zip(ids, documents, metadatas)):
+                self._retire(doc_id)
+                self.ids.append(doc_id)
+                self.documents.append(document)
+                self.metadatas.append(metadata)
+                self.row_of[doc_id] = first + offset
+                self._alive[first + offset] = True
+            self._maybe_compact()
+
+    add = upsert
+
+    def delete(self, ids = None, where = None):
+        with self._lock:
+            if where is not None:
+                ids = list(ids or []) + self.get(where=where, include=[])["ids"]
+            ids = [doc_id for doc_id in (ids or []) if doc_id in self.row_of]
+            if not ids:
+                return
+            with open(self._file(SIDECAR_FILE), "a") as f:
+                for doc_id in ids:
+                    f.write(json.dumps({"delete": doc_id}) + "\n")
+            for doc_id in ids:
+                self._retire(doc_id)
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        dead = self._rows - len(self.row_of)
+        if dead and dead * 2 >= self._rows:
+            self._compact()
+
+    def _compact(self):
+        # The live rows are written to .new files first; writing COMPACT_FILE
+        # commits them, so a crash leaves either the old or the new set
+        keep = np.flatnonzero(self._alive[:self._rows])
+        vectors = self._vectors()
+        with open(self._file(VECTORS_FILE + ".new"), "wb") as f:
+            for start in range(0, len(keep), BLOCK_ROWS):
+                f.write(np.asarray(vectors[keep[start:start + BLOCK_ROWS]]).tobytes())
+        with open(self._file(SIDECAR_FILE + ".new"), "w") as f:
+            for row in keep:
+                f.write(json.dumps({"id": self.ids[row], "document": self.documents[row], "metadata": self.metadatas[row]}) + "\n")
+        names = [VECTORS_FILE, SIDECAR_FILE]
+        if self._centroids is not None:
+            self._assign[keep].tofile(self._file(IVF_ASSIGN_FILE + ".new"))
+            names.append(IVF_ASSIGN_FILE)
+        with open(self._file(COMPACT_FILE + ".tmp"), "w") as f:
+            json.dump(names, f)
+        os.replace(self._file(COMPACT_FILE + ".tmp"), self._file(COMPACT_FILE))
+        self._swap_compacted()
+
+        # New lists and arrays rather than in-place edits, so a search that
+        # started before the compaction keeps a consistent view of the old rows
+        self.ids = [self.ids[row] for row in keep]
+        self.documents = [self.documents[row] for row in keep]
+        self.metadatas = [self.metadatas[row] for row in keep]
+        self.row_of = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self._rows = len(keep)
+        self._alive = np.ones(self._rows, dtype=bool)
+        self._sq_norms = self._sq_norms[keep]
+        if "int8" in self._codes:
+            self._codes["int8"] = (self._codes["int8"][0][keep], self._codes["int8"][1][keep])
+        if "binary" in self._codes:
+            self._codes["binary"] = self._codes["binary"][keep]
+        if self._centroids is not None:
+            self._assign = self._assign[keep]
+            self._lists = None
+        self._mmap = None
+
+    def _swap_compacted(self):
+        with open(self._file(COMPACT_FILE)) as f:
+            names = json.load(f)
+        for name in names:
+            if os.path.exists(self._file(name + ".new")):
+                os.replace(self._file(name + ".new"), self._file(name))
+        os.remove(self._file(COMPACT_FILE))
+
+    def destroy(self):
+        with self._lock:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.__init__(self.path, self.quantization, self.oversample, self.nprobe)
+
+    def _view(self):
+        # Row numbers stay valid against this view even if a compaction
+        # renumbers the rows afterwards
+        return self.ids, self.documents, self.metadatas, self._vectors()
+
+    def _rows_result(self, rows, include, distances = None, view = None):
+        ids, documents, metadatas, vectors = view or self._view()
+        result = {"ids": [ids[row] for row in rows]}
+        if "documents" in include:
+            result["documents"] = [documents[row] for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [metadatas[row] for row in rows]
+        if "embeddings" in include:
+            result["embeddings"] = np.asarray(vectors[np.asarray(rows, dtype=np.int64)]) if rows else []
+        if "distances" in include and distances is not None:
+            result["distances"] = [float(d) for d in distances]
+        return result
+
+    def get(self, ids = None, where = None, include = ("documents", "metadatas"), limit = None, offset = None):
+        check_where(where)
+        with self._lock:
+            if ids is not None:
+                rows = [self.row_of[doc_id] for doc_id in ids if doc_id in self.row_of]
+            else:
+                rows = sorted(self.row_of.values())
+            if where:
+                rows = [row for row in rows if matches(self.metadatas[row], where)]
+            rows = rows[offset or 0:]
+            if limit is not None:
+                rows = rows[:limit]
+            return self._rows_result(rows, include)
+
+    def _ensure_codes(self, mode):
+        if mode is None or mode in self._codes:
+            return
+        vectors = self._vectors()
+        if mode == "int8":
+            codes = np.zeros((self._rows, self.dim or 0), dtype=np.int8)
+            scale = np.zeros(self._rows, dtype=np.float32)
+        else:
+            codes = np.zeros((self._rows, ((self.dim or 0) + 15) // 16), dtype=np.uint16)
+        for start in range(0, self._rows, BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + BLOCK_ROWS])
+            if mode == "int8":
+                codes[start:start + len(block)], scale[start:start + len(block)] = quantize_int8(block)
+            else:
+                codes[start:start + len(block)] = quantize_binary(block)
+        self._codes[mode] = (codes, scale) if mode == "int8" else codes
+
+    def build_ivf(self, nlist, iterations = 10, sample_size = 100000, seed = 0):
+        """Trains nlist k-means centroids on a sample of live rows and assigns every row."""
+        with self._lock:
+            live = np.flatnonzero(self._alive[:self._rows])
+            if len(live) < nlist:
+                raise ValueError(f"Need at least {nlist} rows to build {nlist} lists, have {len(live)}")
+            vectors = self._vectors()
+            rng = np.random.default_rng(seed)
+            sample = np.sort(rng.choice(live, size=min(sample_size, len(live)), replace=False))
+            centroids = kmeans(np.asarray(vectors[sample]), nlist, iterations, seed)
+
+            assign = np.zeros(self._rows, dtype=np.int32)
+            for start in range(0, self._rows, BLOCK_ROWS):
+                assign[start:start + BLOCK_ROWS] = nearest_centroid(np.asarray(vectors[start:start + BLOCK_ROWS]), centroids)
+
+            np.save(self._file(IVF_CENTROIDS_FILE), centroids)
+            assign.tofile(self._file(IVF_ASSIGN_FILE) + ".tmp")
+            os.replace(self._file(IVF_ASSIGN_FILE) + ".tmp", self._file(IVF_ASSIGN_FILE))
+            self._centroids = centroids
+            self._assign = assign
+            self._lists = None
+
+    def drop_ivf(self):
+        with self._lock:
+            for name in (IVF_CENTROIDS_FILE, IVF_ASSIGN_FILE):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+            self._centroids = None
+            self._assign = np.zeros(0, dtype=np.int32)
+            self._lists = None
+
+    def _ivf_lists(self):
+        # Row numbers per list, rebuilt lazily after appends
+        if self._lists is None:
+            assign = self._assign[:self._rows]
+            order = np.argsort(assign, kind="stable")
+            bounds = np.searchsorted(assign[order], np.arange(len(self._centroids) + 1))
+            self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self._centroids))]
+        return self._lists
+
+    def memory_bytes(self):
+        """Bytes needed to hold the first-pass data in RAM for each mode."""
+        return {
+            "float32": self._rows * (self.dim or 0) * 4,
+            "int8": self._rows * ((self.dim or 0) + 4),
+            "binary": self._rows * (((self.dim or 0) + 15) // 16) * 2,
+        }
+
+    def _block_scores(self, queries, start, stop, mode, vectors, codes, sq_norms):
+        # Smaller is better for every mode
+        if mode is None:
+            return sq_norms[start:stop][None, :] - 2 * (queries @ np.asarray(vectors[start:stop]).T)
+        if mode == "int8":
+            dots = np.empty((len(queries), stop - start), dtype=np.float32)
+            for sub in range(start, stop, INT8_SUBBLOCK):
+                end = min(sub + INT8_SUBBLOCK, stop)
+                dots[:, sub - start:end - start] = queries @ codes[0][sub:end].astype(np.float32).T
+            return sq_norms[start:stop][None, :] - 2 * dots * codes[1][start:stop][None, :]
+        block = codes[start:stop]
+        return np.stack([hamming(block, bits) for bits in quantize_binary(queries)]).astype(np.float32)
+
+    def top_k(self, query_embeddings, n, where = None):
+        """Row indices and squared L2 distances of the n nearest live rows per query."""
+        return self._search(query_embeddings, n, where)[:2]
+
+    def _search(self, query_embeddings, n, where = None):
+        check_where(where)
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        with self._lock:
+            mode = self.quantization
+            self._ensure_codes(mode)
+            rows = self._rows
+            view = self._view()
+            vectors = view[3]
+            codes = self._codes.get(mode)
+            alive = self._alive[:rows].copy()
+            if where:
+                alive &= np.fromiter((matches(metadata, where) for metadata in self.metadatas[:rows]), dtype=bool, count=rows)
+            sq_norms = self._sq_norms[:rows]
+            live = int(alive.sum())
+            nprobe = _nprobe.get() or self.nprobe
+            ivf = self._centroids is not None and nprobe < len(self._centroids)
+            if ivf:
+                centroids, lists = self._centroids, self._ivf_lists()
+        n = min(n, live)
+        if n == 0:
+            return [np.zeros(0, dtype=np.int64)] * len(queries), [np.zeros(0, dtype=np.float32)] * len(queries), view
+        if ivf:
+            return (*self._ivf_top_k(queries, n, nprobe, centroids, lists, mode, vectors, codes, alive, sq_norms), view)
+        first_pass = n if mode is None else min(live, n * self.oversample)
+
+        best_rows = None
+        best_dist = None
+        for start in range(0, rows, BLOCK_ROWS):
+            stop = min(start + BLOCK_ROWS, rows)
+            dist = self._block_scores(queries, start, stop, mode, vectors, codes, sq_norms)
+            dist[:, ~alive[start:stop]] = np.inf
+
+            take = min(first_pass, stop - start)
+            idx = np.argpartition(dist, take - 1, axis=1)[:, :take]
+            cand_dist = np.take_along_axis(dist, idx, axis=1)
+            cand_rows = idx + start
+            if best_rows is not None:
+                cand_dist = np.concatenate([best_dist, cand_dist], axis=1)
+                cand_rows = np.concatenate([best_rows, cand_rows], axis=1)
+                if cand_dist.shape[1] > first_pass:
+                    keep = np.argpartition(cand_dist, first_pass - 1, axis=1)[:, :first_pass]
+                    cand_dist = np.take_along_axis(cand_dist, keep, axis=1)
+                    cand_rows = np.take_along_axis(cand_rows, keep, axis=1)
+            best_rows, best_dist = cand_rows, cand_dist
+
+        if mode is not None:
+            best_rows, best_dist = self._rescore(queries, best_rows, best_dist, n, vectors, sq_norms)
+
+        order = np.argsort(best_dist, axis=1, kind="stable")
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        best_dist = np.take_along_axis(best_dist, order, axis=1) + np.einsum("ij,ij->i", queries, queries)[:, None]
+        finite = np.isfinite(best_dist)
+        return [r[f] for r, f in zip(best_rows, finite)], [np.maximum(d[f], 0.0) for d, f in zip(best_dist, finite)], view
+
+    def _ivf_top_k(self, queries, n, nprobe, centroids, lists, mode, vectors, codes, alive, sq_norms):
+        centroid_dist = np.einsum("ij,ij->i", centroids, centroids)[None, :] - 2 * (queries @ centroids.T)
+        probes = np.argpartition(centroid_dist, nprobe - 1, axis=1)[:, :nprobe]
+        all_rows, all_dist = [], []
+        for query, probed in zip(queries, probes):
+            rows = np.sort(np.concatenate([lists[c] for c in probed]))
+            rows = rows[alive[rows]]
+            if mode is not None and len(rows) > n * self.oversample:
+                if mode == "int8":
+                    approx = sq_norms[rows] - 2 * (codes[0][rows].astype(np.float32) @ query) * codes[1][rows]
+                else:
+                    approx = hamming(codes[rows], quantize_binary(query[None, :])[0])
+                rows = np.sort(rows[np.argpartition(approx, n * self.oversample - 1)[:n * self.oversample]])
+            dist = sq_norms[rows] - 2 * (np.asarray(vectors[rows]) @ query)
+            keep = np.argsort(dist, kind="stable")[:n]
+            all_rows.append(rows[keep])
+            all_dist.append(np.maximum(dist[keep] + float(query @ query), 0.0))
+        return all_rows, all_dist
+
+    def _rescore(self, queries, cand_rows, cand_dist, n, vectors, sq_norms):
+        # Full-precision vectors are only read for the first-pass survivors,
+        # in file order so the page cache sees mostly sequential reads
+        rows_out = np.zeros((len(queries), n), dtype=np.int64)
+        dist_out = np.full((len(queries), n), np.inf, dtype=np.float32)
+        for i, query in enumerate(queries):
+            rows = np.sort(cand_rows[i][np.isfinite(cand_dist[i])])
+            if not len(rows):
+                continue
+            exact = sq_norms[rows] - 2 * (np.asarray(vectors[rows]) @ query)
+            keep = np.argsort(exact, kind="stable")[:n]
+            rows_out[i, :len(keep)] = rows[keep]
+            dist_out[i, :len(keep)] = exact[keep]
+        return rows_out, dist_out
+
+    def query(self, query_embeddings, n_results = 10, include = ("documents", "metadatas", "distances"), where = None):
+        all_rows, all_dist, view = self._search(query_embeddings, n_results, where)
+        result = {key: [] for key in ["ids", *include]}
+        for rows, dist in zip(all_rows, all_dist):
+            part = self._rows_result(rows.tolist(), include, dist, view)
+            for key in result:
+                result[key].append(part.get(key, []))
+        return result
+
+
+_collections = {}
+_collections_lock = threading.Lock()
+
+def get_flat_collection(path, quantization = None, oversample = 4, nprobe = 8):
+    # One instance per directory, so every handle sees the same rows
+    with _collections_lock:
+        collection = _collections.get(path)
+        if collection is None:
+            collection = FlatCollection(path, quantization, oversample, nprobe)
+            _collections[path] = collection
+        return collection
+
+def drop_flat_collections():
+    with _collections_lock:
+        _collections.clear()
+
+
+class FlatVectorStore(VectorStore):
+    """LangChain vector store over a FlatCollection.
+
+    Mirrors the parts of the Chroma wrapper the project uses: add_documents
+    with ids, similarity and MMR search (so as_retriever works) with an
+    optional metadata filter, get, delete and delete_collection, plus
+    _collection for the code that queries the collection directly.
+    """
+
+    backend = "flat"
+
+    def __init__(self, collection, embedding_function):
+        self._collection = collection
+        self._embedding_function = embedding_function
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self._embedding_function
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        if ids is None:
+            ids = [str(uuid.uuid4()) for _ in texts]
+        vectors = self._embedding_function.embed_documents(texts)
+        self._collection.upsert(ids=ids, embeddings=vectors, documents=texts, metadatas=metadatas or [{} for _ in texts])
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> None:
+        self._collection.delete(ids=ids)
+
+    def delete_collection(self):
+        self._collection.destroy()
+
+    def get(self, ids = None, where = None, include = ("documents", "metadatas"), limit = None, offset = None):
+        return self._collection.get(ids=ids, where=where, include=include, limit=limit, offset=offset)
+
+    def _docs_from_result(self, result):
+        return [
+            Document(id=doc_id, page_content=text, metadata=meta or {})
+            for doc_id, text, meta in zip(result["ids"][0], result["documents"][0], result["metadatas"][0])
+        ]
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k = 4, filter = None, **kwargs):
+        result = self._collection.query(query_embeddings=[embedding], n_results=k, include=["documents", "metadatas", "distances"], where=filter)
+        return list(zip(self._docs_from_result(result), result["distances"][0]))
+
+    def similarity_search_with_score(self, query, k = 4, filter = None, **kwargs):
+        return self.similarity_search_by_vector_with_relevance_scores(self._embedding_function.embed_query(query), k=k, filter=filter)
+
+    def similarity_search_by_vector(self, embedding, k = 4, filter = None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=filter)]
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def _select_relevance_score_fn(self):
+        return self._euclidean_relevance_score_fn
+
+    def max_marginal_relevance_search_by_vector(self, embedding, k = 4, fetch_k = 20, lambda_mult = 0.5, filter = None, **kwargs):
+        result = self._collection.query(query_embeddings=[embedding], n_results=fetch_k, include=["documents", "metadatas", "embeddings"], where=filter)
+        if not result["ids"][0]:
+            return []
+        selected, _ = mmr_by_vector(embedding, result["embeddings"][0], k, lambda_mult)
+        docs = self._docs_from_result(result)
+        # Same as Chroma: the picks come back in their original rank order
+        return [docs[i] for i in sorted(selected)]
+
+    def max_marginal_relevance_search(self, query, k = 4, fetch_k = 20, lambda_mult = 0.5, filter = None, **kwargs):
+        embedding = self._embedding_function.embed_query(query)
+        return self.max_marginal_relevance_search_by_vector(embedding, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult, filter=filter)
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas = None, ids = None, path = ".flat_store", **kwargs):
+        store = cls(get_flat_collection(path), embedding)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
@@ -0,0 +1,127 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from src.tracing import span, propagate
+from src.ann import search_params
+from src.mmr import mmr_select
+
+# Shared by every hybrid retriever so legs don't pay thread start-up per query
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hybrid-leg")
+
+def reciprocal_rank_fusion(rankings, weights, rrf_k = 60):
+    fused = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc_id in enumerate(ranking):
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight / (rrf_k + rank + 1)
+    return fused
+
+def normalized_score_fusion(scores, weights):
+    fused = {}
+    for leg_scores, weight in zip(scores, weights):
+        if not leg_scores:
+            continue
+        values = np.array(list(leg_scores.values()), dtype=np.float32)
+        low, spread = float(values.min()), float(values.max() - values.min())
+        for doc_id, score in leg_scores.items():
+            normalized = (score - low) / spread if spread > 0 else 1.0
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight * normalized
+    return fused
+
+class FusionRetriever(BaseRetriever):
+    """Hybrid retriever that runs the semantic and BM25 legs concurrently.
+
+    Both legs return up to fetch_k candidates. They are fused with reciprocal
+    rank fusion ("rrf") or min-max normalized scores ("score"), deduplicated
+    by chunk id into one pool, and MMR picks k from that pool using the fused
+    score as relevance. search_with_timings also returns the leg and fusion
+    latencies of that call, so hybrid costs max(leg) rather than the sum of
+    the legs. ef_search and nprobe tune the semantic leg's ANN search per query.
+    """
+
+    vector_store: Any
+    index: Any
+    k: int = 4
+    fetch_k: int = 12
+    lambda_mult: float = 0.7
+    fusion: str = "rrf"
+    weights: Tuple[float, float] = (0.7, 0.3)
+    ef_search: Optional[int] = None
+    nprobe: Optional[int] = None
+
+    def _semantic_leg(self, query):
+        start = time.perf_counter()
+        with span("query_embedding"):
+            query_embedding = self.vector_store.embeddings.embed_query(query)
+        with span("semantic_search", fetch_k=self.fetch_k), search_params(self.vector_store, self.ef_search, self.nprobe):
+            result = self.vector_store._collection.query(
+                query_embeddings=[query_embedding],
+                n_results=self.fetch_k,
+                include=["documents", "metadatas", "distances", "embeddings"]
+            )
+        pool = {}
+        scores = {}
+        ranking = result["ids"][0]
+        for doc_id, text, meta, distance, embedding in zip(
+            ranking, result["documents"][0], result["metadatas"][0], result["distances"][0], result["embeddings"][0]
+        ):
+            pool[doc_id] = (Document(id=doc_id, page_content=text, metadata=meta or {}), embedding)
+            scores[doc_id] = -distance
+        return ranking, scores, pool, time.perf_counter() - start
+
+    def _bm25_leg(self, query):
+        start = time.perf_counter()
+        with span("bm25_search", fetch_k=self.fetch_k):
+            hits = self.index.search(query, k=self.fetch_k)
+        ranking = [doc_id for doc_id, _ in hits]
+        scores = dict(hits)
+        pool = {}
+        if ranking:
+            with span("bm25_fetch", docs=len(ranking)):
+                stored = self.vector_store._collection.get(ids=ranking, include=["documents", "metadatas", "embeddings"])
+            for doc_id, text, meta, embedding in zip(stored["ids"], stored["documents"], stored["metadatas"], stored["embeddings"]):
+                pool[doc_id] = (Document(id=doc_id, page_content=text, metadata=meta or {}), embedding)
+        ranking = [doc_id for doc_id in ranking if doc_id in pool]
+        return ranking, scores, pool, time.perf_counter() - start
+
+    def search_with_timings(self, query):
+        start = time.perf_counter()
+        semantic = _executor.submit(propagate(self._semantic_leg), query)
+        keyword = _executor.submit(propagate(self._bm25_leg), query)
+        sem_ranking, sem_scores, sem_pool, sem_time = semantic.result()
+        bm25_ranking, bm25_scores, bm25_pool, bm25_time = keyword.result()
+
+        fuse_start = time.perf_counter()
+        pool = {**bm25_pool, **sem_pool}
+        if self.fusion == "rrf":
+            fused = reciprocal_rank_fusion([sem_ranking, bm25_ranking], self.weights)
+        elif self.fusion == "score":
+            fused = normalized_score_fusion([sem_scores, {i: bm25_scores[i] for i in bm25_ranking}], self.weights)
+        else:
+            raise ValueError(f"Unknown fusion method: {self.fusion}")
+
+        candidates = sorted(pool, key=lambda doc_id: fused.get(doc_id, 0.0), reverse=True)[:self.fetch_k]
+        results = []
+        if candidates:
+            with span("mmr_select", candidates=len(candidates), k=self.k):
+                relevance = np.array([fused.get(doc_id, 0.0) for doc_id in candidates], dtype=np.float32)
+                relevance = relevance / max(float(relevance.max()), 1e-12)
+                embeddings = np.asarray([pool[doc_id][1] for doc_id in candidates], dtype=np.float32)
+                for i in mmr_select(relevance, embeddings, self.k, self.lambda_mult):
+                    results.append((pool[candidates[i]][0], fused.get(candidates[i], 0.0)))
+
+        timings = {
+            "semantic_ms": 1000 * sem_time,
+            "bm25_ms": 1000 * bm25_time,
+            "fusion_ms": 1000 * (time.perf_counter() - fuse_start),
+            "hybrid_ms": 1000 * (time.perf_counter() - start),
+        }
+        return results, timings
+
+    def search_with_scores(self, query):
+        return self.search_with_timings(query)[0]
+
+    def _get_relevant_documents(self, query, *, run_manager = None) -> List[Document]:
+        return [doc for doc, _ in self.search_with_scores(query)]
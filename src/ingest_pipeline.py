@@ -0,0 +1,261 @@
+import os
+import queue
+import threading
+import time
+from src.document_loader import load_sources, chunk_documents
+from src.embeddings import MODEL_NAME, load_embedding_model
+from src.manifest import chunk_id, content_digest, update_content_digest, file_hash
+from src.vector_store import get_vector_store, get_manifest, get_bm25, write_embedded_chunks, bump_corpus_version
+
+# The app sizes chunks in the embedding model's word pieces: MiniLM truncates
+# at 256, and 128 is about the 500 characters chunks were cut at before
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", f"sentence-transformers/{MODEL_NAME}")
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "128"))
+CHUNK_TOKEN_OVERLAP = int(os.getenv("CHUNK_TOKEN_OVERLAP", "16"))
+
+_DONE = object()
+
+
+class SourceEnd:
+    def __init__(self, source, content_hash, count, path_hash, unchanged = False):
+        self.source = source
+        self.content_hash = content_hash
+        self.count = count
+        self.path_hash = path_hash
+        # Same chunks as already stored, so nothing was sent to embed
+        self.unchanged = unchanged
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+
+    def as_dict(self):
+        return {
+            "items": self.items,
+            "busy_seconds": self.busy_seconds,
+            "blocked_seconds": self.blocked_seconds,
+            "items_per_second": self.items / self.busy_seconds if self.busy_seconds else 0.0,
+        }
+
+
+def _source_name(source):
+    if source["type"] == "url":
+        return source["path"]
+    # Matches the file_name metadata the loaders set, which add_documents keys on
+    return source.get("name") or os.path.basename(source["path"])
+
+def load_stage(sources, manifest, stats, max_workers = None, io_workers = None, ahead = None):
+    pending = []
+    for source in sources:
+        name = _source_name(source)
+        path_hash = None
+        if source["type"] != "url":
+            path_hash = file_hash(source["path"])
+            if manifest.is_file_unchanged(name, path_hash):
+                print(f"Skipping unchanged source {name}")
+                continue
+        pending.append((source, name, path_hash))
+
+    # Sources are parsed and fetched in parallel on the load_and_chunk pools
+    # and arrive here in their original order
+    loaded = load_sources([source for source, _, _ in pending], max_workers, io_workers, ahead)
+    for _, name, path_hash in pending:
+        start = time.perf_counter()
+        _, docs = next(loaded)
+        stats.busy_seconds += time.perf_counter() - start
+        stats.items += len(docs)
+        yield ("source", name, path_hash)
+        for doc in docs:
+            yield ("doc", doc)
+        yield ("end",)
+
+def chunk_stage(items, chunk_size, chunk_overlap, stats, manifest, tokenizer = None):
+    # A source's chunks are held back until it has been hashed, so a source
+    # whose content is unchanged (a re-fetched URL, a file touched or
+    # re-saved) is never embedded again. The cost is that every chunk of the
+    # source is in memory at once, however small queue_size is
+    name = path_hash = digest = None
+    chunks = []
+    for item in items:
+        if item[0] == "source":
+            _, name, path_hash = item
+            digest = content_digest(name)
+            chunks = []
+        elif item[0] == "doc":
+            start = time.perf_counter()
+            doc_chunks = chunk_documents([item[1]], chunk_size=chunk_size, chunk_overlap=chunk_overlap, tokenizer=tokenizer)
+            for chunk in doc_chunks:
+                update_content_digest(digest, chunk)
+            chunks.extend(doc_chunks)
+            stats.busy_seconds += time.perf_counter() - start
+            stats.items += len(doc_chunks)
+        else:
+            source_hash = digest.hexdigest()
+            if manifest.is_unchanged(name, source_hash):
+                yield SourceEnd(name, source_hash, len(chunks), path_hash, unchanged=True)
+                continue
+            for index, chunk in enumerate(chunks):
+                yield (chunk_id(name, index), chunk)
+            yield SourceEnd(name, source_hash, len(chunks), path_hash)
+
+def batch_stage(items, batch_size):
+    batch = []
+    for item in items:
+        if isinstance(item, SourceEnd):
+            if batch:
+                yield batch
+                batch = []
+            yield item
+            continue
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def embed_stage(batches, embedding_model, stats):
+    for batch in batches:
+        if isinstance(batch, SourceEnd):
+            yield batch
+            continue
+        start = time.perf_counter()
+        vectors = embedding_model.embed_documents([chunk.page_content for _, chunk in batch])
+        stats.busy_seconds += time.perf_counter() - start
+        stats.items += len(batch)
+        yield (batch, vectors)
+
+def write_stage(items, vector_store, manifest, bm25, stats):
+    for item in items:
+        start = time.perf_counter()
+        if isinstance(item, SourceEnd) and item.unchanged:
+            # Keeps the new file hash, so the next run skips it before loading
+            manifest.record(item.source, item.content_hash, manifest.get(item.source)["chunk_ids"], item.path_hash)
+            print(f"Skipping unchanged source {item.source}")
+        elif isinstance(item, SourceEnd):
+            ids = [chunk_id(item.source, n) for n in range(item.count)]
+            entry = manifest.get(item.source)
+            if entry is not None:
+                current = set(ids)
+                stale = [i for i in entry["chunk_ids"] if i not in current]
+                if stale:
+                    vector_store.delete(ids=stale)
+                    bm25.remove(stale)
+            manifest.record(item.source, item.content_hash, ids, item.path_hash)
+            print(f"Ingested {item.source}: {item.count} chunks")
+        else:
+            batch, vectors = item
+            ids = [i for i, _ in batch]
+            chunks = [chunk for _, chunk in batch]
+            write_embedded_chunks(vector_store, ids, chunks, vectors)
+            bm25.add(ids, [chunk.page_content for chunk in chunks])
+            stats.items += len(batch)
+        stats.busy_seconds += time.perf_counter() - start
+        yield item
+
+
+class _Stage(threading.Thread):
+    """Runs a generator stage on its own thread between two bounded queues.
+
+    A full output queue blocks the stage, which is what gives back-pressure:
+    no stage can run more than queue_size items ahead of the next one. An
+    item is a whole document or batch, though, and loading and chunking work
+    a source at a time (see load_sources and chunk_stage), so memory is
+    bounded by the largest sources, not by queue_size.
+    """
+
+    def __init__(self, fn, inbox, outbox, stop, stats):
+        super().__init__(daemon=True)
+        self.fn = fn
+        self.inbox = inbox
+        self.outbox = outbox
+        self.stop = stop
+        self.stats = stats
+        self.error = None
+
+    def _iter_inbox(self):
+        while not self.stop.is_set():
+            try:
+                item = self.inbox.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                return
+            yield item
+
+    def _put(self, item):
+        start = time.perf_counter()
+        while not self.stop.is_set():
+            try:
+                self.outbox.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.stats.blocked_seconds += time.perf_counter() - start
+
+    def run(self):
+        try:
+            items = self.fn(self._iter_inbox()) if self.inbox is not None else self.fn()
+            for item in items:
+                if self.stop.is_set():
+                    return
+                if self.outbox is not None:
+                    self._put(item)
+        except Exception as e:
+            self.error = e
+            self.stop.set()
+        finally:
+            if self.outbox is not None:
+                self._put(_DONE)
+
+
+def ingest(sources, embedding_model = None, chunk_size = 500, chunk_overlap = 50, batch_size = 50, queue_size = 4, backend = None, tokenizer = None,
+           max_workers = None, io_workers = None, ahead = None):
+    # Peak memory is roughly ahead + 2 whole sources: those loaded ahead, the
+    # one being chunked and the one being embedded. ahead = 1 keeps it lowest
+    # at the cost of loading one source at a time
+    if embedding_model is None:
+        embedding_model = load_embedding_model()
+
+    vector_store = get_vector_store(embedding_model, backend=backend)
+    manifest = get_manifest(backend)
+    bm25 = get_bm25(vector_store)
+
+    stats = {name: StageStats(name) for name in ("load", "chunk", "embed", "write")}
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(3)]
+
+    stages = [
+        _Stage(lambda: load_stage(sources, manifest, stats["load"], max_workers, io_workers, ahead), None, queues[0], stop, stats["load"]),
+        _Stage(lambda items: batch_stage(chunk_stage(items, chunk_size, chunk_overlap, stats["chunk"], manifest, tokenizer), batch_size), queues[0], queues[1], stop, stats["chunk"]),
+        _Stage(lambda items: embed_stage(items, embedding_model, stats["embed"]), queues[1], queues[2], stop, stats["embed"]),
+        _Stage(lambda items: write_stage(items, vector_store, manifest, bm25, stats["write"]), queues[2], None, stop, stats["write"]),
+    ]
+
+    start = time.perf_counter()
+    for stage in stages:
+        stage.start()
+    for stage in stages:
+        stage.join()
+    elapsed = time.perf_counter() - start
+
+    # Only finished sources are recorded, so this is safe after a failure too
+    bm25.save()
+    manifest.save()
+    if stats["write"].items:
+        bump_corpus_version()
+
+    for stage in stages:
+        if stage.error is not None:
+            raise stage.error
+
+    report = {name: s.as_dict() for name, s in stats.items()}
+    report["wall_seconds"] = elapsed
+    print(f"Ingested {stats['write'].items} chunks in {elapsed:.2f}s")
+    for name in ("load", "chunk", "embed", "write"):
+        print(f"  {name:<6} {report[name]['items']:>7} items  {report[name]['items_per_second']:>9.1f}/s  blocked {report[name]['blocked_seconds']:.2f}s")
+    return report
@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+
+
+def chunk_source(chunk):
+    return chunk.metadata.get("file_name") or chunk.metadata.get("source")
+
+def content_digest(source):
+    digest = hashlib.sha256()
+    digest.update(str(source).encode("utf-8"))
+    digest.update(b"\x00")
+    return digest
+
+def update_content_digest(digest, chunk):
+    digest.update(chunk.page_content.encode("utf-8"))
+    digest.update(b"\x00")
+
+def content_hash(source, chunks):
+    digest = content_digest(source)
+    for chunk in chunks:
+        update_content_digest(digest, chunk)
+    return digest.hexdigest()
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_id(source, index):
+    # Positional ids let a re-ingest overwrite a source's chunks in place
+    prefix = hashlib.sha256(str(source).encode("utf-8")).hexdigest()[:16]
+    return f"{prefix}-{index}"
+
+def chunk_ids(source, count):
+    return [chunk_id(source, i) for i in range(count)]
+
+
+class SourceManifest:
+    """Persistent record of what has been ingested, keyed by source name.
+
+    Each entry holds the content hash of the source's chunks, the Chroma ids
+    they were written under and the ingest time, so unchanged sources can be
+    skipped and changed ones replaced without scanning the collection.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def get(self, source):
+        return self.entries.get(source)
+
+    def is_unchanged(self, source, source_hash):
+        entry = self.entries.get(source)
+        return entry is not None and entry["content_hash"] == source_hash
+
+    def is_file_unchanged(self, source, path_hash):
+        entry = self.entries.get(source)
+        return entry is not None and entry.get("file_hash") == path_hash
+
+    def record(self, source, source_hash, ids, path_hash = None):
+        self.entries[source] = {
+            "content_hash": source_hash,
+            "chunk_ids": ids,
+            "ingested_at": datetime.now().isoformat(),
+        }
+        if path_hash is not None:
+            self.entries[source]["file_hash"] = path_hash
+
+    def remove(self, source):
+        return self.entries.pop(source, None)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp_path, self.path)
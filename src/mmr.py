@@ -0,0 +1,44 @@
+import numpy as np
+
+def normalize(embeddings):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    return embeddings / np.maximum(np.linalg.norm(embeddings, axis=-1, keepdims=True), 1e-12)
+
+def mmr_select(relevance, embeddings, k, lambda_mult = 0.7):
+    """Indices of the k candidates picked by maximal marginal relevance.
+
+    Each pick only adds one row of candidate similarities, which updates the
+    running max similarity to the selected set in place, so selection costs
+    O(k * fetch_k) dot products instead of recomputing similarities to the
+    whole selected set on every step.
+    """
+    return _select(np.asarray(relevance, dtype=np.float32), normalize(embeddings), k, lambda_mult)
+
+def _select(relevance, embeddings, k, lambda_mult):
+    # embeddings must already be unit length
+    k = min(k, len(relevance))
+    if k <= 0:
+        return []
+
+    # Nothing is selected yet, so the first pick is the most relevant one
+    best = int(np.argmax(relevance))
+    selected = [best]
+    max_sim = embeddings @ embeddings[best]
+    weighted = lambda_mult * relevance
+    for _ in range(k - 1):
+        scores = weighted - (1 - lambda_mult) * max_sim
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        np.maximum(max_sim, embeddings @ embeddings[best], out=max_sim)
+    return selected
+
+def mmr_by_vector(query_embedding, embeddings, k, lambda_mult = 0.5):
+    """MMR with cosine similarity to the query as relevance.
+
+    Returns the picks and the cosine similarity of every candidate, so
+    callers can score the picks without another pass over the vectors.
+    """
+    embeddings = normalize(embeddings)
+    similarities = embeddings @ normalize(query_embedding)
+    return _select(similarities, embeddings, k, lambda_mult), similarities
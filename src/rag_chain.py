@@ -1,15 +1,89 @@
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from dotenv import load_dotenv
-from langchain_groq import ChatGroq
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema.runnable import RunnablePassthrough
-from langchain.schema.output_parser import StrOutputParser
-from src.vector_store import get_retriever,get_hybrid_retriever
-from langchain.schema.runnable import RunnableLambda
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnablePassthrough, RunnableLambda
+from langchain_core.output_parsers import StrOutputParser
+from src.embeddings import load_embedding_model
+from src.vector_store import corpus_version, get_vector_store, get_retriever, get_hybrid_retriever, mmr_search_with_scores, mmr_search_batch_with_scores
+from src.rate_limit import RateLimiter
+from src.hybrid_retriever import FusionRetriever
+from src.tracing import span, propagate, LLMTraceHandler
+from src.context_packing import pack_context
 
 load_dotenv()
 
+PROMPT_V1 = """You are a helpful assistant that answers questions based strictly on the provided context.
+
+    If the answer is not found in the context, say "I don't have enough information in the provided documents to answer this question." Do not make up answers.
+
+    Always mention which source document your answer comes from.
+
+    Context:{context}
+
+    Question: {question}
+
+    Answer:"""
+
+PROMPT_REWRITE = """You are a helpful assistant that answers questions based strictly on the provided context.
+
+    If the answer is not found in the context, say "I don't have enough information in the provided documents to answer this question." Do not make up answers.
+
+    Always mention which source document your answer comes from.
+
+    Context:
+    {context}
+
+    Question: {question}
+
+    Answer:"""
+
+PROMPT_V2 = """You are an expert assistant that answers questions using ONLY the provided context.
+
+    Rules:
+    1. Base your answer strictly on the context provided. Do not use outside knowledge.
+    2. If the context contains partial information, use what's available and note what's missing.
+    3. Always cite the source document for every claim you make.
+    4. If the context contains no relevant information, say "The provided documents do not contain information about this topic."
+    5. Be concise and specific — avoid vague answers.
+
+    Context:
+    {context}
+
+    Question: {question}
+
+    Answer:"""
+
+PROMPT_V3 = """You are an expert assistant. Follow these steps to answer the question:
+
+    Step 1: Read the provided context carefully.
+    Step 2: Identify which parts of the context are relevant to the question.
+    Step 3: Formulate a precise answer using ONLY the relevant context.
+    Step 4: Cite which source document your answer comes from.
+
+    If no relevant information exists in the context, explicitly state: "The provided documents do not contain information about this topic."
+
+    Context:
+    {context}
+
+    Question: {question}
+
+    Answer:"""
+
+# Parsed once at import, shared by every chain and engine
+PROMPTS = {
+    "v1": ChatPromptTemplate.from_template(PROMPT_V1),
+    "rewrite": ChatPromptTemplate.from_template(PROMPT_REWRITE),
+    "v2": ChatPromptTemplate.from_template(PROMPT_V2),
+    "v3": ChatPromptTemplate.from_template(PROMPT_V3),
+}
+
 def load_llm():
+    # langchain_groq takes about a second to import, so only pay for it when
+    # an LLM is actually built
+    from langchain_groq import ChatGroq
     llm = ChatGroq(
         api_key=os.getenv("GROQ_API_KEY"),
         model_name = "llama-3.3-70b-versatile",
@@ -26,33 +100,28 @@ def format_docs(docs):
 
     return "\n\n---\n\n".join(formatted)
 
-def create_rag_chain(embedding_model = None, k = 4):
-    retriever = get_retriever(k=k, embedding_model=embedding_model)
-    llm = load_llm()
-
-    prompt_template = """You are a helpful assistant that answers questions based strictly on the provided context.
-
-    If the answer is not found in the context, say "I don't have enough information in the provided documents to answer this question." Do not make up answers.
-
-    Always mention which source document your answer comes from.
-
-    Context:{context}
-
-    Question: {question}
-
-    Answer:"""
-
-    prompt = ChatPromptTemplate.from_template(prompt_template)
+def source_names(docs):
+    names = []
+    for doc in docs:
+        name = doc.metadata.get("file_name") or doc.metadata.get("source", "unknown")
+        if name not in names:
+            names.append(name)
+    return names
 
+def build_chain(retriever, llm, prompt):
     chain = (
         {"context": retriever | format_docs, "question": RunnablePassthrough()}
         | prompt
         | llm
         | StrOutputParser()
     )
-
     return chain
 
+def create_rag_chain(embedding_model = None, k = 4):
+    retriever = get_retriever(k=k, embedding_model=embedding_model)
+    llm = load_llm()
+    return build_chain(retriever, llm, PROMPTS["v1"])
+
 def ask(question, embedding_model = None, k = 4):
     chain = create_rag_chain(embedding_model=embedding_model, k=k)
     response = chain.invoke(question)
@@ -75,21 +144,6 @@ def rewrite_query(question, llm = None):
 def create_rag_chain_with_rewrite(embedding_model = None, k = 4):
     llm = load_llm()
 
-    prompt_template = """You are a helpful assistant that answers questions based strictly on the provided context.
-
-    If the answer is not found in the context, say "I don't have enough information in the provided documents to answer this question." Do not make up answers.
-
-    Always mention which source document your answer comes from.
-
-    Context:
-    {context}
-
-    Question: {question}
-
-    Answer:"""
-
-    prompt = ChatPromptTemplate.from_template(prompt_template)
-
     def retrieve_with_rewrite(question):
         rewritten = rewrite_query(question, llm)
         retriever = get_retriever(k=k, embedding_model=embedding_model)
@@ -98,7 +152,7 @@ def create_rag_chain_with_rewrite(embedding_model = None, k = 4):
     
     chain = (
         {"context": RunnableLambda(retrieve_with_rewrite), "question": RunnablePassthrough()}
-        | prompt
+        | PROMPTS["rewrite"]
         | llm
         | StrOutputParser()
     )
@@ -113,33 +167,7 @@ def ask_with_rewrite(question, embedding_model = None, k = 4):
 def create_rag_chain_V2(embedding_model = None, k = 4):
     retriever = get_retriever(k=k, embedding_model=embedding_model)
     llm = load_llm()
-
-    prompt_template = """You are an expert assistant that answers questions using ONLY the provided context.
-
-    Rules:
-    1. Base your answer strictly on the context provided. Do not use outside knowledge.
-    2. If the context contains partial information, use what's available and note what's missing.
-    3. Always cite the source document for every claim you make.
-    4. If the context contains no relevant information, say "The provided documents do not contain information about this topic."
-    5. Be concise and specific — avoid vague answers.
-
-    Context:
-    {context}
-
-    Question: {question}
-
-    Answer:"""
-
-    prompt = ChatPromptTemplate.from_template(prompt_template)
-
-    chain = (
-        {"context": retriever | format_docs, "question": RunnablePassthrough()}
-        | prompt
-        | llm
-        | StrOutputParser()
-    )
-
-    return chain
+    return build_chain(retriever, llm, PROMPTS["v2"])
 
 def ask_V2(question, embedding_model = None, k = 4):
     chain = create_rag_chain_V2(embedding_model=embedding_model, k=k)
@@ -149,73 +177,282 @@ def ask_V2(question, embedding_model = None, k = 4):
 def create_rag_chain_V3(embedding_model = None, k = 4):
     retriever = get_retriever(k=k, embedding_model=embedding_model)
     llm = load_llm()
-
-    prompt_template = """You are an expert assistant. Follow these steps to answer the question:
-
-    Step 1: Read the provided context carefully.
-    Step 2: Identify which parts of the context are relevant to the question.
-    Step 3: Formulate a precise answer using ONLY the relevant context.
-    Step 4: Cite which source document your answer comes from.
-
-    If no relevant information exists in the context, explicitly state: "The provided documents do not contain information about this topic."
-
-    Context:
-    {context}
-
-    Question: {question}
-
-    Answer:"""
-
-    prompt = ChatPromptTemplate.from_template(prompt_template)
-
-    chain = (
-        {"context": retriever | format_docs, "question": RunnablePassthrough()}
-        | prompt
-        | llm
-        | StrOutputParser()
-    )
-
-    return chain
+    return build_chain(retriever, llm, PROMPTS["v3"])
 
 def ask_V3(question, embedding_model = None, k = 4):
-    chain = create_rag_chain_V2(embedding_model=embedding_model, k=k)
+    chain = create_rag_chain_V3(embedding_model=embedding_model, k=k)
     response = chain.invoke(question)
     return response
 
-def create_rag_chain_hybrid(chunks, embedding_model = None, k = 4):
-    
+def create_rag_chain_hybrid(chunks = None, embedding_model = None, k = 4):
     retriever = get_hybrid_retriever(chunks, k=k, embedding_model=embedding_model)
     llm = load_llm()
+    return build_chain(retriever, llm, PROMPTS["v2"])
 
-    prompt_template = """You are an expert assistant that answers questions using ONLY the provided context.
-
-    Rules:
-    1. Base your answer strictly on the context provided. Do not use outside knowledge.
-    2. If the context contains partial information, use what's available and note what's missing.
-    3. Always cite the source document for every claim you make.
-    4. If the context contains no relevant information, say "The provided documents do not contain information about this topic."
-    5. Be concise and specific — avoid vague answers.
-
-    Context:
-    {context}
-
-    Question: {question}
-
-    Answer:"""
-
-    prompt = ChatPromptTemplate.from_template(prompt_template)
-
-    chain = (
-        {"context": retriever | format_docs, "question": RunnablePassthrough()}
-        | prompt
-        | llm
-        | StrOutputParser()
-    )
-
-    return chain
-
-def ask_hybrid(question, chunks, embedding_model = None, k = 4):
+def ask_hybrid(question, chunks = None, embedding_model = None, k = 4):
     chain = create_rag_chain_hybrid(chunks, embedding_model, k=k)
     response = chain.invoke(question)
     return response
 
+
+@dataclass
+class RAGResult:
+    question: str
+    answer: str
+    docs: list
+    scores: list
+    sources: list
+    timings: dict = field(default_factory=dict)
+    cached: bool = False
+    error: str = None
+
+
+class AnswerStream:
+    """Iterator over answer tokens for one question.
+
+    Retrieval has already run when this is created, so docs, scores and
+    sources can be shown before the first token arrives. Once iteration
+    finishes, result holds the full RAGResult, including time to first token.
+    """
+
+    def __init__(self, engine, question, retrieved, start, retrieved_at, cached = None, retrieval_timings = None, version = None):
+        self.engine = engine
+        self.question = question
+        self.docs = [doc for doc, _ in retrieved]
+        self.scores = [score for _, score in retrieved]
+        self.sources = source_names(self.docs)
+        self.result = None
+        self._start = start
+        self._retrieved_at = retrieved_at
+        self._retrieval_timings = retrieval_timings or {}
+        self._version = version
+        self._cached = cached
+        if cached is not None:
+            self.sources = cached.sources
+
+    def __iter__(self):
+        if self._cached is not None:
+            self.result = self._cached
+            self.result.timings["time_to_first_token_ms"] = 1000 * (time.perf_counter() - self._start)
+            yield self.result.answer
+            return
+
+        first_token_at = None
+        parts = []
+        for token in self.engine.generate_chain.stream({"context": self.engine.format_context(self.docs), "question": self.question}):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            parts.append(token)
+            yield token
+        finished = time.perf_counter()
+        if first_token_at is None:
+            first_token_at = finished
+
+        self.result = RAGResult(
+            question=self.question,
+            answer="".join(parts),
+            docs=self.docs,
+            scores=self.scores,
+            sources=self.sources,
+            timings={
+                **self._retrieval_timings,
+                "retrieval_ms": 1000 * (self._retrieved_at - self._start),
+                "time_to_first_token_ms": 1000 * (first_token_at - self._start),
+                "generation_ms": 1000 * (finished - self._retrieved_at),
+                "total_ms": 1000 * (finished - self._start),
+            }
+        )
+        if self.engine.answer_cache is not None:
+            self.engine.answer_cache.store(self.question, self.result.answer, self.sources, finished - self._start, docs=self.docs, scores=self.scores, version=self._version)
+
+
+class RAGEngine:
+    """Builds the LLM client, vector store handle, retriever and chain once and
+    answers any number of questions with them.
+
+    prompt_version is one of "v1", "v2", "v3". hybrid=True adds BM25 from the
+    persistent index (or over chunks, if given) to the semantic retriever,
+    rewrite=True rewrites each question before retrieval. An answer_cache
+    (SemanticAnswerCache) is consulted before retrieval and the LLM call.
+    Passing vector_store points the engine at a collection other than the
+    default one. ef_search (Chroma) and nprobe (flat IVF) trade recall for
+    speed in the semantic search. With context_budget set, retrieved chunks
+    are merged, deduplicated and packed into that many tokens instead of
+    being concatenated verbatim.
+    """
+
+    def __init__(self, embedding_model = None, k = 4, prompt_version = "v2", llm = None, hybrid = False, chunks = None, rewrite = False, answer_cache = None, vector_store = None, ef_search = None, nprobe = None, context_budget = None):
+        if embedding_model is None:
+            embedding_model = load_embedding_model()
+        if prompt_version not in PROMPTS:
+            raise ValueError(f"Unknown prompt version: {prompt_version}")
+
+        self.embedding_model = embedding_model
+        self.k = k
+        self.prompt_version = prompt_version
+        self.rewrite = rewrite
+        self.hybrid = hybrid or chunks is not None
+        self.answer_cache = answer_cache
+        self.ef_search = ef_search
+        self.nprobe = nprobe
+        self.context_budget = context_budget
+        self.llm = llm if llm is not None else load_llm()
+        self.vector_store = vector_store if vector_store is not None else get_vector_store(embedding_model)
+        self.prompt = PROMPTS["rewrite"] if rewrite else PROMPTS[prompt_version]
+
+        if self.hybrid:
+            self.retriever = get_hybrid_retriever(chunks, k=k, embedding_model=embedding_model, vector_store=self.vector_store, ef_search=ef_search, nprobe=nprobe)
+        else:
+            self.retriever = get_retriever(k=k, embedding_model=embedding_model, vector_store=self.vector_store, ef_search=ef_search, nprobe=nprobe)
+
+        # The handler turns every model call into an "llm_call" trace span
+        self.generate_chain = (self.prompt | self.llm | StrOutputParser()).with_config(callbacks=[LLMTraceHandler()])
+
+    def retrieve_with_timings(self, question):
+        # (doc, score) pairs, plus the fusion retriever's per-leg latencies
+        query = rewrite_query(question, self.llm) if self.rewrite else question
+        if isinstance(self.retriever, FusionRetriever):
+            return self.retriever.search_with_timings(query)
+        if self.hybrid:
+            # The chunk-list ensemble has no per-document scores
+            return [(doc, None) for doc in self.retriever.invoke(query)], {}
+        return mmr_search_with_scores(query, k=self.k, fetch_k=self.k*3, lambda_mult=0.7, vector_store=self.vector_store, ef_search=self.ef_search, nprobe=self.nprobe), {}
+
+    def retrieve_with_scores(self, question):
+        return self.retrieve_with_timings(question)[0]
+
+    def retrieve(self, question):
+        return [doc for doc, _ in self.retrieve_with_scores(question)]
+
+    def format_context(self, docs):
+        with span("format_docs", docs=len(docs)) as attrs:
+            if self.context_budget is None:
+                context = format_docs(docs)
+            else:
+                packed = pack_context(docs, token_budget=self.context_budget)
+                context = format_docs(packed.docs)
+                attrs.update(context_tokens=packed.tokens, merged=packed.merged, duplicates=packed.duplicates)
+            attrs["context_chars"] = len(context)
+        return context
+
+    def _cached_result(self, question, start):
+        if self.answer_cache is None:
+            return None
+        cached = self.answer_cache.lookup(question)
+        if cached is None:
+            return None
+        return RAGResult(
+            question=question,
+            answer=cached["answer"],
+            docs=cached["docs"],
+            scores=cached["scores"],
+            sources=cached["sources"],
+            timings={"total_ms": 1000 * (time.perf_counter() - start)},
+            cached=True
+        )
+
+    def query(self, question):
+        start = time.perf_counter()
+        # Read before retrieval, so the answer is not cached if the corpus changes meanwhile
+        version = corpus_version()
+        cached = self._cached_result(question, start)
+        if cached is not None:
+            return cached
+
+        with span("retrieval", hybrid=self.hybrid):
+            retrieved, retrieval_timings = self.retrieve_with_timings(question)
+        retrieved_at = time.perf_counter()
+        docs = [doc for doc, _ in retrieved]
+        answer = self.generate_chain.invoke({"context": self.format_context(docs), "question": question})
+        finished = time.perf_counter()
+
+        result = RAGResult(
+            question=question,
+            answer=answer,
+            docs=docs,
+            scores=[score for _, score in retrieved],
+            sources=source_names(docs),
+            timings={
+                **retrieval_timings,
+                "retrieval_ms": 1000 * (retrieved_at - start),
+                "generation_ms": 1000 * (finished - retrieved_at),
+                "total_ms": 1000 * (finished - start),
+            }
+        )
+        if self.answer_cache is not None:
+            self.answer_cache.store(question, result.answer, result.sources, finished - start, docs=result.docs, scores=result.scores, version=version)
+        return result
+
+    def stream(self, question):
+        start = time.perf_counter()
+        version = corpus_version()
+        cached = self._cached_result(question, start)
+        if cached is not None:
+            retrieved = list(zip(cached.docs, cached.scores)) if cached.scores else [(doc, None) for doc in cached.docs]
+            return AnswerStream(self, question, retrieved, start, start, cached=cached)
+
+        with span("retrieval", hybrid=self.hybrid):
+            retrieved, retrieval_timings = self.retrieve_with_timings(question)
+        return AnswerStream(self, question, retrieved, start, time.perf_counter(), retrieval_timings=retrieval_timings, version=version)
+
+    def ask(self, question):
+        return self.query(question).answer
+
+    def ask_many(self, questions, max_concurrency = 4, requests_per_minute = None):
+        """Answer a batch of questions, returning results in input order.
+
+        For plain MMR retrieval all questions are embedded in one model call
+        and searched in one Chroma query. LLM calls then run on up to
+        max_concurrency threads, throttled to requests_per_minute if set.
+        A failing item gets a result with error set instead of raising; if
+        the batched retrieval fails, each question is retrieved on its own.
+        The answer cache is not consulted.
+        """
+        questions = list(questions)
+        start = time.perf_counter()
+        if self.hybrid or self.rewrite:
+            retrieved = [None] * len(questions)
+        else:
+            try:
+                retrieved = mmr_search_batch_with_scores(questions, k=self.k, fetch_k=self.k*3, lambda_mult=0.7, vector_store=self.vector_store, ef_search=self.ef_search, nprobe=self.nprobe)
+            except Exception:
+                # Retrieved one by one instead, so only the failing items get an error
+                retrieved = [None] * len(questions)
+        batch_retrieval_ms = 1000 * (time.perf_counter() - start)
+        limiter = RateLimiter(requests_per_minute)
+
+        def answer_one(i):
+            question = questions[i]
+            item_start = time.perf_counter()
+            try:
+                hits = retrieved[i]
+                retrieval_timings = {}
+                if hits is None:
+                    if self.rewrite:
+                        limiter.acquire()
+                    hits, retrieval_timings = self.retrieve_with_timings(question)
+                retrieved_at = time.perf_counter()
+
+                docs = [doc for doc, _ in hits]
+                limiter.acquire()
+                answer = self.generate_chain.invoke({"context": self.format_context(docs), "question": question})
+                finished = time.perf_counter()
+                return RAGResult(
+                    question=question,
+                    answer=answer,
+                    docs=docs,
+                    scores=[score for _, score in hits],
+                    sources=source_names(docs),
+                    timings={
+                        **retrieval_timings,
+                        "batch_retrieval_ms": batch_retrieval_ms,
+                        "retrieval_ms": 1000 * (retrieved_at - item_start),
+                        "generation_ms": 1000 * (finished - retrieved_at),
+                        "total_ms": 1000 * (finished - item_start),
+                    }
+                )
+            except Exception as e:
+                return RAGResult(question=question, answer="", docs=[], scores=[], sources=[], error=f"{type(e).__name__}: {e}")
+
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+            return list(pool.map(propagate(answer_one), range(len(questions))))
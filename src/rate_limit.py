@@ -0,0 +1,27 @@
+import threading
+import time
+from collections import deque
+
+
+class RateLimiter:
+    """Sliding-window limiter for requests per minute, shared across threads."""
+
+    def __init__(self, requests_per_minute, window_seconds = 60.0):
+        self.requests_per_minute = requests_per_minute
+        self.window_seconds = window_seconds
+        self._sent = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.requests_per_minute:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._sent and now - self._sent[0] >= self.window_seconds:
+                    self._sent.popleft()
+                if len(self._sent) < self.requests_per_minute:
+                    self._sent.append(now)
+                    return
+                wait = self.window_seconds - (now - self._sent[0])
+            time.sleep(max(wait, 0.001))
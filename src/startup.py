@@ -0,0 +1,49 @@
+import importlib
+import os
+import threading
+from src.embeddings import LazyEmbeddings
+from src.tracing import span
+
+# Imported on first use by the modules that need them; warm_up() imports
+# them ahead of the first request instead
+HEAVY_MODULES = (
+    "langchain_community.vectorstores",
+    "chromadb",
+    "langchain_groq",
+    "langchain_community.document_loaders",
+)
+# RAG_WARMUP=0 leaves everything to load on first use
+WARMUP = os.getenv("RAG_WARMUP", "1") != "0"
+
+def lazy_model(embedding_model):
+    # Walks through wrappers such as CachedEmbeddings to the lazy model, if any
+    while embedding_model is not None and not isinstance(embedding_model, LazyEmbeddings):
+        embedding_model = getattr(embedding_model, "embedding_model", None)
+    return embedding_model
+
+def _warm_up(embedding_model, modules):
+    with span("warm_up", modules=len(modules)):
+        try:
+            for name in modules:
+                importlib.import_module(name)
+            model = lazy_model(embedding_model)
+            if model is not None:
+                model.load()
+        except Exception as error:
+            # Best effort: the same error surfaces again on first real use
+            print(f"Warm-up failed: {error}")
+
+def warm_up(embedding_model = None, modules = HEAVY_MODULES, background = True):
+    """Imports the heavy dependencies and loads the embedding model.
+
+    With background=True this runs on a daemon thread, so the app can render
+    while it happens, and the thread is returned. Requests that arrive before
+    it finishes wait for the same import or model load rather than repeating
+    it.
+    """
+    if not background:
+        _warm_up(embedding_model, modules)
+        return None
+    thread = threading.Thread(target=_warm_up, args=(embedding_model, tuple(modules)), name="rag-warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,257 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Sinks receive every finished span. With none registered and no trace open,
+# span() only costs a context manager enter/exit
+_sinks = []
+_sinks_lock = threading.Lock()
+_current_trace = contextvars.ContextVar("rag_trace", default=None)
+
+def add_sink(sink):
+    with _sinks_lock:
+        if sink not in _sinks:
+            _sinks.append(sink)
+    return sink
+
+def remove_sink(sink):
+    with _sinks_lock:
+        if sink in _sinks:
+            _sinks.remove(sink)
+
+def clear_sinks():
+    with _sinks_lock:
+        _sinks.clear()
+
+def enabled():
+    return bool(_sinks) or _current_trace.get() is not None
+
+def emit(name, seconds, attrs = None):
+    record = {"name": name, "duration_ms": 1000 * seconds, "timestamp": time.time()}
+    if attrs:
+        record.update(attrs)
+
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.spans.append(record)
+    for sink in list(_sinks):
+        sink.record(record)
+    return record
+
+@contextmanager
+def span(name, **attrs):
+    """Times the enclosed block as one stage.
+
+    The yielded dict can be filled in with attributes that are only known
+    inside the block, such as token counts or the size of the context.
+    """
+    if not enabled():
+        yield attrs
+        return
+
+    start = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        emit(name, time.perf_counter() - start, attrs)
+
+def propagate(fn):
+    # Runs fn in a copy of the caller's context, so spans from pool threads
+    # still land in the caller's trace. Each call gets its own copy, since one
+    # context cannot be entered by two threads at once
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+
+class Trace:
+    """Collects the spans of one request, e.g. for a debug view."""
+
+    def __init__(self):
+        self.spans = []
+
+    def summary(self):
+        totals = {}
+        for record in self.spans:
+            totals[record["name"]] = totals.get(record["name"], 0.0) + record["duration_ms"]
+        return totals
+
+@contextmanager
+def trace():
+    current = Trace()
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+
+
+class HistogramSink:
+    """Keeps the last max_samples durations per stage in memory."""
+
+    def __init__(self, max_samples = 10000):
+        self.max_samples = max_samples
+        self._samples = defaultdict(lambda: deque(maxlen=self.max_samples))
+        self._lock = threading.Lock()
+
+    def record(self, record):
+        with self._lock:
+            self._samples[record["name"]].append(record["duration_ms"])
+
+    def summary(self):
+        with self._lock:
+            samples = {name: np.array(values) for name, values in self._samples.items()}
+        return {
+            name: {
+                "count": len(values),
+                "mean_ms": float(values.mean()),
+                "p50_ms": float(np.percentile(values, 50)),
+                "p95_ms": float(np.percentile(values, 95)),
+                "p99_ms": float(np.percentile(values, 99)),
+                "max_ms": float(values.max()),
+            }
+            for name, values in samples.items() if len(values)
+        }
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+
+class JsonLinesSink:
+    """Appends every span to a file, one JSON object per line."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def record(self, record):
+        line = json.dumps(record, default=str)
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+
+DEFAULT_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# Numeric span attributes that are exported as running totals
+COUNTED_ATTRS = ("prompt_tokens", "completion_tokens", "context_chars")
+
+class PrometheusSink:
+    """Cumulative stage histograms in the Prometheus text exposition format.
+
+    render() returns the text to serve from a /metrics endpoint. If path is
+    set, the text is also written there for a node exporter textfile
+    collector, at most every flush_seconds as spans come in.
+    """
+
+    def __init__(self, prefix = "rag", buckets_ms = DEFAULT_BUCKETS_MS, path = None, flush_seconds = 10.0):
+        self.prefix = prefix
+        self.buckets_ms = tuple(buckets_ms)
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self._flushed_at = None
+        self._write_lock = threading.Lock()
+        self._counts = defaultdict(lambda: [0] * len(self.buckets_ms))
+        self._sums = defaultdict(float)
+        self._totals = defaultdict(int)
+        self._attrs = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def record(self, record):
+        name = record["name"]
+        duration = record["duration_ms"]
+        with self._lock:
+            counts = self._counts[name]
+            for i, bound in enumerate(self.buckets_ms):
+                if duration <= bound:
+                    counts[i] += 1
+            self._sums[name] += duration / 1000
+            self._totals[name] += 1
+            for attr in COUNTED_ATTRS:
+                value = record.get(attr)
+                if isinstance(value, (int, float)):
+                    self._attrs[(attr, name)] += value
+        if self.path is not None and (self._flushed_at is None or time.monotonic() - self._flushed_at >= self.flush_seconds):
+            self.write()
+
+    def render(self):
+        metric = f"{self.prefix}_stage_duration_seconds"
+        lines = [f"# HELP {metric} Time spent per pipeline stage.", f"# TYPE {metric} histogram"]
+        with self._lock:
+            for name in sorted(self._totals):
+                for bound, count in zip(self.buckets_ms, self._counts[name]):
+                    lines.append(f'{metric}_bucket{{stage="{name}",le="{bound / 1000:g}"}} {count}')
+                lines.append(f'{metric}_bucket{{stage="{name}",le="+Inf"}} {self._totals[name]}')
+                lines.append(f'{metric}_sum{{stage="{name}"}} {self._sums[name]:.6f}')
+                lines.append(f'{metric}_count{{stage="{name}"}} {self._totals[name]}')
+            for attr in COUNTED_ATTRS:
+                stages = sorted(stage for a, stage in self._attrs if a == attr)
+                if not stages:
+                    continue
+                counter = f"{self.prefix}_{attr}_total"
+                lines.append(f"# TYPE {counter} counter")
+                for stage in stages:
+                    lines.append(f'{counter}{{stage="{stage}"}} {self._attrs[(attr, stage)]:g}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path = None):
+        path = path or self.path
+        with self._write_lock:
+            self._flushed_at = time.monotonic()
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(self.render())
+            os.replace(tmp_path, path)
+
+
+def sink_from_spec(spec):
+    """Builds a sink from "memory", "jsonl:<path>" or "prometheus[:<path>]"."""
+    kind, _, arg = spec.partition(":")
+    if kind == "memory":
+        return HistogramSink()
+    if kind == "jsonl":
+        return JsonLinesSink(arg or "traces.jsonl")
+    if kind == "prometheus":
+        return PrometheusSink(path=arg or None)
+    raise ValueError(f"Unknown trace sink: {spec}")
+
+
+class LLMTraceHandler(BaseCallbackHandler):
+    """Emits an "llm_call" span per model call, with the provider's token counts."""
+
+    def __init__(self):
+        self._starts = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self._starts.pop(run_id, None)
+        if start is None or not enabled():
+            return
+        emit("llm_call", time.perf_counter() - start, _token_usage(response))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._starts.pop(run_id, None)
+
+def _token_usage(response):
+    # Groq reports usage in llm_output; streamed or newer messages carry it
+    # in usage_metadata instead
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return {"prompt_tokens": usage.get("prompt_tokens"), "completion_tokens": usage.get("completion_tokens")}
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if metadata:
+                return {"prompt_tokens": metadata.get("input_tokens"), "completion_tokens": metadata.get("output_tokens")}
+    return {}
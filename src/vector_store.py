@@ -1,99 +1,336 @@
-from langchain_community.vectorstores import Chroma
-from langchain_community.retrievers import BM25Retriever
-from langchain.retrievers import EnsembleRetriever
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.documents import Document
+import numpy as np
+from typing import Any, List, Optional
 from src.embeddings import load_embedding_model
+from src.manifest import SourceManifest, chunk_source, content_hash, chunk_ids
+from src.bm25_index import get_bm25_index, drop_bm25_index, drop_bm25_indexes
+from src.hybrid_retriever import FusionRetriever
+from src.flat_store import FlatVectorStore, get_flat_collection, drop_flat_collections
+from src.tracing import span
+from src.ann import hnsw_metadata, search_params
+from src.mmr import mmr_by_vector
 import os
+import threading
 os.environ["ANONYMIZED_TELEMETRY"] = "False"
 
 CHROMA_PATH = ".chroma"
+MANIFEST_PATH = os.path.join(CHROMA_PATH, "manifest.json")
+# The memory-mapped flat backend keeps its own vectors, manifest and BM25
+# index, so switching backends does not mix up what has been ingested where
+FLAT_PATH = os.path.join(CHROMA_PATH, "flat")
+BACKENDS = ("chroma", "flat")
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+# "int8" or "binary" for a quantized first pass with full-precision rescoring
+FLAT_QUANTIZATION = os.getenv("FLAT_QUANTIZATION") or None
+# IVF lists scanned per query once a flat collection has an IVF index
+FLAT_NPROBE = int(os.getenv("FLAT_NPROBE", "8"))
 
-def get_vector_store(embedding_model = None):
+# Bumped whenever the indexed corpus changes, so caches can tell they are stale
+_corpus_version = 0
+
+def corpus_version():
+    return _corpus_version
+
+def bump_corpus_version():
+    global _corpus_version
+    _corpus_version += 1
+
+COLLECTION_NAME = "rag_collection"
+_client_lock = threading.Lock()
+
+def backend_path(backend = None):
+    backend = backend or VECTOR_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown vector store backend: {backend}")
+    return CHROMA_PATH if backend == "chroma" else FLAT_PATH
+
+def get_vector_store(embedding_model = None, collection_name = COLLECTION_NAME, backend = None, hnsw = None):
+    # hnsw is a dict of M, construction_ef and search_ef for a new Chroma
+    # collection; an existing collection keeps the values it was built with
     if embedding_model is None:
         embedding_model = load_embedding_model()
 
-    vector_store = Chroma(
-        collection_name= "rag_collection",
-        embedding_function= embedding_model,
-        persist_directory= CHROMA_PATH
-    )
+    backend = backend or VECTOR_BACKEND
+    if backend == "flat":
+        collection = get_flat_collection(os.path.join(FLAT_PATH, collection_name), FLAT_QUANTIZATION, nprobe=FLAT_NPROBE)
+        return FlatVectorStore(collection, embedding_model)
+    if backend != "chroma":
+        raise ValueError(f"Unknown vector store backend: {backend}")
+
+    # Imported here: Chroma and langchain_community take seconds to import and
+    # are not needed for the flat backend or before the first query
+    from langchain_community.vectorstores import Chroma
+
+    # Chroma's first client for a path sets up the database, which is not safe
+    # to race from several threads
+    with _client_lock:
+        vector_store = Chroma(
+            collection_name= collection_name,
+            embedding_function= embedding_model,
+            persist_directory= CHROMA_PATH,
+            collection_metadata= hnsw_metadata(**hnsw) if hnsw else None
+        )
     return vector_store
 
-def add_documents(chunks, embedding_model = None):
+def get_manifest(backend = None):
+    return SourceManifest(os.path.join(backend_path(backend), "manifest.json"))
+
+def bm25_path(backend = None, collection_name = COLLECTION_NAME):
+    # One index per collection, so sweep or test collections sharing a
+    # backend directory do not index into each other
+    return os.path.join(backend_path(backend), "bm25", f"{collection_name}.npz")
+
+def store_location(vector_store):
+    backend = getattr(vector_store, "backend", "chroma")
+    collection = vector_store._collection
+    name = collection.name if backend == "chroma" else os.path.basename(collection.path)
+    return backend, name
+
+def get_bm25(vector_store = None, backend = None, collection_name = COLLECTION_NAME):
+    if vector_store is not None:
+        backend, collection_name = store_location(vector_store)
+    return get_bm25_index(bm25_path(backend, collection_name), vector_store)
+
+def delete_collection(vector_store):
+    # Removes the collection together with its BM25 index
+    path = bm25_path(*store_location(vector_store))
+    vector_store.delete_collection()
+    drop_bm25_index(path)
+    if os.path.exists(path):
+        os.remove(path)
+    bump_corpus_version()
+
+def add_documents(chunks, embedding_model = None, batch_size = 50, backend = None):
     if embedding_model is None:
         embedding_model = load_embedding_model()
 
-    vector_store = get_vector_store(embedding_model)
+    vector_store = get_vector_store(embedding_model, backend=backend)
+    manifest = get_manifest(backend)
+    bm25 = get_bm25(vector_store)
 
-    existing = vector_store.get()
-    existing_sources = set()
-    if existing and existing["metadatas"]:
-        for meta in existing["metadatas"]:
-            if "file_name" in meta:
-                existing_sources.add(meta["file_name"])
-            elif "source" in meta:
-                existing_sources.add(meta["source"])
+    by_source = {}
+    for chunk in chunks:
+        by_source.setdefault(chunk_source(chunk), []).append(chunk)
 
     new_chunks = []
-    for chunk in chunks:
-        source = chunk.metadata.get("file_name") or chunk.metadata.get("source")
-        if source not in existing_sources:
-            new_chunks.append(chunk)
+    new_ids = []
+    stale_ids = []
+    for source, source_chunks in by_source.items():
+        source_hash = content_hash(source, source_chunks)
+        if manifest.is_unchanged(source, source_hash):
+            continue
+
+        ids = chunk_ids(source, len(source_chunks))
+        entry = manifest.get(source)
+        if entry is not None:
+            old_ids = entry["chunk_ids"]
+        else:
+            # Sources ingested before the manifest existed are found by metadata
+            key = "file_name" if source_chunks[0].metadata.get("file_name") else "source"
+            old_ids = vector_store.get(where={key: source}, include=[])["ids"]
+
+        # New chunks overwrite old ones with the same position, the rest go
+        current = set(ids)
+        stale_ids.extend(i for i in old_ids if i not in current)
+
+        new_chunks.extend(source_chunks)
+        new_ids.extend(ids)
+        manifest.record(source, source_hash, ids)
 
     if not new_chunks:
         print("No new documents to add")
         return vector_store
-    
-    batch_size = 50
+
+    if stale_ids:
+        vector_store.delete(ids=stale_ids)
+        bm25.remove(stale_ids)
+        print(f"Removed {len(stale_ids)} stale chunks from changed sources")
+
     for i in range(0, len(new_chunks), batch_size):
         batch = new_chunks[i:i + batch_size]
-        vector_store.add_documents(batch)
+        vector_store.add_documents(batch, ids=new_ids[i:i + batch_size])
         print(f"Added batch {i//batch_size + 1}, chunks {i} to {i + len(batch)}")
-    
-    print(f"Adding {len(chunks)} new chunks to the vector store")
+
+    bm25.add(new_ids, [chunk.page_content for chunk in new_chunks])
+    bm25.save()
+    manifest.save()
+    bump_corpus_version()
+    print(f"Added {len(new_chunks)} new chunks to the vector store")
 
     print("Done")
     return vector_store
 
-def similarity_search(query, k = 4, embedding_model = None):
-    if embedding_model is None:
-        embedding_model = load_embedding_model()
+def write_embedded_chunks(vector_store, ids, chunks, vectors):
+    # Vectors are already computed, so write straight to the collection
+    # instead of going through add_documents and embedding again
+    vector_store._collection.upsert(
+        ids=ids,
+        embeddings=vectors,
+        documents=[chunk.page_content for chunk in chunks],
+        metadatas=[chunk.metadata for chunk in chunks]
+    )
 
-    vector_store = get_vector_store(embedding_model)
-    results = vector_store.similarity_search(query, k=k)
+def similarity_search(query, k = 4, embedding_model = None, vector_store = None, ef_search = None, nprobe = None):
+    if vector_store is None:
+        vector_store = get_vector_store(embedding_model)
+    with span("similarity_search", k=k), search_params(vector_store, ef_search, nprobe):
+        results = vector_store.similarity_search(query, k=k)
 
     return results
 
-def get_retriever(k = 4, embedding_model = None):
-    if embedding_model is None:
-        embedding_model = load_embedding_model
+def _mmr_from_query_result(query_embedding, result, row, k, lambda_mult):
+    if not result["ids"][row]:
+        return []
+
+    # The vectors come back with the query, so MMR needs no second lookup
+    selected, similarities = mmr_by_vector(query_embedding, result["embeddings"][row], k, lambda_mult)
+
+    # Chroma's MMR search returns the picks in their original rank order
+    results = []
+    for i in sorted(selected):
+        doc = Document(id=result["ids"][row][i], page_content=result["documents"][row][i], metadata=result["metadatas"][row][i] or {})
+        results.append((doc, float(similarities[i])))
+    return results
+
+def mmr_search_with_scores(query, k = 4, fetch_k = None, lambda_mult = 0.7, embedding_model = None, vector_store = None, ef_search = None, nprobe = None):
+    # Same selection as the "mmr" retriever, but from a single Chroma query
+    # that also returns what is needed to score each selected chunk
+    if vector_store is None:
+        vector_store = get_vector_store(embedding_model)
+    if fetch_k is None:
+        fetch_k = k*3
+
+    with span("query_embedding"):
+        query_embedding = np.array(vector_store.embeddings.embed_query(query), dtype=np.float32)
+    with span("mmr_search", k=k, fetch_k=fetch_k):
+        with search_params(vector_store, ef_search, nprobe):
+            result = vector_store._collection.query(
+                query_embeddings=[query_embedding.tolist()],
+                n_results=fetch_k,
+                include=["documents", "metadatas", "embeddings"]
+            )
+        return _mmr_from_query_result(query_embedding, result, 0, k, lambda_mult)
+
+def mmr_search_batch_with_scores(queries, k = 4, fetch_k = None, lambda_mult = 0.7, embedding_model = None, vector_store = None, ef_search = None, nprobe = None):
+    # All queries are embedded in one model call and searched in one Chroma call
+    if vector_store is None:
+        vector_store = get_vector_store(embedding_model)
+    if fetch_k is None:
+        fetch_k = k*3
+    if not queries:
+        return []
+
+    with span("query_embedding", queries=len(queries)):
+        query_embeddings = np.array(vector_store.embeddings.embed_documents(list(queries)), dtype=np.float32)
+    with span("mmr_search", k=k, fetch_k=fetch_k, queries=len(queries)):
+        with search_params(vector_store, ef_search, nprobe):
+            result = vector_store._collection.query(
+                query_embeddings=query_embeddings.tolist(),
+                n_results=fetch_k,
+                include=["documents", "metadatas", "embeddings"]
+            )
+        return [
+            _mmr_from_query_result(query_embeddings[row], result, row, k, lambda_mult)
+            for row in range(len(queries))
+        ]
+
+class MMRRetriever(BaseRetriever):
+    """Semantic retriever that runs MMR on the vectors returned with the query.
+
+    Replaces the store's own "mmr" retriever, which fetches the candidates
+    and then recomputes similarities to every selected chunk on each pick.
+    """
+
+    vector_store: Any
+    k: int = 4
+    fetch_k: int = 12
+    lambda_mult: float = 0.7
+    ef_search: Optional[int] = None
+    nprobe: Optional[int] = None
+
+    def _get_relevant_documents(self, query, *, run_manager = None) -> List[Document]:
+        results = mmr_search_with_scores(
+            query, k=self.k, fetch_k=self.fetch_k, lambda_mult=self.lambda_mult,
+            vector_store=self.vector_store, ef_search=self.ef_search, nprobe=self.nprobe
+        )
+        return [doc for doc, _ in results]
 
-    vector_store = get_vector_store(embedding_model)
-    return vector_store.as_retriever(
-        search_type = "mmr",
-        search_kwargs = {"k":k, "fetch_k":k*3, "lambda_mult": 0.7})
+def get_retriever(k = 4, embedding_model = None, vector_store = None, backend = None, ef_search = None, nprobe = None):
+    if vector_store is None:
+        vector_store = get_vector_store(embedding_model, backend=backend)
+
+    return MMRRetriever(vector_store=vector_store, k=k, fetch_k=k*3, lambda_mult=0.7, ef_search=ef_search, nprobe=nprobe)
 
 def clear_vector_store():
     import shutil
     if os.path.exists(CHROMA_PATH):
         shutil.rmtree(CHROMA_PATH)
         print("Vector store cleared")
+    # Chroma caches one client per path, which would keep pointing at the
+    # deleted files; drop it along with the cached BM25 index
+    from chromadb.api.client import SharedSystemClient
+    SharedSystemClient.clear_system_cache()
+    drop_flat_collections()
+    for backend in BACKENDS:
+        drop_bm25_indexes(os.path.join(backend_path(backend), "bm25"))
+    bump_corpus_version()
 
-def get_hybrid_retriever(chunks, k = 4, embedding_model = None):
-    if embedding_model is None:
-        embedding_model = load_embedding_model()
+class StoreBM25Retriever(BaseRetriever):
+    """BM25 over the persistent index, returning documents stored in Chroma."""
 
-    vector_store = get_vector_store(embedding_model)
-    semantic_retriever= vector_store.as_retriever(
-        search_type = "mmr",
-        search_kwargs={"k":k, "lambda_mult": 0.7, "fetch_k": k*3}
-    )
+    vector_store: Any
+    index: Any
+    k: int = 4
+
+    def _get_relevant_documents(self, query, *, run_manager = None) -> List[Document]:
+        hits = self.index.search(query, k=self.k)
+        if not hits:
+            return []
+
+        ids = [doc_id for doc_id, _ in hits]
+        stored = self.vector_store.get(ids=ids, include=["documents", "metadatas"])
+        by_id = {
+            doc_id: Document(page_content=text, metadata=meta or {})
+            for doc_id, text, meta in zip(stored["ids"], stored["documents"], stored["metadatas"])
+        }
+        return [by_id[doc_id] for doc_id in ids if doc_id in by_id]
+
+def get_bm25_retriever(k = 4, embedding_model = None, vector_store = None, backend = None):
+    if vector_store is None:
+        vector_store = get_vector_store(embedding_model, backend=backend)
+
+    return StoreBM25Retriever(vector_store=vector_store, index=get_bm25(vector_store), k=k)
+
+def get_hybrid_retriever(chunks = None, k = 4, embedding_model = None, vector_store = None, fusion = "rrf", weights = (0.7, 0.3), backend = None, ef_search = None, nprobe = None):
+    if vector_store is None:
+        vector_store = get_vector_store(embedding_model, backend=backend)
+
+    if chunks is None:
+        return FusionRetriever(
+            vector_store=vector_store,
+            index=get_bm25(vector_store),
+            k=k,
+            fetch_k=k*3,
+            lambda_mult=0.7,
+            fusion=fusion,
+            weights=tuple(weights),
+            ef_search=ef_search,
+            nprobe=nprobe
+        )
+
+    # An explicit chunk list keeps the original sequential ensemble
+    from langchain_community.retrievers import BM25Retriever
+    from langchain.retrievers import EnsembleRetriever
+
+    semantic_retriever = MMRRetriever(vector_store=vector_store, k=k, fetch_k=k*3, lambda_mult=0.7, ef_search=ef_search, nprobe=nprobe)
 
     bm25_retriever = BM25Retriever.from_documents(documents=chunks)
     bm25_retriever.k = k
 
     ensemble_retriever = EnsembleRetriever(
         retrievers=[semantic_retriever, bm25_retriever],
-        weights=[0.7,0.3]
+        weights=list(weights)
     )
 
     return ensemble_retriever
\ No newline at end of file
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from src import vector_store as vs
+from src.ann import search_params, hnsw_params
+from src.flat_store import FlatCollection, probe
+
+os.chdir(tempfile.mkdtemp())
+rng = np.random.default_rng(0)
+vectors = rng.normal(size=(5000, 32)).astype(np.float32)
+queries = rng.normal(size=(50, 32)).astype(np.float32)
+dist = np.einsum("ij,ij->i", vectors, vectors)[None, :] - 2 * (queries @ vectors.T)
+truth = [set(row.tolist()) for row in np.argsort(dist, axis=1)[:, :10]]
+
+def recall(found):
+    return np.mean([len(set(f) & t) / 10 for f, t in zip(found, truth)])
+
+# Chroma: HNSW parameters per collection, ef_search per query
+store = vs.get_vector_store(DeterministicFakeEmbedding(size=32), collection_name="ann_test", hnsw={"M": 4, "construction_ef": 10, "search_ef": 10})
+assert hnsw_params(store) == {"M": 4, "construction_ef": 10, "search_ef": 10}
+store._collection.add(ids=[str(i) for i in range(len(vectors))], embeddings=vectors.tolist())
+
+def chroma_search(ef = None):
+    found = []
+    for query in queries:
+        with search_params(store, ef_search=ef):
+            result = store._collection.query(query_embeddings=[query.tolist()], n_results=10, include=[])
+        found.append([int(i) for i in result["ids"][0]])
+    return recall(found)
+
+low, high, restored = chroma_search(), chroma_search(ef=500), chroma_search()
+print(f"Chroma recall@10: ef=10 {low:.2f}, ef=500 {high:.2f}, after restore {restored:.2f}")
+assert high > low + 0.3 and restored == low
+
+# Searches at the default ef running next to overriding ones keep their own ef
+from concurrent.futures import ThreadPoolExecutor
+
+def chroma_ids(ef = None):
+    found = []
+    for query in queries:
+        with search_params(store, ef_search=ef):
+            found.append(store._collection.query(query_embeddings=[query.tolist()], n_results=10, include=[])["ids"][0])
+    return found
+
+expected = {None: chroma_ids(), 500: chroma_ids(500)}
+with ThreadPoolExecutor(max_workers=6) as pool:
+    runs = [(ef, pool.submit(chroma_ids, ef)) for ef in [None, 500] * 3]
+assert all(future.result() == expected[ef] for ef, future in runs)
+print("Concurrent default and overridden ef searches ok")
+
+# Flat: IVF lists with nprobe per query
+collection = FlatCollection(os.path.join(os.getcwd(), "ivf"), nprobe=2)
+collection.upsert([str(i) for i in range(4000)], vectors[:4000])
+collection.build_ivf(50)
+collection.upsert([str(i) for i in range(4000, 5000)], vectors[4000:])
+
+def flat_search():
+    return [[int(collection.ids[r]) for r in rows] for rows in collection.top_k(queries, 10)[0]]
+
+narrow = recall(flat_search())
+with probe(50):
+    full = recall(flat_search())
+reloaded = FlatCollection(collection.path, nprobe=2)
+assert len(reloaded._centroids) == 50 and len(reloaded._assign) == 5000
+print(f"IVF recall@10: nprobe=2 {narrow:.2f}, nprobe=50 {full:.2f}")
+assert full == 1.0 and narrow < full
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import time
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from src import vector_store as vs
+from src.answer_cache import SemanticAnswerCache
+
+os.chdir(tempfile.mkdtemp())
+embedding_model = DeterministicFakeEmbedding(size=64)
+
+def cache(**kwargs):
+    return SemanticAnswerCache(embedding_model, **kwargs)
+
+def similarity(a, b):
+    a, b = np.array(embedding_model.embed_query(a)), np.array(embedding_model.embed_query(b))
+    return float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+question = "When was the transformer introduced?"
+paraphrase = "When did the transformer come out?"
+
+# A question hits when its similarity to a cached one reaches the threshold
+sim = similarity(question, paraphrase)
+print(f"Similarity of the paraphrase: {sim:.4f}")
+for threshold, expected_hit in [(sim - 1e-3, True), (sim + 1e-3, False)]:
+    answers = cache(threshold=threshold)
+    answers.store(question, "In 2017.", ["transformers.txt"], latency=1.5)
+    hit = answers.lookup(paraphrase)
+    assert (hit is not None) == expected_hit, threshold
+    if expected_hit:
+        assert hit["answer"] == "In 2017." and hit["question"] == question
+        assert answers.stats()["hits"] == 1 and answers.stats()["saved_seconds"] == 1.5
+    else:
+        assert answers.stats()["misses"] == 1
+assert cache().lookup(question) is None
+
+# Entries expire after ttl_seconds
+answers = cache(ttl_seconds=0.05)
+answers.store(question, "In 2017.", [], latency=1.0)
+assert answers.lookup(question) is not None
+time.sleep(0.1)
+assert answers.lookup(question) is None and answers.stats()["entries"] == 0
+
+# Past max_entries the least recently used entry goes; a lookup counts as a use
+answers = cache(max_entries=2)
+answers.store("first question", "1", [], latency=1.0)
+answers.store("second question", "2", [], latency=1.0)
+assert answers.lookup("first question")["answer"] == "1"
+answers.store("third question", "3", [], latency=1.0)
+assert answers.lookup("second question") is None
+assert answers.lookup("first question")["answer"] == "1" and answers.lookup("third question")["answer"] == "3"
+
+# Changing the corpus drops every entry
+answers = cache()
+answers.store(question, "In 2017.", [], latency=1.0)
+vs.add_documents([Document(page_content="The transformer was introduced in 2017", metadata={"file_name": "a.txt"})], embedding_model)
+assert answers.lookup(question) is None
+answers.store(question, "In 2017.", [], latency=1.0)
+vs.clear_vector_store()
+assert answers.lookup(question) is None
+
+# An answer retrieved before the corpus changed is not stored as current
+version = vs.corpus_version()
+vs.bump_corpus_version()
+answers.store(question, "stale", [], latency=1.0, version=version)
+assert answers.lookup(question) is None
+answers.store(question, "fresh", [], latency=1.0, version=vs.corpus_version())
+assert answers.lookup(question)["answer"] == "fresh"
+
+print("All answer cache checks passed")
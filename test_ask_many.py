@@ -0,0 +1,59 @@
+import os
+import tempfile
+import time
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.runnables import RunnableLambda
+from src.rag_chain import RAGEngine
+from src.vector_store import add_documents
+
+# Offline: fake embeddings, a stub LLM and a throwaway Chroma store
+os.chdir(tempfile.mkdtemp())
+embedding_model = DeterministicFakeEmbedding(size=32)
+add_documents([
+    Document(page_content="The transformer architecture was introduced in 2017", metadata={"file_name": "transformers.txt"}),
+    Document(page_content="BERT uses only the encoder portion of the transformer", metadata={"file_name": "transformers.txt"}),
+    Document(page_content="GPT uses only the decoder portion of the transformer", metadata={"file_name": "transformers.txt"}),
+], embedding_model)
+
+def stub_llm(prompt):
+    # Each call takes 0.2s; the question marked "fail" raises
+    time.sleep(0.2)
+    question = prompt.to_string().split("Question:")[-1].split("Answer:")[0].strip()
+    if "fail" in question:
+        raise RuntimeError("stub failure")
+    return f"answer to {question}"
+
+engine = RAGEngine(embedding_model=embedding_model, k=2, llm=RunnableLambda(stub_llm))
+
+questions = [f"question {i}" for i in range(8)] + ["please fail"]
+start = time.perf_counter()
+results = engine.ask_many(questions, max_concurrency=4)
+elapsed = time.perf_counter() - start
+
+for result in results:
+    print(f"{result.question:<12} -> {result.answer or result.error}")
+print(f"\n{len(questions)} questions in {elapsed:.2f}s")
+
+assert [r.question for r in results] == questions
+assert all(r.answer == f"answer to {q}" for r, q in zip(results[:-1], questions))
+assert results[-1].error is not None and results[-1].answer == ""
+# 9 calls of 0.2s with 4 in flight take 3 rounds, not 9
+assert elapsed < 9 * 0.2
+
+# A question that breaks the batched retrieval only fails its own item
+class PoisonedEmbeddings(DeterministicFakeEmbedding):
+    def embed_documents(self, texts):
+        if any("poison" in text for text in texts):
+            raise RuntimeError("cannot embed poison")
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+engine = RAGEngine(embedding_model=PoisonedEmbeddings(size=32), k=2, llm=RunnableLambda(stub_llm))
+results = engine.ask_many(["question 0", "poison question", "question 2"], max_concurrency=4)
+assert [r.answer for r in results] == ["answer to question 0", "", "answer to question 2"]
+assert "cannot embed poison" in results[1].error
+assert all(len(r.docs) == 2 for r in (results[0], results[2]))
+print("Batch retrieval failure reported per item")
@@ -0,0 +1,57 @@
+import os
+import tempfile
+from src.bm25_index import BM25Index
+
+texts = [
+    "The transformer architecture was introduced in 2017",
+    "Self-attention computes a query, key and value vector for each token",
+    "BERT uses only the encoder and is trained with masked language modeling",
+    "GPT uses only the decoder and is trained with next token prediction",
+]
+ids = [f"chunk-{i}" for i in range(len(texts))]
+
+path = os.path.join(tempfile.mkdtemp(), "bm25.npz")
+index = BM25Index(path)
+index.add(ids, texts)
+index.save()
+
+# Reload from disk and search without the original chunk list
+index = BM25Index.load(path)
+hits = index.search("which model uses the decoder", k=2)
+print(f"Hits: {hits}")
+assert hits[0][0] == "chunk-3"
+
+# Replacing a chunk updates its postings, removing one drops it from results
+index.add(["chunk-3"], ["GPT is an autoregressive model"])
+assert index.search("decoder", k=2) == []
+index.remove(["chunk-0"])
+assert all(doc_id != "chunk-0" for doc_id, _ in index.search("transformer 2017", k=4))
+print(f"Documents after updates: {len(index)}")
+
+# Each collection of a backend has its own index, removed with the collection
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from src import vector_store as vs
+
+os.chdir(tempfile.mkdtemp())
+embedding_model = DeterministicFakeEmbedding(size=16)
+for backend in vs.BACKENDS:
+    stores = {}
+    for name in ("rag_collection", "sweep_collection"):
+        stores[name] = vs.get_vector_store(embedding_model, collection_name=name, backend=backend)
+        doc_id = f"{name}-0"
+        stores[name].add_documents([Document(page_content=f"only in {name}")], ids=[doc_id])
+        vs.get_bm25(stores[name]).add([doc_id], [f"only in {name}"])
+    assert [doc_id for doc_id, _ in vs.get_bm25(stores["rag_collection"]).search("sweep_collection")] == []
+    assert vs.get_bm25(stores["sweep_collection"]).search("sweep_collection")[0][0] == "sweep_collection-0"
+
+    vs.get_bm25(stores["sweep_collection"]).save()
+    sweep_path = vs.bm25_path(backend, "sweep_collection")
+    assert os.path.exists(sweep_path)
+    vs.delete_collection(stores["sweep_collection"])
+    assert not os.path.exists(sweep_path)
+    assert vs.get_bm25(stores["rag_collection"]).search("rag_collection")[0][0] == "rag_collection-0"
+    print(f"{backend}: one BM25 index per collection")
+
+vs.clear_vector_store()
+print("All BM25 index checks passed")
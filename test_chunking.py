@@ -0,0 +1,54 @@
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from src.document_loader import chunk_documents, split_offsets, word_spans
+
+paragraphs = []
+for p in range(40):
+    lines = [" ".join(f"p{p}l{l}w{w}" for w in range(8)) for l in range(6)]
+    paragraphs.append("\n".join(lines))
+text = "\n\n".join(paragraphs)
+page = Document(page_content=text, metadata={"file_name": "notes.pdf", "page": 3})
+
+# Offsets index the page text exactly and the page number is kept
+chunks = chunk_documents([page], chunk_size=500, chunk_overlap=50)
+for chunk in chunks:
+    assert text[chunk.metadata["start_index"]:chunk.metadata["end_index"]] == chunk.page_content
+    assert chunk.metadata["page"] == 3 and chunk.metadata["file_name"] == "notes.pdf"
+    assert len(chunk.page_content) <= 500
+print(f"{len(chunks)} chunks, offsets match the page text")
+
+# Every word lands in a chunk, in order, and chunks end on line breaks here
+words = text.split()
+assert words == [text[s:e] for s, e in zip(*word_spans(text)[:2])]
+seen = set()
+for chunk in chunks:
+    seen.update(chunk.page_content.split())
+    assert text[chunk.metadata["end_index"]:chunk.metadata["end_index"] + 1] in ("\n", "")
+assert seen == set(words)
+
+# Close to the recursive splitter it replaces
+reference = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50).split_text(text)
+assert abs(len(chunks) - len(reference)) <= max(2, len(reference) // 10), (len(chunks), len(reference))
+
+# Token sizing: no chunk goes over the budget, overlap is kept between words
+count = lambda word: len(word) // 3 + 1
+flat = " ".join(words)
+for start, end in split_offsets(flat, chunk_size=64, chunk_overlap=8, count_tokens=count):
+    assert sum(count(w) for w in flat[start:end].split()) <= 64
+token_chunks = chunk_documents([Document(page_content=flat)], chunk_size=64, chunk_overlap=8, tokenizer=count)
+assert token_chunks[1].metadata["start_index"] < token_chunks[0].metadata["end_index"]
+
+# A word longer than a chunk is cut into character windows
+long_word = "x" * 1200
+offsets = split_offsets(f"short {long_word} tail", chunk_size=500, chunk_overlap=50)
+assert all(end - start <= 500 for start, end in offsets)
+assert offsets[-1] == (len("short ") + 1200 + 1, len("short ") + 1200 + 5)
+
+try:
+    split_offsets(text, chunk_size=10, chunk_overlap=20)
+    raise AssertionError("expected ValueError")
+except ValueError:
+    pass
+assert split_offsets("  \n\n ") == []
+
+print("All chunking checks passed")
@@ -0,0 +1,58 @@
+import os
+import tempfile
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import FakeListChatModel
+from src.vector_store import add_documents
+from src.document_loader import chunk_documents
+from src.context_packing import pack_context, estimate_tokens
+from src.rag_chain import format_docs, RAGEngine
+
+words = [f"word{i}" for i in range(600)]
+text = " ".join(words)
+chunks = chunk_documents([Document(page_content=text, metadata={"file_name": "notes.txt"})], chunk_size=200, chunk_overlap=50)
+assert all(text[c.metadata["start_index"]:c.metadata["start_index"] + len(c.page_content)] == c.page_content for c in chunks)
+
+# Overlapping neighbours merge back into the original span of text
+picked = [chunks[3], chunks[4], chunks[5]]
+packed = pack_context(picked, token_budget=10000)
+assert len(packed.docs) == 1 and packed.merged == 2
+start = chunks[3].metadata["start_index"]
+end = chunks[5].metadata["start_index"] + len(chunks[5].page_content)
+assert packed.docs[0].page_content == text[start:end]
+assert estimate_tokens(format_docs(packed.docs)) < estimate_tokens(format_docs(picked))
+print("offset merge:", estimate_tokens(format_docs(picked)), "->", packed.tokens, "tokens")
+
+# Without offsets the overlap is found in the text
+stripped = [Document(page_content=c.page_content, metadata={"file_name": "notes.txt"}) for c in (chunks[8], chunks[7])]
+packed = pack_context(stripped, token_budget=10000)
+assert len(packed.docs) == 1
+assert packed.docs[0].page_content == text[chunks[7].metadata["start_index"]:chunks[8].metadata["start_index"] + len(chunks[8].page_content)]
+
+# Different sources are never merged, near-duplicates are dropped
+copy = Document(page_content=chunks[3].page_content, metadata={"file_name": "copy.txt"})
+other = chunks[12]
+packed = pack_context([chunks[3], copy, other], token_budget=10000)
+assert packed.duplicates == 1
+assert [d.metadata["file_name"] for d in packed.docs] == ["notes.txt", "notes.txt"]
+
+# The budget is filled by relevance and the top passage is truncated if needed
+ranked = [chunks[20], chunks[2], chunks[30]]
+one = estimate_tokens(format_docs([chunks[20]]))
+packed = pack_context(ranked, token_budget=one + 5)
+assert [d.page_content for d in packed.docs] == [chunks[20].page_content] and packed.over_budget == 2
+packed = pack_context(ranked, token_budget=one // 2)
+assert packed.truncated and packed.tokens <= one // 2
+assert chunks[20].page_content.startswith(packed.docs[0].page_content)
+
+# The engine packs the context it sends to the model when given a budget
+os.chdir(tempfile.mkdtemp())
+embedding_model = DeterministicFakeEmbedding(size=32)
+add_documents(chunks[:10], embedding_model)
+engine = RAGEngine(embedding_model=embedding_model, k=4, llm=FakeListChatModel(responses=["ok"]), context_budget=200)
+docs = engine.retrieve("word40 word41")
+context = engine.format_context(docs)
+assert estimate_tokens(context) <= 200 < estimate_tokens(format_docs(docs))
+assert engine.ask("word40 word41") == "ok"
+
+print("All context packing checks passed")
@@ -0,0 +1,48 @@
+import sys
+import tempfile
+import numpy as np
+from evaluation.bench_utils import make_corpus, save_random_minilm
+from src.embedding_backends import cosine_parity, length_batches, load_backend
+from src.embeddings import ENCODE_KWARGS, MODEL_KWARGS
+
+# Batches run longest first and cover every text once
+batches = length_batches([3, 9, 1, 9, 4], batch_size=2)
+assert [list(batch) for batch in batches] == [[1, 3], [4, 0], [2]]
+
+# A small model with MiniLM's layout, since the real one cannot be downloaded here
+model_dir = save_random_minilm(tempfile.mkdtemp(), hidden_size=64, layers=2, words=2000)
+cache_path = tempfile.mkdtemp()
+texts = [doc.page_content[:length] for doc, length in zip(make_corpus(40, vocabulary_size=2000), [40, 400, 80, 1200] * 10)]
+
+def load(backend, batch_size = 8):
+    return load_backend(backend, model_dir, MODEL_KWARGS, ENCODE_KWARGS, batch_size=batch_size, threads=1, cache_path=cache_path)
+
+reference = load("torch")
+for backend, threshold in [("onnx", 0.9999), ("onnx-int8", 0.99), ("torch-int8", 0.99)]:
+    parity = cosine_parity(reference, load(backend), texts)
+    print(f"{backend:<10} min cosine {parity['min_cosine']:.5f}  mean {parity['mean_cosine']:.5f}")
+    assert parity["min_cosine"] >= threshold
+
+# Length bucketing does not change the vectors: a text gets the same
+# embedding alone as in a batch of longer ones, and results keep input order
+onnx = load("onnx", batch_size=3)
+batched = np.array(onnx.embed_documents(texts))
+alone = np.array([onnx.embed_query(text) for text in texts])
+assert np.allclose(batched, alone, atol=1e-5)
+assert np.allclose(np.linalg.norm(batched, axis=1), 1.0, atol=1e-5)
+assert onnx.embed_documents([]) == []
+
+# The exported graph is reused, and running it does not need torch
+script = ("import sys; from src.embedding_backends import load_onnx; "
+          f"load_onnx({model_dir!r}, cache_path={cache_path!r}).embed_query('hello'); print('torch' in sys.modules)")
+import subprocess
+uses_torch = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout.strip()
+assert uses_torch == "False"
+
+try:
+    load("tensorrt")
+    raise AssertionError("expected an unknown backend error")
+except ValueError as error:
+    assert "Unknown embedding backend" in str(error)
+
+print("All embedding backend checks passed")
@@ -0,0 +1,31 @@
+import time
+from src.embeddings import load_embedding_model
+
+print("Loading cached embedding model...")
+embeddings = load_embedding_model()
+embeddings.reset_stats()
+
+sentences = [
+    "Energy consumption peaks during winter months",
+    "Power usage increases in cold weather",
+    "The stock market crashed in 2008",
+]
+
+start = time.perf_counter()
+first = embeddings.embed_documents(sentences)
+first_time = time.perf_counter() - start
+print(f"First pass:  {first_time * 1000:.1f} ms, stats: {embeddings.stats()}")
+
+start = time.perf_counter()
+second = embeddings.embed_documents(sentences)
+second_time = time.perf_counter() - start
+print(f"Second pass: {second_time * 1000:.1f} ms, stats: {embeddings.stats()}")
+
+assert first == second
+assert embeddings.stats()["hits"] >= len(sentences)
+
+# The uncached model should produce the same vectors up to float32 rounding
+raw = load_embedding_model(use_cache=False).embed_documents(sentences)
+max_diff = max(abs(a - b) for u, v in zip(raw, first) for a, b in zip(u, v))
+print(f"Max difference vs uncached model: {max_diff:.2e}")
+assert max_diff < 1e-6
@@ -0,0 +1,98 @@
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from src.embedding_cache import CachedEmbeddings
+from src.embedding_service import BatchedEmbeddings, EmbeddingServer, MicroBatcher, SocketEmbeddingClient
+from src.embeddings import LazyEmbeddings, load_embedding_model
+from src.startup import lazy_model
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """Records the size of every embed_documents call and takes a little
+    time per call, so concurrent requests pile up behind it."""
+
+    calls: list = []
+
+    def embed_documents(self, texts):
+        self.calls.append(len(texts))
+        time.sleep(0.01)
+        return super().embed_documents(texts)
+
+
+def run_concurrently(embed, texts):
+    results = [None] * len(texts)
+    def worker(i):
+        results[i] = embed(texts[i])
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(texts))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+reference = DeterministicFakeEmbedding(size=16)
+queries = [f"question number {i}" for i in range(40)]
+
+# Concurrent queries are encoded in a few batches, and every caller gets
+# back its own vector
+model = CountingEmbeddings(size=16, calls=[])
+batcher = MicroBatcher(model, max_batch_size=8, max_wait_ms=20)
+client = BatchedEmbeddings(batcher)
+vectors = run_concurrently(client.embed_query, queries)
+print(f"{len(queries)} queries in {len(model.calls)} batches: {model.calls}")
+assert vectors == [reference.embed_query(query) for query in queries]
+assert sum(model.calls) == len(queries) and max(model.calls) <= 8
+assert len(model.calls) < len(queries)
+assert batcher.stats()["batches"] == len(model.calls)
+
+# Multi-text requests are kept together; one larger than the batch size is
+# encoded on its own
+model.calls.clear()
+assert client.embed_documents(queries[:20]) == reference.embed_documents(queries[:20])
+assert model.calls == [20]
+assert client.embed_documents([]) == []
+batcher.close()
+
+# A failing model fails every request in the batch, and the worker keeps going
+class FlakyEmbeddings(DeterministicFakeEmbedding):
+    def embed_documents(self, texts):
+        if any("boom" in text for text in texts):
+            raise RuntimeError("model failed")
+        return super().embed_documents(texts)
+
+batcher = MicroBatcher(FlakyEmbeddings(size=16), max_batch_size=8, max_wait_ms=0)
+try:
+    batcher.embed(["boom"])
+    raise AssertionError("expected the model error")
+except RuntimeError as error:
+    assert "model failed" in str(error)
+assert batcher.embed(["fine"]) == reference.embed_documents(["fine"])
+batcher.close()
+
+# The same batching over a Unix socket, from a separate client
+path = os.path.join(tempfile.mkdtemp(), "embeddings.sock")
+model = CountingEmbeddings(size=16, calls=[])
+server = EmbeddingServer(path, model, max_batch_size=16, max_wait_ms=20)
+server.start()
+remote = SocketEmbeddingClient(path)
+vectors = run_concurrently(remote.embed_query, queries)
+print(f"Over the socket: {len(queries)} queries in {len(model.calls)} batches")
+assert np.allclose(vectors, [reference.embed_query(query) for query in queries], atol=1e-6)
+assert len(model.calls) < len(queries)
+assert np.allclose(remote.embed_documents(["a", "b"]), reference.embed_documents(["a", "b"]), atol=1e-6)
+server.close()
+assert not os.path.exists(path)
+
+# load_embedding_model puts the cache in front of the shared batcher, and
+# warm-up still finds the lazy model behind it
+embedding_model = load_embedding_model(cache_path=tempfile.mkdtemp(), service="thread")
+assert isinstance(embedding_model, CachedEmbeddings)
+assert isinstance(embedding_model.embedding_model, BatchedEmbeddings)
+assert isinstance(lazy_model(embedding_model), LazyEmbeddings)
+assert load_embedding_model(use_cache=False, service="thread").batcher is embedding_model.embedding_model.batcher
+assert isinstance(load_embedding_model(use_cache=False, service="unix:/tmp/x.sock"), SocketEmbeddingClient)
+
+print("All embedding service checks passed")
@@ -0,0 +1,117 @@
+import json
+import os
+import tempfile
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from evaluation import evaluate
+from evaluation.evaluate import JudgeCache, evaluate_config, parse_scores
+from src.rag_chain import RAGEngine
+from src.rate_limit import RateLimiter
+from src.vector_store import add_documents
+
+# Offline: fake embeddings, stub answer and judge LLMs, and checkpoints and
+# the judge cache in a throwaway directory
+os.chdir(tempfile.mkdtemp())
+evaluate.CHECKPOINT_DIR = os.path.join(os.getcwd(), "checkpoints")
+evaluate.JUDGE_CACHE_PATH = os.path.join(os.getcwd(), "judge_cache.jsonl")
+
+SCORES = {"faithfulness": 1, "answer_relevancy": 0.5, "context_recall": 0.75, "completeness": 1}
+
+# The judge cache key covers everything the judge sees
+key = JudgeCache.key("q", "a", "context", "truth", "judge")
+assert key == JudgeCache.key("q", "a", "context", "truth", "judge")
+for changed in [("q2", "a", "context", "truth", "judge"), ("q", "a", "context", "truth", "judge2"), ("q", "a", "context 2", "truth", "judge")]:
+    assert JudgeCache.key(*changed) != key
+
+# Verdicts are appended to the JSONL file, read back by the next cache and
+# counted as hits when found
+cache = JudgeCache()
+assert cache.path == evaluate.JUDGE_CACHE_PATH
+assert cache.get(key) is None and cache.hits == 0
+cache.put(key, SCORES)
+reloaded = JudgeCache()
+assert reloaded.get(key) == SCORES and reloaded.get(key) == SCORES and reloaded.hits == 2
+assert reloaded.get(JudgeCache.key("q", "a", "context", "truth", "other judge")) is None and reloaded.hits == 2
+os.remove(evaluate.JUDGE_CACHE_PATH)
+
+# Scores are parsed out of prose or a code fence, and integers become floats
+plain = json.dumps(SCORES)
+assert parse_scores(plain) == {metric: float(score) for metric, score in SCORES.items()}
+assert parse_scores(f"Here are the scores:\n```json\n{plain}\n```\nHope this helps.") == parse_scores(plain)
+for bad in ["I cannot score this.", json.dumps({**SCORES, "completeness": "high"}), json.dumps({"faithfulness": 1})]:
+    try:
+        parse_scores(bad)
+        raise AssertionError(f"expected a ValueError for {bad!r}")
+    except ValueError:
+        pass
+print("Judge cache and score parsing checks passed")
+
+embedding_model = DeterministicFakeEmbedding(size=32)
+add_documents([
+    Document(page_content="The transformer architecture was introduced in 2017", metadata={"file_name": "transformers.txt"}),
+    Document(page_content="BERT uses only the encoder portion of the transformer", metadata={"file_name": "transformers.txt"}),
+], embedding_model)
+
+def answer(prompt):
+    question = prompt.to_string().split("Question:")[-1].split("Answer:")[0].strip()
+    return f"answer to {question}"
+
+judged = []
+failing = {"flaky question"}
+
+def judge(prompt):
+    question = prompt.split("Question:")[1].split("\n")[0].strip()
+    judged.append(question)
+    if question in failing:
+        raise RuntimeError("judge unavailable")
+    return AIMessage(content=f"Sure:\n{json.dumps(SCORES)}")
+
+engines = []
+
+def get_engine():
+    engines.append(1)
+    return RAGEngine(embedding_model=embedding_model, k=1, llm=RunnableLambda(answer))
+
+test_set = [{"question": q, "ground_truth": "2017"} for q in ["question 0", "question 1", "flaky question", "question 3"]]
+config = {"k": 1, "chunk_size": 500, "chunk_overlap": 50}
+judge_llm = RunnableLambda(judge)
+limiter = RateLimiter(0)
+checkpoint_path = os.path.join(evaluate.CHECKPOINT_DIR, "run.jsonl")
+
+def run(cache, **kwargs):
+    judged.clear()
+    engines.clear()
+    return evaluate_config(test_set, get_engine, config, "run", judge_llm, cache, limiter, max_concurrency=2, verbose=False, **kwargs)
+
+def checkpointed():
+    with open(checkpoint_path) as f:
+        return sorted(json.loads(line)["index"] for line in f if line.strip())
+
+# A failed item is reported and kept out of the checkpoint
+results = run(JudgeCache())
+assert results["items"]["evaluated"] == 3 and [f["index"] for f in results["items"]["failed"]] == [2]
+assert "judge unavailable" in results["items"]["failed"][0]["error"]
+assert checkpointed() == [0, 1, 3]
+
+# Resuming only runs what the checkpoint is missing
+failing.clear()
+results = run(JudgeCache())
+assert judged == ["flaky question"] and len(engines) == 1
+assert results["items"]["evaluated"] == 4 and results["items"]["failed"] == []
+assert checkpointed() == [0, 1, 2, 3]
+assert results["scores"]["context_recall"] == 0.75
+
+# With every item checkpointed, no engine is built and nothing is judged
+results = run(JudgeCache())
+assert judged == [] and engines == [] and results["items"]["evaluated"] == 4
+
+# Without resume every item is answered again, and the judge cache answers
+# for the judge
+results = run(JudgeCache(), resume=False)
+assert judged == [] and len(engines) == 1
+assert results["timings"]["judge_cache_hits"] == 4 and results["timings"]["judge_ms"] == {}
+print(f"Rerun without resume: {results['items']['evaluated']} items, {results['timings']['judge_cache_hits']} judge cache hits")
+
+print("All evaluation checks passed")
@@ -0,0 +1,122 @@
+import os
+import tempfile
+import numpy as np
+from src.flat_store import FlatCollection, FlatVectorStore, get_flat_collection
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+path = os.path.join(tempfile.mkdtemp(), "flat")
+rng = np.random.default_rng(0)
+vectors = rng.normal(size=(3000, 32)).astype(np.float32)
+ids = [f"doc-{i}" for i in range(len(vectors))]
+
+collection = FlatCollection(path)
+for start in range(0, len(vectors), 500):
+    collection.upsert(ids[start:start + 500], vectors[start:start + 500], [f"text {i}" for i in range(start, start + 500)])
+
+# Exact top-k matches brute force
+queries = rng.normal(size=(5, 32)).astype(np.float32)
+result = collection.query(queries, n_results=10, include=["documents", "distances", "embeddings"])
+for row, query in enumerate(queries):
+    expected = np.argsort(((vectors - query) ** 2).sum(axis=1))[:10]
+    assert result["ids"][row] == [ids[i] for i in expected]
+    assert np.allclose(result["embeddings"][row], vectors[expected])
+print("Top-k matches brute force")
+
+# Upsert retires the old row, delete tombstones, both survive a reload
+collection.upsert(["doc-0"], queries[:1], ["moved"])
+collection.delete(ids=["doc-1"])
+reloaded = FlatCollection(path)
+assert reloaded.count() == len(vectors) - 1
+assert reloaded.query(queries[:1], n_results=1)["ids"][0] == ["doc-0"]
+assert reloaded.get(ids=["doc-1"])["ids"] == []
+print(f"Reloaded {reloaded.count()} live rows")
+
+# A batch whose sidecar lines never landed is dropped on load
+with open(os.path.join(path, "vectors.f32"), "ab") as f:
+    f.write(vectors[:3].tobytes())
+recovered = FlatCollection(path)
+assert recovered.count() == reloaded.count()
+assert os.path.getsize(os.path.join(path, "vectors.f32")) == recovered._rows * 32 * 4
+print("Torn write recovered")
+
+# A torn sidecar line is cut off on load, so the next upsert is readable
+torn_path = os.path.join(tempfile.mkdtemp(), "flat")
+FlatCollection(torn_path).upsert(["a", "b"], vectors[:2], ["alpha", "beta"])
+with open(os.path.join(torn_path, "meta.jsonl"), "a") as f:
+    f.write('{"id": "c", "docum')
+torn = FlatCollection(torn_path)
+assert torn.count() == 2
+torn.upsert(["d"], vectors[3:4], ["delta"])
+torn = FlatCollection(torn_path)
+assert torn.ids == ["a", "b", "d"] and torn.get(ids=["d"])["documents"] == ["delta"]
+print("Torn sidecar line recovered")
+
+# The LangChain wrapper supports the MMR retriever
+store = FlatVectorStore(get_flat_collection(os.path.join(tempfile.mkdtemp(), "flat")), DeterministicFakeEmbedding(size=16))
+store.add_texts(["alpha", "beta", "gamma", "delta"], ids=["a", "b", "c", "d"])
+docs = store.as_retriever(search_type="mmr", search_kwargs={"k": 2, "fetch_k": 4}).invoke("alpha")
+assert docs[0].page_content == "alpha" and len(docs) == 2
+print("MMR retriever ok")
+
+# Quantized first passes are rescored exactly. int8 recovers the exact top-k;
+# 32 sign bits are too coarse for that on random data but must still find
+# the stored row each query was derived from
+near = vectors[[10, 20, 30, 40, 50]] + 0.1 * rng.normal(size=(5, 32)).astype(np.float32)
+for i, mode in enumerate(["int8", "binary"]):
+    exact = FlatCollection(path).query(near, n_results=5, include=["distances"])
+    quantized = FlatCollection(path, quantization=mode, oversample=20)
+    hits = quantized.query(near, n_results=5, include=["distances"])
+    overlap = np.mean([len(set(a) & set(b)) / 5 for a, b in zip(hits["ids"], exact["ids"])])
+    print(f"{mode} recall@5 vs exact: {overlap:.2f}, first pass {quantized.memory_bytes()[mode]} bytes vs {quantized.memory_bytes()['float32']}")
+    assert overlap == 1.0 or mode == "binary"
+    assert hits["ids"][0][0] == "doc-10" and np.isclose(hits["distances"][0][0], exact["distances"][0][0], rtol=1e-4)
+
+    # Rows appended after the codes were built are searchable too
+    quantized.upsert([f"new-{mode}"], queries[2 + i:3 + i])
+    assert quantized.query(queries[2 + i:3 + i], n_results=1)["ids"][0] == [f"new-{mode}"]
+
+# Metadata filters select the same rows in get, query and the LangChain wrapper
+path = os.path.join(tempfile.mkdtemp(), "flat")
+collection = FlatCollection(path)
+metadatas = [{"file_name": f"file{i % 3}.txt"} for i in range(300)]
+collection.upsert(ids[:300], vectors[:300], [f"text {i}" for i in range(300)], metadatas)
+where = {"file_name": "file1.txt"}
+matching = set(collection.get(where=where, include=[])["ids"])
+hits = collection.query(queries, n_results=5, where=where, include=["metadatas"])
+assert all(set(row) <= matching and len(row) == 5 for row in hits["ids"])
+assert hits["ids"][0][0] == [ids[i] for i in np.argsort(((vectors[:300] - queries[0]) ** 2).sum(axis=1)) if i % 3 == 1][0]
+store = FlatVectorStore(collection, DeterministicFakeEmbedding(size=32))
+assert all(doc.metadata == where for doc in store.similarity_search("text", k=4, filter=where))
+for call in (lambda: collection.get(where={"$or": [where]}), lambda: collection.query(queries, where={"file_name": {"$in": ["a"]}})):
+    try:
+        call()
+        raise AssertionError("expected an unsupported filter error")
+    except ValueError:
+        pass
+print("Filters ok")
+
+# Once half the rows are retired, the files are rewritten with the live ones
+collection.build_ivf(nlist=4)
+collection.upsert(ids[:100], vectors[:100] + 1.0, metadatas=metadatas[:100])
+collection.delete(ids=ids[100:200])
+assert collection._rows == 200 and len(collection.ids) == 200
+assert os.path.getsize(os.path.join(path, "vectors.f32")) == 200 * 32 * 4
+expected = collection.query(queries, n_results=5, where=where)
+reloaded = FlatCollection(path)
+assert reloaded._rows == reloaded.count() == 200
+assert reloaded.query(queries, n_results=5, where=where) == expected
+with open(os.path.join(path, "meta.jsonl")) as f:
+    assert sum(1 for _ in f) == 200
+print("Compaction ok")
+
+# A compaction committed but interrupted before every file was swapped in is finished on load
+kept = collection.ids[150:]
+collection._alive[:150] = False
+collection.row_of = {doc_id: row for doc_id, row in collection.row_of.items() if row >= 150}
+collection._swap_compacted = lambda: None
+collection._compact()
+os.replace(os.path.join(path, "vectors.f32.new"), os.path.join(path, "vectors.f32"))
+recovered = FlatCollection(path)
+assert recovered.ids == kept and recovered.count() == 50 and not os.path.exists(os.path.join(path, "compact.json"))
+assert np.allclose(recovered.get(ids=kept[:1], include=["embeddings"])["embeddings"], collection.get(ids=kept[:1], include=["embeddings"])["embeddings"])
+print("Interrupted compaction recovered")
@@ -0,0 +1,53 @@
+import os
+import tempfile
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import FakeListChatModel
+from src import vector_store as vs
+from src.hybrid_retriever import FusionRetriever, reciprocal_rank_fusion
+from src.rag_chain import RAGEngine
+
+# RRF rewards agreement: b is second in both rankings and beats a, which
+# only the heavier leg ranks first
+fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "b"]], (0.7, 0.3))
+assert sorted(fused, key=fused.get, reverse=True) == ["b", "c", "a"]
+assert abs(fused["b"] - (0.7 + 0.3) / 62) < 1e-12
+
+os.chdir(tempfile.mkdtemp())
+embedding_model = DeterministicFakeEmbedding(size=32)
+texts = [
+    "The transformer architecture was introduced in 2017",
+    "BERT uses only the encoder portion of the transformer",
+    "GPT uses only the decoder and predicts the next token",
+]
+store = vs.add_documents([Document(page_content=text, metadata={"file_name": "transformers.txt"}) for text in texts], embedding_model)
+retriever = FusionRetriever(vector_store=store, index=vs.get_bm25(store), k=3, fetch_k=3, lambda_mult=1.0)
+
+# With fetch_k covering the store, the BM25 hit is also a semantic hit; it is
+# returned once, with both legs' contributions in its score
+results, timings = retriever.search_with_timings("encoder")
+ids = [doc.id for doc, _ in results]
+print(f"Fused: {[(doc.page_content[:20], round(score, 4)) for doc, score in results]}")
+assert len(ids) == len(set(ids)) == 3
+encoder = [score for doc, score in results if "encoder" in doc.page_content][0]
+assert encoder > 0.7 / 61 and results[0][1] == encoder
+assert set(timings) == {"semantic_ms", "bm25_ms", "fusion_ms", "hybrid_ms"}
+assert timings["hybrid_ms"] >= max(timings["semantic_ms"], timings["bm25_ms"])
+
+# No BM25 hits: the semantic ranking comes through on its own
+results, timings = retriever.search_with_timings("zebra")
+assert len(results) == 3
+assert [round(score, 6) for _, score in results] == [round(0.7 / (61 + rank), 6) for rank in range(3)]
+
+# The leg timings of each call reach that call's RAGResult
+engine = RAGEngine(embedding_model=embedding_model, k=2, llm=FakeListChatModel(responses=["ok"]), hybrid=True, vector_store=store)
+result = engine.query("encoder")
+streamed = engine.stream("decoder")
+list(streamed)
+for timings in (result.timings, streamed.result.timings):
+    assert {"semantic_ms", "bm25_ms", "fusion_ms", "retrieval_ms", "total_ms"} <= set(timings)
+    assert timings["hybrid_ms"] <= timings["retrieval_ms"]
+print(f"Timings: { {name: round(ms, 2) for name, ms in result.timings.items()} }")
+
+vs.clear_vector_store()
+print("All hybrid retriever checks passed")
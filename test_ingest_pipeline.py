@@ -0,0 +1,106 @@
+import os
+import tempfile
+import time
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from src import vector_store as vs
+from src.ingest_pipeline import ingest
+from src.manifest import chunk_ids, file_hash
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """Counts embedded texts; optionally slow, or failing on a marker word."""
+
+    texts: int = 0
+    delay: float = 0.0
+    fail_on: str = None
+
+    def embed_documents(self, texts):
+        if self.fail_on and any(self.fail_on in text for text in texts):
+            raise RuntimeError("embedding failed")
+        time.sleep(self.delay)
+        self.texts += len(texts)
+        return super().embed_documents(texts)
+
+
+def write(path, paragraphs):
+    with open(path, "w") as f:
+        f.write("\n\n".join(f"Paragraph {i} about topic {i % 7}. " * 8 for i in range(paragraphs)))
+    return {"type": "txt", "path": path}
+
+def stored_ids(store, name):
+    return set(store.get(where={"file_name": name}, include=[])["ids"])
+
+os.chdir(tempfile.mkdtemp())
+os.makedirs("docs")
+sources = [write(f"docs/file{i}.txt", 40) for i in range(4)]
+model = CountingEmbeddings(size=16)
+
+report = ingest(sources, model, chunk_size=300, chunk_overlap=30, batch_size=16, backend="flat")
+store = vs.get_vector_store(model, backend="flat")
+first_count = len(stored_ids(store, "file0.txt"))
+assert report["write"]["items"] == model.texts == 4 * first_count > 0
+assert report["load"]["items"] == 4 and report["chunk"]["items"] == report["write"]["items"]
+print(f"Ingested {report['write']['items']} chunks from {len(sources)} files")
+
+# Unchanged files are skipped before loading
+model.texts = 0
+report = ingest(sources, model, chunk_size=300, chunk_overlap=30, backend="flat")
+assert report["load"]["items"] == 0 and model.texts == 0
+
+# A file whose bytes change but whose chunks do not is hashed, not embedded,
+# and its new file hash is recorded
+with open(sources[1]["path"], "a") as f:
+    f.write("\n\n   \n")
+report = ingest(sources, model, chunk_size=300, chunk_overlap=30, backend="flat")
+assert report["load"]["items"] == 1 and model.texts == 0
+assert vs.get_manifest("flat").is_file_unchanged("file1.txt", file_hash(sources[1]["path"]))
+
+# A source that shrinks has its trailing chunks deleted
+write(sources[0]["path"], 5)
+report = ingest(sources, model, chunk_size=300, chunk_overlap=30, backend="flat")
+store = vs.get_vector_store(model, backend="flat")
+shrunk = len(stored_ids(store, "file0.txt"))
+assert 0 < shrunk < first_count and model.texts == shrunk
+assert stored_ids(store, "file0.txt") == set(chunk_ids("file0.txt", shrunk))
+print(f"file0.txt shrank from {first_count} to {shrunk} chunks")
+
+# An error in a stage reaches the caller, and the failed source is not recorded
+failing = write("docs/failing.txt", 3)
+with open(failing["path"], "a") as f:
+    f.write("\n\nkaboom")
+try:
+    ingest(sources + [failing], CountingEmbeddings(size=16, fail_on="kaboom"), backend="flat")
+    raise AssertionError("expected the embedding error")
+except RuntimeError as error:
+    assert "embedding failed" in str(error)
+assert vs.get_manifest("flat").get("failing.txt") is None
+
+# With a slow embedder and small queues, the stages before it wait on back-pressure
+sources = [write(f"docs/more{i}.txt", 40) for i in range(3)]
+slow = CountingEmbeddings(size=16, delay=0.05)
+report = ingest(sources, slow, chunk_size=300, chunk_overlap=30, batch_size=4, queue_size=1, backend="flat")
+print({name: round(report[name]["blocked_seconds"], 3) for name in ("load", "chunk", "embed")})
+assert report["chunk"]["blocked_seconds"] > 0.1
+assert report["embed"]["busy_seconds"] >= 0.05 * report["embed"]["items"] / 4
+assert report["embed"]["items_per_second"] > 0 and report["embed"]["items"] == slow.texts == report["write"]["items"]
+
+# With a tokenizer, chunk_size counts tokens (here one per word) instead of characters
+source = write("docs/tokens.txt", 10)
+ingest([source], model, chunk_size=20, chunk_overlap=0, tokenizer=lambda word: 1, backend="flat", ahead=1)
+texts = vs.get_vector_store(model, backend="flat").get(where={"file_name": "tokens.txt"})["documents"]
+assert len(texts) > 1 and max(len(text.split()) for text in texts) <= 20
+
+# An upload is stored under its own name, not its temporary path, so the same
+# file uploaded again is skipped instead of stored a second time
+model.texts = 0
+for upload in ("docs/tmp1.txt", "docs/tmp2.txt"):
+    source = write(upload, 10)
+    source["name"] = "notes.txt"
+    ingest([source], model, chunk_size=300, chunk_overlap=30, backend="flat")
+store = vs.get_vector_store(model, backend="flat")
+assert model.texts == len(stored_ids(store, "notes.txt")) > 0
+assert not stored_ids(store, "tmp1.txt") and not stored_ids(store, "tmp2.txt")
+assert vs.get_manifest("flat").get("notes.txt") is not None
+
+vs.clear_vector_store()
+print("All ingest pipeline checks passed")
@@ -0,0 +1,50 @@
+import os
+import tempfile
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from src import vector_store as vs
+from src.manifest import chunk_ids
+
+embedding_model = DeterministicFakeEmbedding(size=16)
+
+def chunks(source, texts):
+    return [Document(page_content=text, metadata={"file_name": source}) for text in texts]
+
+def stored_ids(store, source):
+    return set(store.get(where={"file_name": source}, include=[])["ids"])
+
+os.chdir(tempfile.mkdtemp())
+for backend in vs.BACKENDS:
+    vs.clear_vector_store()
+
+    # First ingest records every source
+    store = vs.add_documents(chunks("a.txt", ["a one", "a two", "a three"]) + chunks("b.txt", ["b one"]), embedding_model, backend=backend)
+    manifest = vs.get_manifest(backend)
+    assert manifest.get("a.txt")["chunk_ids"] == chunk_ids("a.txt", 3)
+    assert stored_ids(store, "a.txt") == set(chunk_ids("a.txt", 3))
+
+    # An unchanged source is skipped: nothing is written and the corpus is the same
+    version = vs.corpus_version()
+    vs.add_documents(chunks("a.txt", ["a one", "a two", "a three"]), embedding_model, backend=backend)
+    assert vs.corpus_version() == version
+
+    # A changed source that shrinks loses its trailing chunks and keeps no old text
+    store = vs.add_documents(chunks("a.txt", ["a new one", "a new two"]), embedding_model, backend=backend)
+    assert stored_ids(store, "a.txt") == set(chunk_ids("a.txt", 2))
+    texts = store.get(ids=chunk_ids("a.txt", 2), include=["documents"])["documents"]
+    assert sorted(texts) == ["a new one", "a new two"]
+    assert vs.get_manifest(backend).get("a.txt")["chunk_ids"] == chunk_ids("a.txt", 2)
+    assert stored_ids(store, "b.txt") == set(chunk_ids("b.txt", 1))
+    assert vs.corpus_version() > version
+
+    # A store written before the manifest existed has random ids; its chunks
+    # are found by metadata and replaced rather than duplicated
+    store.add_documents(chunks("legacy.txt", ["old one", "old two", "old three"]), ids=["x1", "x2", "x3"])
+    assert vs.get_manifest(backend).get("legacy.txt") is None
+    store = vs.add_documents(chunks("legacy.txt", ["new one"]), embedding_model, backend=backend)
+    assert stored_ids(store, "legacy.txt") == set(chunk_ids("legacy.txt", 1))
+    assert vs.get_manifest(backend).get("legacy.txt")["chunk_ids"] == chunk_ids("legacy.txt", 1)
+    print(f"{backend}: skip, replace, shrink and migration ok")
+
+vs.clear_vector_store()
+print("All manifest checks passed")
@@ -0,0 +1,38 @@
+import os
+import tempfile
+import numpy as np
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.documents import Document
+from src import vector_store as vs
+from src.mmr import mmr_by_vector
+
+# Same picks, in the same order, as LangChain's reference implementation
+rng = np.random.default_rng(0)
+for trial in range(200):
+    fetch_k, dim = int(rng.integers(1, 60)), int(rng.integers(2, 64))
+    k = int(rng.integers(1, 12))
+    lambda_mult = float(rng.choice([0.0, 0.3, 0.5, 0.7, 1.0]))
+    query = rng.normal(size=dim).astype(np.float32)
+    embeddings = rng.normal(size=(fetch_k, dim)).astype(np.float32)
+    expected = maximal_marginal_relevance(query, embeddings, k=k, lambda_mult=lambda_mult)
+    selected, similarities = mmr_by_vector(query, embeddings, k, lambda_mult)
+    assert selected == expected, (trial, selected, expected)
+    assert len(similarities) == fetch_k
+
+print("mmr_by_vector matches the reference selection")
+
+# Retrievers on both backends go through the same selection
+os.chdir(tempfile.mkdtemp())
+chunks = [Document(page_content=f"chunk {i} about topic {i % 5}", metadata={"source": f"doc{i}.txt", "chunk_id": i}) for i in range(40)]
+for backend in vs.BACKENDS:
+    store = vs.add_documents(chunks, DeterministicFakeEmbedding(size=32), backend=backend)
+    retriever = vs.get_retriever(k=4, vector_store=store)
+    docs = retriever.invoke("chunk 3 about topic 3")
+    expected = [doc.page_content for doc, _ in vs.mmr_search_with_scores("chunk 3 about topic 3", k=4, vector_store=store)]
+    assert [doc.page_content for doc in docs] == expected
+    assert len(docs) == 4 and len({doc.page_content for doc in docs}) == 4
+    print(f"{backend} retriever:", [doc.metadata["chunk_id"] for doc in docs])
+
+vs.clear_vector_store()
+print("All MMR checks passed")
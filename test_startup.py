@@ -0,0 +1,48 @@
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from src.embeddings import LazyEmbeddings
+from src.embedding_cache import CachedEmbeddings
+from src.startup import warm_up, lazy_model
+
+# Importing the engine must not pull in the heavy dependencies
+script = "import sys, src.rag_chain, src.ingest_pipeline; print(','.join(m for m in ('chromadb', 'langchain_groq', 'langchain_community', 'torch') if m in sys.modules))"
+loaded = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout.strip()
+print(f"Heavy modules after import: {loaded or 'none'}")
+assert loaded == ""
+
+# The model is built once, on first use, even with concurrent first callers
+builds = []
+def factory():
+    builds.append(threading.current_thread().name)
+    time.sleep(0.2)
+    return DeterministicFakeEmbedding(size=16)
+
+model = LazyEmbeddings(factory)
+assert not model.loaded
+threads = [threading.Thread(target=model.embed_query, args=("hello",)) for _ in range(4)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+assert len(builds) == 1 and model.loaded
+
+# Cache hits do not need the model at all
+cached = CachedEmbeddings(LazyEmbeddings(factory), model_name="fake", cache_path=tempfile.mkdtemp())
+vector = cached.embed_query("hello")
+cached.embedding_model._model = None
+assert cached.embed_query("hello") == vector and not cached.embedding_model.loaded
+
+# warm_up loads the model on a background thread, through the cache wrapper
+builds.clear()
+cached = CachedEmbeddings(LazyEmbeddings(factory), model_name="fake", cache_path=tempfile.mkdtemp())
+assert lazy_model(cached) is cached.embedding_model
+thread = warm_up(cached, modules=["json"])
+assert thread.daemon
+thread.join()
+assert builds == ["rag-warm-up"] and cached.embedding_model.loaded
+
+print("All startup checks passed")
@@ -0,0 +1,33 @@
+import os
+import tempfile
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import FakeListChatModel
+from src.rag_chain import RAGEngine
+from src.vector_store import add_documents
+
+# Everything runs offline: fake embeddings, a fake streaming chat model and a
+# throwaway Chroma store in a temp directory
+os.chdir(tempfile.mkdtemp())
+embedding_model = DeterministicFakeEmbedding(size=32)
+add_documents([
+    Document(page_content="The transformer architecture was introduced in 2017", metadata={"file_name": "transformers.txt"}),
+    Document(page_content="BERT uses only the encoder portion of the transformer", metadata={"file_name": "transformers.txt"}),
+], embedding_model)
+
+answer = "The transformer was introduced in 2017 (transformers.txt)."
+llm = FakeListChatModel(responses=[answer], sleep=0.01)
+engine = RAGEngine(embedding_model=embedding_model, k=2, llm=llm)
+
+stream = engine.stream("When was the transformer introduced?")
+print(f"Sources before generation: {stream.sources}")
+assert stream.sources == ["transformers.txt"]
+
+tokens = list(stream)
+print(f"Tokens received: {len(tokens)}")
+print(f"Timings: {stream.result.timings}")
+
+assert len(tokens) > 1
+assert "".join(tokens) == answer
+assert stream.result.answer == answer
+assert stream.result.timings["time_to_first_token_ms"] < stream.result.timings["total_ms"]
@@ -0,0 +1,74 @@
+import json
+import os
+import tempfile
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from evaluation import evaluate
+from evaluation.bench_utils import HashingEmbeddings
+from src import vector_store as vs
+from src.rag_chain import RAGEngine
+
+# Offline: hashing embeddings, stub answer and judge LLMs, the flat backend
+# and every file the sweep writes in a throwaway directory
+os.chdir(tempfile.mkdtemp())
+os.makedirs("evaluation")
+evaluate.CHECKPOINT_DIR = os.path.join(os.getcwd(), "checkpoints")
+evaluate.JUDGE_CACHE_PATH = os.path.join(os.getcwd(), "judge_cache.jsonl")
+
+with open("transformers.txt", "w") as f:
+    f.write("\n\n".join(f"Paragraph {i}: the transformer was introduced in 2017 and uses attention {i % 5}. " * 4 for i in range(30)))
+evaluate.EVALUATION_SOURCES = [{"type": "txt", "path": "transformers.txt"}]
+with open("test_set.json", "w") as f:
+    json.dump([{"question": f"When was the transformer introduced? ({i})", "ground_truth": "2017"} for i in range(3)], f)
+
+SCORES = {"faithfulness": 1.0, "answer_relevancy": 1.0, "context_recall": 1.0, "completeness": 1.0}
+evaluate.load_embedding_model = lambda: HashingEmbeddings(size=64)
+evaluate.load_judge_llm = lambda: RunnableLambda(lambda prompt: AIMessage(content=json.dumps(SCORES)))
+
+failing_k = set()
+
+def engine(**kwargs):
+    if kwargs["k"] in failing_k:
+        raise RuntimeError("engine failed")
+    return RAGEngine(llm=RunnableLambda(lambda prompt: "In 2017."), **kwargs)
+evaluate.RAGEngine = engine
+
+builds = []
+build_sweep_index = evaluate.build_sweep_index
+
+def counting_build(documents, chunk_size, chunk_overlap, embedding_model, backend = None):
+    builds.append((chunk_size, chunk_overlap))
+    return build_sweep_index(documents, chunk_size, chunk_overlap, embedding_model, backend)
+evaluate.build_sweep_index = counting_build
+
+def sweep_collections():
+    names = os.listdir(vs.FLAT_PATH) if os.path.isdir(vs.FLAT_PATH) else []
+    bm25 = os.path.join(vs.FLAT_PATH, "bm25")
+    names += os.listdir(bm25) if os.path.isdir(bm25) else []
+    return [name for name in names if name.startswith("sweep_")]
+
+grid = {"k": [1, 2, 3], "chunk_size": [200, 400], "chunk_overlap": [20]}
+
+# One index per (chunk_size, chunk_overlap), shared by every k, and gone
+# once the sweep is done
+summary = evaluate.run_sweep(grid, test_set_path="test_set.json", tag="sweep", max_parallel_configs=3, requests_per_minute=0, backend="flat")
+assert sorted(builds) == [(200, 20), (400, 20)]
+assert summary["timings"]["indexes_built"] == 2 and len(summary["configs"]) == 6
+assert all(result["items"]["evaluated"] == 3 and not result["items"]["failed"] for result in summary["configs"])
+assert sweep_collections() == []
+with open("evaluation/results_sweep.json") as f:
+    assert len(json.load(f)["configs"]) == 6
+print(f"Swept {len(summary['configs'])} configs over {len(builds)} indexes")
+
+# A config that fails still has the sweep collections deleted
+builds.clear()
+failing_k.add(2)
+try:
+    evaluate.run_sweep(grid, test_set_path="test_set.json", tag="failing", max_parallel_configs=1, requests_per_minute=0, backend="flat")
+    raise AssertionError("expected the engine error")
+except RuntimeError as error:
+    assert "engine failed" in str(error)
+assert builds and sweep_collections() == []
+print("Sweep collections deleted after a failed config")
+
+print("All sweep checks passed")
@@ -0,0 +1,65 @@
+import json
+import os
+import tempfile
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import FakeListChatModel
+from src.rag_chain import RAGEngine
+from src.vector_store import add_documents
+from src import tracing
+
+# Offline: fake embeddings and chat model, throwaway Chroma store
+os.chdir(tempfile.mkdtemp())
+embedding_model = DeterministicFakeEmbedding(size=32)
+add_documents([
+    Document(page_content="The transformer architecture was introduced in 2017", metadata={"file_name": "transformers.txt"}),
+    Document(page_content="BERT uses only the encoder portion of the transformer", metadata={"file_name": "transformers.txt"}),
+], embedding_model)
+
+histogram = tracing.add_sink(tracing.HistogramSink())
+jsonl = tracing.add_sink(tracing.JsonLinesSink("traces.jsonl"))
+prometheus = tracing.add_sink(tracing.PrometheusSink())
+
+engine = RAGEngine(embedding_model=embedding_model, k=2, llm=FakeListChatModel(responses=["2017 (transformers.txt)."]))
+with tracing.trace() as trace:
+    engine.query("When was the transformer introduced?")
+    list(engine.stream("When was the transformer introduced?"))
+
+stages = [record["name"] for record in trace.spans]
+print(f"Stages: {stages}")
+for stage in ["retrieval", "query_embedding", "mmr_search", "format_docs", "llm_call"]:
+    assert stages.count(stage) == 2, stage
+
+context = [record for record in trace.spans if record["name"] == "format_docs"][0]
+assert context["docs"] == 2 and context["context_chars"] > 0
+
+summary = histogram.summary()
+print(f"Histogram: { {name: round(stats['p50_ms'], 2) for name, stats in summary.items()} }")
+assert summary["llm_call"]["count"] == 2
+
+with open("traces.jsonl") as f:
+    assert len([json.loads(line) for line in f]) == len(trace.spans)
+
+metrics = prometheus.render()
+assert 'rag_stage_duration_seconds_count{stage="mmr_search"} 2' in metrics
+assert 'rag_context_chars_total{stage="format_docs"}' in metrics
+
+# Hybrid legs run on pool threads and must still land in the caller's trace
+hybrid = RAGEngine(embedding_model=embedding_model, k=2, llm=FakeListChatModel(responses=["ok"]), hybrid=True)
+with tracing.trace() as trace:
+    hybrid.query("encoder")
+stages = {record["name"] for record in trace.spans}
+print(f"Hybrid stages: {sorted(stages)}")
+assert {"semantic_search", "bm25_search", "mmr_select"} <= stages
+
+# A Prometheus sink with a path writes the textfile as spans come in
+textfile = tracing.add_sink(tracing.sink_from_spec("prometheus:metrics.prom"))
+textfile.flush_seconds = 0
+engine.query("When was the transformer introduced?")
+with open("metrics.prom") as f:
+    assert 'rag_stage_duration_seconds_count{stage="llm_call"} 1' in f.read()
+
+tracing.clear_sinks()
+with tracing.trace() as trace:
+    pass
+assert not tracing.enabled()